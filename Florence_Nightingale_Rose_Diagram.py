@@ -3,65 +3,188 @@ Florence Nightingale's Rose Diagram - Display and print pixel coordinates when h
 Enhanced with coordinate groups, history, file persistence, and drag mode.
 """
 
+import time
+
+# --startup-profile times startup from here, so the imports below count too
+STARTUP_START = time.perf_counter()
+
 import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
-from PIL import Image, ImageTk
-import json
+from tkinter import filedialog, messagebox, simpledialog, ttk
+from tkinter import font as tkfont
 import os
-from datetime import datetime
+import argparse
+import itertools
+import math
+import queue
+import zlib
+from collections import Counter, OrderedDict
+
+from calibration import KINDS, MIN_REFERENCES, Calibration, load_calibrations, save_calibrations
+from export_delta import ExportManifest, write_delta, write_export
+from group_storage import ColumnarGroups, JSONArrayReader, JournalGroupStore, group_series, is_columnar, numpy
+from nightingale_core import (
+    DEFAULT_IMAGE_BUDGET, TILE_SIZE, GroupDraft, GroupHistory, HistoryLoader, ImageLoader, ImageSession,
+    TileRenderWorker, Viewport, image_key
+)
+from profiling import Profiler, profiled
+
+# NumPy, Pillow (PIL.Image, ImageDraw, ImageTk) and plot_rose are imported
+# where they are first needed, once the window is up.
+
+# Startup is reported against this budget for the window to appear; the history
+# loads on a worker thread, so its size does not count towards it.
+STARTUP_TARGET_MS = 200
+
+# The tile cache keeps a couple of viewports' worth so panning back and forth
+# does not re-render.
+MIN_TILE_CACHE = 32
+
+# Tiles first appear as a cheap preview; the LANCZOS result from the render
+# worker is swapped in when it arrives, polled at roughly display frame rate.
+PREVIEW_RESAMPLE = "BILINEAR"  # Name of a PIL.Image.Resampling filter
+RENDER_POLL_MS = 16
+
+# Pointer motion and drags are applied at most once per display frame, using
+# only the latest pointer position; events in between are counted as dropped.
+MOTION_FRAME_MS = 16
+
+# Event loop lag is measured by how late a timer this often fires; the debug
+# panel refreshes at DEBUG_REFRESH_MS while it is open.
+LAG_PROBE_MS = 100
+DEBUG_REFRESH_MS = 500
+
+# Dots are drawn as small shared images rather than ovals: an image item has a
+# single anchor point, so canvas.scale moves it on zoom without resizing it.
+DOT_RADIUS = 4
 
+# "Show all groups" mode: saved points are indexed in original-image pixels
+# and only the ones inside the view are drawn, at most one per small screen
+# cell so that a zoomed-out view of a huge history stays cheap.
+SAVED_DOT_RADIUS = 3
+HOVER_DISTANCE = 12  # Screen pixels
+
+# Dot color for each point of a group; other series get a color picked by name
+GROUP_COLORS = {"origin": "green", "red": "red", "blue": "blue", "black": "black"}
+EXTRA_COLORS = ("orange", "purple", "brown", "magenta", "cyan", "gold")
+
+# Reference points of a pixel -> data calibration
+CALIBRATION_COLOR = "yellow"
+
+# The history list is virtual: the listbox only ever holds the rows that fit
+# on screen, fetched from the store as the list scrolls.
+HISTORY_WHEEL_ROWS = 3
+
+# Edits are written to the history at most once per SAVE_DELAY_MS, so a burst
+# of saves or deletes costs one disk write; closing the window writes the rest.
+SAVE_DELAY_MS = 500
+
+# The rose preview pane next to the canvas; its diagrams stack vertically
+ROSE_PREVIEW_SIZE = (300, 600)
+
+# Imports are streamed from the file and committed this many groups at a time,
+# one batch per event loop turn so the progress bar keeps moving.
+IMPORT_BATCH_SIZE = 2000
 
 class ImageXYReader:
-    def __init__(self, root):
+    def __init__(self, root, history_file="coordinate_groups_history.json", image_budget=DEFAULT_IMAGE_BUDGET,
+                 startup_profile=False):
         self.root = root
         self.root.title("Florence Nightingale's Rose Diagram")
         self.root.geometry("1200x700")
         
+        # Latency of the hot paths below, see @profiled, and startup milestones
+        self.profiler = Profiler(start=STARTUP_START)
+        self.startup_profile = startup_profile
+        self.lag_expected = None
+        self.debug_after_id = None
+        
         # Initialize all coordinate variables FIRST (before creating UI)
-        self.original_image = None
+        # image and pyramid are those of the current image in the session
+        self.session = ImageSession(image_budget)
         self.image = None
-        self.photo_image = None
-        self.canvas_image = None
-        self.scale_x = 1.0
-        self.scale_y = 1.0
-        self.zoom_factor = 1.0
+        self.viewport = Viewport()  # Zoom, pan and the canvas <-> original transform
+        
+        # Image pyramid and tiled rendering of the visible area
+        self.pyramid = None
+        self.tile_cache = OrderedDict()  # (view_scale, tile_x, tile_y) -> PhotoImage
+        self.tile_items = {}  # (view_scale, tile_x, tile_y) -> (canvas item, PhotoImage)
+        
+        # Coalesced rendering: previews now, full-quality tiles from a worker
+        self.render_worker = TileRenderWorker()
+        self.render_generation = 0
+        self.render_after_id = None
+        self.poll_after_id = None
+        self.preview_keys = set()  # Visible tiles still showing a preview
+        
+        # Images open on a worker thread; the current image stays usable meanwhile
+        self.image_loader = ImageLoader()
+        self.load_after_id = None
+        self.load_path = None
+        self.pending_group = None  # Saved group to load once its image has loaded again
         
         # Dot tracking - INITIALIZE BEFORE UI CREATION
-        self.origin_dot = None
-        self.red_dot = None
-        self.blue_dot = None
-        self.black_dot = None
-        self.origin_coords = None
-        self.red_dot_coords = None
-        self.blue_dot_coords = None
-        self.black_dot_coords = None
+        # Every dot on the canvas carries the "view" and "overlay" tags, the dots
+        # of the group being edited also carry "active" and "dot:<color>".
+        self.dot_images = {}  # (color, radius) -> PhotoImage shared by those dots
+        self.overlay_view = None  # (scale, offset_x, offset_y) the dots are drawn for
+        self.draft = GroupDraft()  # Points of the group being edited
         self.mouse_x = 0
         self.mouse_y = 0
         
         # Track if mouse is inside image bounds
         self.mouse_inside_image = False
         
+        # Coalesced pointer handling
+        self.motion_after_id = None
+        self.drag_after_id = None
+        self.drag_dx = 0  # Drag distance not yet applied
+        self.drag_dy = 0
+        self.event_counts = {"motion": 0, "motion_dropped": 0, "drag": 0, "drag_dropped": 0}
+        
         # Drag mode variables
         self.drag_mode = False
         self.drag_start_x = 0
         self.drag_start_y = 0
-        self.image_offset_x = 0
-        self.image_offset_y = 0
-        
-        # Data structures for groups and history
-        self.groups = []  # List of group dictionaries
-        self.current_group = {
-            "name": "",
-            "origin": None,
-            "red": None,
-            "blue": None,
-            "black": None,
-            "timestamp": None
-        }
-        self.history_file = "coordinate_groups_history.json"
         
-        # Load history on startup
-        self.load_history()
+        # Saved groups, with their search and spatial indexes. The history loads
+        # on a worker thread; until it is handed over an empty one stands in,
+        # which nothing is saved to. That one needs NumPy, so it is only made
+        # once the window is up.
+        self.history_file = history_file
+        self.history = None
+        self.history_loader = HistoryLoader()
+        self.history_loaded = False
+        self.history_top = 0  # Position of the first visible row, newest first
+        self.history_visible_rows = 20
+        self.history_rows = []  # Group id of each row in the listbox
+        self.history_selected_id = None
+        self.history_filter = None  # SearchResults while searching
+        self.history_filter_version = 0
+        self.save_after_id = None  # Pending commit of history edits
+        
+        # Pixel -> data calibrations per image key, saved next to the history
+        self.calibration_file = os.path.splitext(history_file)[0] + ".calibration.json"
+        self.calibrations = {}  # image key -> Calibration
+        self.calibration_refs = {}  # image key -> [((x, y), (u, v))], fitted or not yet
+        self.calibrate_mode = False
+        self.calibration_kind_var = tk.StringVar(value=KINDS[0])
+        
+        # What was last exported from this history, so that later exports can
+        # send only the changes; read on first use
+        self.export_manifest_file = os.path.splitext(history_file)[0] + ".exported.jsonl"
+        self.export_manifest = None
+        
+        # "Show all groups" mode draws saved points from history.spatial_index
+        self.show_all_groups = False
+        self.saved_dot_items = {}  # index key -> canvas item
+        
+        # Streaming import in progress, if any
+        self.import_job = None
+        
+        # Live rose preview of the current image's groups, only kept while shown
+        self.rose_renderer = None
+        self.rose_after_id = None
+        self.rose_photo = None
         
         # StringVar for coordinate display
         self.coord_var = tk.StringVar(value="Hover over image to see coordinates")
@@ -83,12 +206,30 @@ class ImageXYReader:
         self.canvas.bind("<Button-4>", self.on_mouse_wheel)  # Linux scroll up
         self.canvas.bind("<Button-5>", self.on_mouse_wheel)  # Linux scroll down
         self.canvas.bind("<Leave>", self.on_mouse_leave)  # Mouse leaves canvas
+        self.canvas.bind("<Configure>", self.on_canvas_resize)
         self.root.bind("<Key-1>", self.on_key_1)  # Red
         self.root.bind("<Key-2>", self.on_key_2)  # Blue
         self.root.bind("<Key-3>", self.on_key_3)  # Black
         self.root.bind("<Key-4>", self.on_key_4)  # Origin (green)
         self.root.bind("<Key-z>", self.toggle_drag_mode)
         self.root.bind("<Key-Z>", self.toggle_drag_mode)
+        self.root.bind("<Key-g>", self.toggle_show_all_groups)
+        self.root.bind("<Key-G>", self.toggle_show_all_groups)
+        self.root.bind("<Key-r>", self.toggle_rose_preview)
+        self.root.bind("<Key-R>", self.toggle_rose_preview)
+        self.root.bind("<Key-c>", self.toggle_calibrate_mode)
+        self.root.bind("<Key-C>", self.toggle_calibrate_mode)
+        self.root.bind("<BackSpace>", self.remove_calibration_reference)
+        
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        self.probe_event_loop_lag()
+        
+        # Load history once the window is up
+        self.profiler.mark("ui_built")
+        self.root.after(0, self.on_window_shown)
+        self.history_loader.start(self.history_file)
+        self.root.after(RENDER_POLL_MS, self.poll_history_load)
         
     def create_ui(self):
         """Create the user interface with sidebar."""
@@ -98,7 +239,7 @@ class ImageXYReader:
         
         instructions = tk.Label(
             header_frame,
-            text="Open Image | Hover=coords | Click=print | 1=Red | 2=Blue | 3=Black | 4=Origin | Z=Toggle Drag | Scroll=zoom",
+            text="Open Image | Hover=coords | Click=print | 1=Red | 2=Blue | 3=Black | 4=Origin | Z=Toggle Drag | G=Show All | C=Calibrate | R=Rose | Scroll=zoom",
             font=("Arial", 10),
             bg="#f0f0f0"
         )
@@ -133,6 +274,48 @@ class ImageXYReader:
         )
         self.drag_button.pack(side=tk.LEFT, padx=5)
         
+        # Show all saved groups toggle button
+        self.show_all_button = tk.Button(
+            button_frame,
+            text="🗺️ Show All Groups (G)",
+            command=self.toggle_show_all_groups,
+            font=("Arial", 10),
+            bg="#607D8B",
+            fg="white",
+            padx=10,
+            pady=5
+        )
+        self.show_all_button.pack(side=tk.LEFT, padx=5)
+        
+        # Calibration mode toggle button and transform kind
+        self.calibrate_button = tk.Button(
+            button_frame,
+            text="📐 Calibrate (C)",
+            command=self.toggle_calibrate_mode,
+            font=("Arial", 10),
+            bg="#607D8B",
+            fg="white",
+            padx=10,
+            pady=5
+        )
+        self.calibrate_button.pack(side=tk.LEFT, padx=5)
+        tk.OptionMenu(
+            button_frame, self.calibration_kind_var, *KINDS, command=self.on_calibration_kind
+        ).pack(side=tk.LEFT)
+        
+        # Rose preview toggle button
+        self.rose_button = tk.Button(
+            button_frame,
+            text="🌹 Rose Preview (R)",
+            command=self.toggle_rose_preview,
+            font=("Arial", 10),
+            bg="#607D8B",
+            fg="white",
+            padx=10,
+            pady=5
+        )
+        self.rose_button.pack(side=tk.LEFT, padx=5)
+        
         # Mode display
         mode_label = tk.Label(
             button_frame,
@@ -153,6 +336,11 @@ class ImageXYReader:
         )
         coord_label.pack(side=tk.LEFT, padx=20)
         
+        # One tab per open image; middle-click closes one
+        self.image_tabs_frame = tk.Frame(header_frame, bg="#f0f0f0")
+        self.image_tabs_frame.pack(fill=tk.X, padx=10)
+        self.image_tab_buttons = []
+        
         # Main content area with sidebar
         content_frame = tk.Frame(self.root)
         content_frame.pack(fill=tk.BOTH, expand=True)
@@ -237,23 +425,50 @@ class ImageXYReader:
         )
         history_label.pack(pady=5)
         
+        # Search box
+        search_frame = tk.Frame(self.sidebar, bg="#e0e0e0")
+        search_frame.pack(pady=2, padx=10, fill=tk.X)
+        
+        tk.Label(search_frame, text="🔍 Search:", bg="#e0e0e0").pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        self.search_entry = tk.Entry(search_frame, textvariable=self.search_var)
+        self.search_entry.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+        self.search_var.trace_add("write", self.on_search_changed)
+        
+        self.search_entry.bind("<Return>", self.on_entry_return)
+        self.search_entry.bind("<Escape>", self.on_entry_escape)
+        self.search_entry.bind("<FocusIn>", self.on_entry_focus_in)
+        self.search_entry.bind("<FocusOut>", self.on_entry_focus_out)
+        
         # History listbox with scrollbar
         list_frame = tk.Frame(self.sidebar, bg="#e0e0e0")
         list_frame.pack(pady=5, padx=10, fill=tk.BOTH, expand=True)
         
-        scrollbar = tk.Scrollbar(list_frame)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        # The scrollbar drives the virtual list, not the listbox itself
+        self.history_scrollbar = tk.Scrollbar(list_frame, command=self.on_history_scroll)
+        self.history_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
         self.history_listbox = tk.Listbox(
             list_frame,
-            yscrollcommand=scrollbar.set,
             font=("Arial", 9),
             selectmode=tk.SINGLE
         )
         self.history_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.config(command=self.history_listbox.yview)
+        self.history_row_height = tkfont.Font(font=("Arial", 9)).metrics("linespace") + 1
         
         self.history_listbox.bind('<<ListboxSelect>>', self.on_history_select)
+        self.history_listbox.bind('<Configure>', self.on_history_resize)
+        self.history_listbox.bind('<MouseWheel>', self.on_history_wheel)
+        self.history_listbox.bind('<Button-4>', self.on_history_wheel)
+        self.history_listbox.bind('<Button-5>', self.on_history_wheel)
+        
+        self.history_count_var = tk.StringVar()
+        tk.Label(
+            self.sidebar,
+            textvariable=self.history_count_var,
+            font=("Arial", 9),
+            bg="#e0e0e0"
+        ).pack(pady=2)
         
         # History buttons
         history_btn_frame = tk.Frame(self.sidebar, bg="#e0e0e0")
@@ -311,7 +526,19 @@ class ImageXYReader:
         )
         export_btn.pack(side=tk.LEFT, padx=2)
         
-        import_btn = tk.Button(
+        export_changes_btn = tk.Button(
+            file_btn_frame,
+            text="📤 Export Changes",
+            command=self.export_changes,
+            font=("Arial", 9),
+            bg="#9C27B0",
+            fg="white",
+            padx=8,
+            pady=3
+        )
+        export_changes_btn.pack(side=tk.LEFT, padx=2)
+        
+        self.import_btn = tk.Button(
             file_btn_frame,
             text="📥 Import",
             command=self.import_groups,
@@ -321,7 +548,17 @@ class ImageXYReader:
             padx=8,
             pady=3
         )
-        import_btn.pack(side=tk.LEFT, padx=2)
+        self.import_btn.pack(side=tk.LEFT, padx=2)
+        
+        # Import progress, only shown while an import runs
+        self.import_progress = ttk.Progressbar(self.sidebar, mode="determinate", maximum=1.0)
+        self.import_status_var = tk.StringVar()
+        self.import_status_label = tk.Label(
+            self.sidebar,
+            textvariable=self.import_status_var,
+            font=("Arial", 9),
+            bg="#e0e0e0"
+        )
         
         reset_btn = tk.Button(
             self.sidebar,
@@ -335,6 +572,28 @@ class ImageXYReader:
         )
         reset_btn.pack(pady=5)
         
+        # Collapsible debug panel with hot-path latencies
+        self.debug_btn = tk.Button(
+            self.sidebar,
+            text="🐞 Debug ▸",
+            command=self.toggle_debug_panel,
+            font=("Arial", 8),
+            relief=tk.FLAT,
+            bg="#e0e0e0"
+        )
+        self.debug_btn.pack(pady=2)
+        self.debug_text = tk.Text(
+            self.sidebar,
+            height=16,
+            width=48,
+            font=("Courier", 8),
+            bg="#f8f8f8",
+            wrap=tk.NONE
+        )
+        
+        # Rose preview pane between the canvas and the sidebar, packed when shown
+        self.rose_label = tk.Label(content_frame, bg="white", bd=1, relief=tk.SUNKEN)
+        
         # Main frame for canvas
         self.main_frame = tk.Frame(content_frame)
         self.main_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
@@ -351,6 +610,13 @@ class ImageXYReader:
         self.root.unbind("<Key-4>")
         self.root.unbind("<Key-z>")
         self.root.unbind("<Key-Z>")
+        self.root.unbind("<Key-g>")
+        self.root.unbind("<Key-G>")
+        self.root.unbind("<Key-r>")
+        self.root.unbind("<Key-R>")
+        self.root.unbind("<Key-c>")
+        self.root.unbind("<Key-C>")
+        self.root.unbind("<BackSpace>")
     
     def on_entry_focus_out(self, event):
         """Called when entry widget loses focus."""
@@ -361,6 +627,13 @@ class ImageXYReader:
         self.root.bind("<Key-4>", self.on_key_4)
         self.root.bind("<Key-z>", self.toggle_drag_mode)
         self.root.bind("<Key-Z>", self.toggle_drag_mode)
+        self.root.bind("<Key-g>", self.toggle_show_all_groups)
+        self.root.bind("<Key-G>", self.toggle_show_all_groups)
+        self.root.bind("<Key-r>", self.toggle_rose_preview)
+        self.root.bind("<Key-R>", self.toggle_rose_preview)
+        self.root.bind("<Key-c>", self.toggle_calibrate_mode)
+        self.root.bind("<Key-C>", self.toggle_calibrate_mode)
+        self.root.bind("<BackSpace>", self.remove_calibration_reference)
     
     def on_entry_return(self, event):
         """Handle Enter key in entry widget - unfocus."""
@@ -372,6 +645,8 @@ class ImageXYReader:
     
     def toggle_drag_mode(self, event=None):
         """Toggle between coordinate mode and drag mode."""
+        if self.calibrate_mode:
+            self.toggle_calibrate_mode()
         self.drag_mode = not self.drag_mode
         
         if self.drag_mode:
@@ -383,15 +658,211 @@ class ImageXYReader:
             self.mode_var.set("Mode: Coordinate ➕")
             self.drag_button.config(bg="#607D8B", text="🖐️ Drag Mode (Z)")
     
+    def toggle_calibrate_mode(self, event=None):
+        """Toggle calibration mode, where clicks place reference points."""
+        if self.drag_mode:
+            self.toggle_drag_mode()
+        self.calibrate_mode = not self.calibrate_mode
+        
+        if self.calibrate_mode:
+            self.mode_var.set("Mode: Calibrate 📐")
+            self.calibrate_button.config(bg="#FF5722")
+            self.coord_var.set("Click a point of known data coordinates; Backspace removes the last one")
+        else:
+            self.mode_var.set("Mode: Coordinate ➕")
+            self.calibrate_button.config(bg="#607D8B")
+    
+    def add_calibration_reference(self, x, y):
+        """Ask for the data coordinates of an image position and refit the calibration."""
+        text = simpledialog.askstring(
+            "Reference Point", f"Data coordinates of ({x}, {y}), as: u, v", parent=self.root
+        )
+        if not text:
+            return
+        try:
+            u, v = (float(n) for n in text.replace(",", " ").split())
+        except ValueError:
+            messagebox.showerror("Calibration Error", f"Expected two numbers, got {text!r}")
+            return
+        self.calibration_refs.setdefault(self.session.current_name, []).append(((x, y), (u, v)))
+        self.fit_calibration()
+    
+    def remove_calibration_reference(self, event=None):
+        """Remove the last reference point of the current image."""
+        refs = self.calibration_refs.get(self.session.current_name)
+        if self.calibrate_mode and refs:
+            refs.pop()
+            self.fit_calibration()
+    
+    def on_calibration_kind(self, kind):
+        if self.calibration_refs.get(self.session.current_name):
+            self.fit_calibration()
+    
+    def fit_calibration(self):
+        """Fit the current image's calibration to its reference points, then save and show it."""
+        key = self.session.current_name
+        refs = self.calibration_refs.get(key, [])
+        kind = self.calibration_kind_var.get()
+        self.calibrations.pop(key, None)
+        if len(refs) < MIN_REFERENCES[kind]:
+            self.coord_var.set(f"Calibration: {len(refs)} of {MIN_REFERENCES[kind]} reference points")
+        else:
+            try:
+                calibration = self.calibrations[key] = Calibration.fit(refs, kind)
+                self.coord_var.set(
+                    f"Calibration: {kind} from {len(refs)} points, RMS error {calibration.rms_error():.3g}"
+                )
+            except ValueError as e:
+                self.coord_var.set(f"Calibration: {str(e)}")
+        self.save_calibrations()
+        self.redraw_all_dots()
+    
+    def load_calibrations(self):
+        """Load the saved calibrations, with their reference points."""
+        if not os.path.exists(self.calibration_file):
+            return
+        try:
+            self.calibrations = load_calibrations(self.calibration_file)
+        except Exception as e:
+            print(f"Error loading calibrations: {e}")
+            return
+        for key, calibration in self.calibrations.items():
+            self.calibration_refs[key] = list(calibration.references)
+    
+    def save_calibrations(self):
+        try:
+            save_calibrations(self.calibration_file, self.calibrations)
+        except Exception as e:
+            messagebox.showerror("Calibration Error", f"Failed to save calibration: {str(e)}")
+    
+    def probe_event_loop_lag(self):
+        """Record how late this timer fired, i.e. how long the event loop was busy."""
+        now = time.perf_counter()
+        if self.lag_expected is not None:
+            self.profiler.record("event_loop_lag", max(0.0, now - self.lag_expected))
+        self.lag_expected = now + LAG_PROBE_MS / 1000
+        self.root.after(LAG_PROBE_MS, self.probe_event_loop_lag)
+    
+    def get_debug_stats(self):
+        """Counters shown in the debug panel and written by --profile."""
+        return {
+            "image_memory_bytes": self.get_image_memory() if self.pyramid is not None else 0,
+            "open_images": len(self.session),
+            "tile_cache_tiles": len(self.tile_cache),
+            "history_groups": self.history.count(),
+            "history_save": self.history.save_status(),
+            "event_counts": dict(self.event_counts),
+        }
+    
+    def toggle_debug_panel(self):
+        """Show or hide the debug panel."""
+        if self.debug_after_id is None:
+            self.debug_btn.config(text="🐞 Debug ▾")
+            self.debug_text.pack(pady=2, padx=5, fill=tk.X)
+            self.refresh_debug_panel()
+        else:
+            self.root.after_cancel(self.debug_after_id)
+            self.debug_after_id = None
+            self.debug_btn.config(text="🐞 Debug ▸")
+            self.debug_text.pack_forget()
+    
+    def refresh_debug_panel(self):
+        """Redraw the latency table and counters while the panel is open."""
+        stats = self.get_debug_stats()
+        counts = stats["event_counts"]
+        lines = [
+            self.profiler.report(),
+            "",
+            f"Image memory: {stats['image_memory_bytes'] / (1024 * 1024):.1f} MB "
+            f"({stats['open_images']} images, {stats['tile_cache_tiles']} cached tiles)",
+            f"Moves: {counts['motion']} ({counts['motion_dropped']} coalesced)  "
+            f"Drags: {counts['drag']} ({counts['drag_dropped']} coalesced)",
+            f"History: {stats['history_groups']} groups",
+            self.format_save_status(stats["history_save"]),
+        ]
+        self.debug_text.delete("1.0", tk.END)
+        self.debug_text.insert(tk.END, "\n".join(lines))
+        self.debug_after_id = self.root.after(DEBUG_REFRESH_MS, self.refresh_debug_panel)
+    
+    def format_save_status(self, status):
+        """Describe what is left to save and how long the last save took."""
+        if status["error"]:
+            text = f"Save failed: {status['error']}"
+        elif status["unsaved"]:
+            text = f"{status['unsaved']} edits {'saving' if status['saving'] else 'not saved yet'}"
+        else:
+            text = "All edits saved"
+        if status["last_save_ms"] is not None:
+            text += f" (last save {status['last_save_ms']:.1f} ms, {status['saves']} saves)"
+        return text
+    
+    def dump_profile(self, path):
+        """Write the latency histograms and counters to a JSON file."""
+        try:
+            self.profiler.dump(path, self.get_debug_stats())
+            print(f"Profile written to {path}")
+        except Exception as e:
+            print(f"Error writing profile: {e}")
+    
+    def toggle_show_all_groups(self, event=None):
+        """Toggle drawing every saved group on top of the image."""
+        self.show_all_groups = not self.show_all_groups
+        
+        if self.show_all_groups:
+            self.show_all_button.config(bg="#FF5722")
+        else:
+            self.show_all_button.config(bg="#607D8B")
+        self.refresh_saved_dots()
+    
+    def toggle_rose_preview(self, event=None):
+        """Show or hide the live rose diagram of the current image's groups."""
+        if self.rose_renderer is None:
+            from plot_rose import RoseRenderer
+            self.rose_renderer = RoseRenderer(ROSE_PREVIEW_SIZE)
+            self.rose_button.config(bg="#FF5722")
+            self.rose_label.pack(side=tk.RIGHT, fill=tk.Y, pady=5, before=self.main_frame)
+            self.rebuild_rose_preview()
+        else:
+            if self.rose_after_id is not None:
+                self.root.after_cancel(self.rose_after_id)
+                self.rose_after_id = None
+            self.rose_renderer = None
+            self.rose_photo = None
+            self.rose_button.config(bg="#607D8B")
+            self.rose_label.pack_forget()
+    
+    def rebuild_rose_preview(self):
+        """Feed the preview every group of the current image, or of no image."""
+        if self.rose_renderer is None:
+            return
+        image = self.session.current_name
+        self.rose_renderer.set_groups(
+            group for group in self.history.iter_groups()
+            if image is None or group.get("image") in (None, image)
+        )
+        self.schedule_rose_preview()
+    
+    def schedule_rose_preview(self):
+        """Redraw the preview once the current event is handled."""
+        if self.rose_renderer is not None and self.rose_after_id is None:
+            self.rose_after_id = self.root.after_idle(self.flush_rose_preview)
+    
+    @profiled
+    def flush_rose_preview(self):
+        """Redraw the wedges that changed since the last preview."""
+        from PIL import ImageTk
+        self.rose_after_id = None
+        self.rose_photo = ImageTk.PhotoImage(self.rose_renderer.render())
+        self.rose_label.config(image=self.rose_photo)
+    
     def update_current_coords_display(self):
         """Update the display of current coordinates."""
         self.current_coords_text.delete(1.0, tk.END)
         
-        lines = []
-        lines.append(f"Origin: {self.format_coord(self.origin_coords)}")
-        lines.append(f"Red:    {self.format_coord(self.red_dot_coords)}")
-        lines.append(f"Blue:   {self.format_coord(self.blue_dot_coords)}")
-        lines.append(f"Black:  {self.format_coord(self.black_dot_coords)}")
+        lines = [
+            f"{key.capitalize() + ':':7} {self.format_coord(point)}"
+            for key, point in self.draft.points.items()
+        ]
         
         self.current_coords_text.insert(1.0, "\n".join(lines))
     
@@ -401,29 +872,34 @@ class ImageXYReader:
             return "Not set"
         return f"({coord[0]}, {coord[1]})"
     
+    @profiled
     def save_current_group(self):
         """Save the current group to history."""
+        if not self.check_history_loaded("save"):
+            return
+        
         if not self.group_name_var.get().strip():
             messagebox.showwarning("No Name", "Please enter a group name.")
             return
         
-        if all(c is None for c in [self.origin_coords, self.red_dot_coords, 
-                                     self.blue_dot_coords, self.black_dot_coords]):
+        if self.draft.is_empty():
             messagebox.showwarning("Empty Group", "No coordinates set. Please mark at least one point.")
             return
         
-        group = {
-            "name": self.group_name_var.get().strip(),
-            "origin": self.origin_coords,
-            "red": self.red_dot_coords,
-            "blue": self.blue_dot_coords,
-            "black": self.black_dot_coords,
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
+        group = self.draft.to_group(self.group_name_var.get().strip())
         
-        self.groups.append(group)
-        self.save_history()
-        self.update_history_display()
+        try:
+            self.history.add(group)
+        except Exception as e:
+            messagebox.showerror("Save Error", f"Failed to save group: {str(e)}")
+            return
+        
+        self.update_history_display(inserted=1)
+        self.refresh_saved_dots()
+        self.schedule_save()
+        if self.rose_renderer is not None:
+            self.rose_renderer.add(group)
+            self.schedule_rose_preview()
         
         messagebox.showinfo("Saved", f"Group '{group['name']}' saved successfully!")
         
@@ -433,24 +909,10 @@ class ImageXYReader:
     def clear_current_group(self):
         """Clear all current coordinates and dots."""
         # Remove dots from canvas
-        if self.origin_dot:
-            self.canvas.delete(self.origin_dot)
-        if self.red_dot:
-            self.canvas.delete(self.red_dot)
-        if self.blue_dot:
-            self.canvas.delete(self.blue_dot)
-        if self.black_dot:
-            self.canvas.delete(self.black_dot)
+        self.canvas.delete("active")
         
         # Reset coordinates
-        self.origin_dot = None
-        self.red_dot = None
-        self.blue_dot = None
-        self.black_dot = None
-        self.origin_coords = None
-        self.red_dot_coords = None
-        self.blue_dot_coords = None
-        self.black_dot_coords = None
+        self.draft.clear()
         
         # Clear group name
         self.group_name_var.set("")
@@ -458,56 +920,164 @@ class ImageXYReader:
         # Update display
         self.update_current_coords_display()
     
-    def update_history_display(self):
-        """Update the history listbox."""
-        self.history_listbox.delete(0, tk.END)
+    @profiled
+    def update_history_display(self, inserted=0):
+        """Refresh the visible history rows, newest first.
+        
+        Only the rows on screen are fetched from the store and the listbox is
+        patched rather than rebuilt. After `inserted` new groups the view stays
+        on the rows it was showing unless it was already at the top.
+        """
+        if not self.history_loaded:
+            self.history_count_var.set("Loading history...")
+            return
+        if self.history_filter is not None and self.history_filter_version != self.history.search_index.version:
+            # Re-run the search so edits show up in the results
+            self.apply_search()
+        
+        total = self.get_history_total()
+        if inserted and self.history_top > 0 and self.history_filter is None:
+            self.history_top += inserted
+        self.history_top = max(0, min(self.history_top, total - self.history_visible_rows))
         
-        for idx, group in enumerate(reversed(self.groups)):
+        if self.history_filter is None:
+            groups = self.history.page(self.history_top, self.history_visible_rows)
+        else:
+            ids = self.history_filter.page(self.history_top, self.history_visible_rows)
+            groups = self.history.get_many(ids)
+        rows = [group["id"] for group in groups]
+        old_rows = self.history_rows
+        
+        # Replace only the run of rows between the unchanged head and tail
+        head = 0
+        while head < min(len(rows), len(old_rows)) and rows[head] == old_rows[head]:
+            head += 1
+        tail = 0
+        while (tail < min(len(rows), len(old_rows)) - head
+               and rows[-1 - tail] == old_rows[-1 - tail]):
+            tail += 1
+        
+        if head < len(old_rows) - tail:
+            self.history_listbox.delete(head, len(old_rows) - tail - 1)
+        for offset, group in enumerate(groups[head:len(groups) - tail]):
             display_text = f"{group['name']} - {group['timestamp']}"
-            self.history_listbox.insert(tk.END, display_text)
+            if group.get("image"):
+                display_text += f" ({group['image']})"
+            self.history_listbox.insert(head + offset, display_text)
+        self.history_rows = rows
+        
+        # Keep the selection on the same group wherever it moved
+        self.history_listbox.selection_clear(0, tk.END)
+        if self.history_selected_id in rows:
+            self.history_listbox.selection_set(rows.index(self.history_selected_id))
+        
+        if total:
+            self.history_scrollbar.set(self.history_top / total, (self.history_top + len(rows)) / total)
+        else:
+            self.history_scrollbar.set(0, 1)
+        if self.history_filter is None:
+            self.history_count_var.set(f"{total} groups")
+        else:
+            self.history_count_var.set(f"{total} of {self.history.count()} groups match")
+    
+    def get_history_total(self):
+        """Number of rows in the history list, with the search applied."""
+        if self.history_filter is None:
+            return self.history.count()
+        return len(self.history_filter)
+    
+    @profiled
+    def on_search_changed(self, *args):
+        """Filter the history list as the search text changes."""
+        self.apply_search()
+        self.history_top = 0
+        self.update_history_display()
+    
+    def apply_search(self):
+        """Filter the history list by the current search text."""
+        search_index = self.history.search_index
+        self.history_filter = search_index.search(self.search_var.get())
+        self.history_filter_version = search_index.version
+    
+    def on_history_scroll(self, action, amount, unit=None):
+        """Scroll the virtual history list from the scrollbar."""
+        if action == "moveto":
+            self.history_top = int(float(amount) * self.get_history_total())
+        elif unit == "pages":
+            self.history_top += int(amount) * self.history_visible_rows
+        else:
+            self.history_top += int(amount)
+        self.update_history_display()
+    
+    def on_history_wheel(self, event):
+        """Scroll the virtual history list with the mouse wheel."""
+        if event.num == 5 or event.delta < 0:
+            self.history_top += HISTORY_WHEEL_ROWS
+        elif event.num == 4 or event.delta > 0:
+            self.history_top -= HISTORY_WHEEL_ROWS
+        self.update_history_display()
+        return "break"
+    
+    def on_history_resize(self, event):
+        """Fetch as many rows as now fit in the listbox."""
+        rows = max(1, event.height // self.history_row_height)
+        if rows != self.history_visible_rows:
+            self.history_visible_rows = rows
+            self.update_history_display()
+    
+    def get_selected_group(self, action):
+        """Return the group selected in the history list, warning if there is none."""
+        group = None
+        if self.history_selected_id is not None:
+            group = self.history.get(self.history_selected_id)
+        if group is None:
+            messagebox.showwarning("No Selection", f"Please select a group to {action}.")
+        return group
     
     def on_history_select(self, event):
-        """Handle history item selection."""
-        pass  # Selection handled by buttons
+        """Remember the selected group by id so it survives scrolling and edits."""
+        selection = self.history_listbox.curselection()
+        if selection:
+            self.history_selected_id = self.history_rows[selection[0]]
     
     def view_selected_group(self):
         """View details of selected group."""
-        selection = self.history_listbox.curselection()
-        if not selection:
-            messagebox.showwarning("No Selection", "Please select a group to view.")
+        group = self.get_selected_group("view")
+        if group is None:
             return
         
-        idx = len(self.groups) - 1 - selection[0]
-        group = self.groups[idx]
-        
         details = f"Group: {group['name']}\n"
         details += f"Saved: {group['timestamp']}\n\n"
-        details += f"Origin: {self.format_coord(group['origin'])}\n"
-        details += f"Red:    {self.format_coord(group['red'])}\n"
-        details += f"Blue:   {self.format_coord(group['blue'])}\n"
-        details += f"Black:  {self.format_coord(group['black'])}"
+        details += "\n".join(
+            f"{key.capitalize() + ':':7} {self.format_coord(group.get(key))}" for key in group_series(group)
+        )
         
         messagebox.showinfo("Group Details", details)
     
     def load_selected_group(self):
         """Load selected group into current coordinates."""
-        selection = self.history_listbox.curselection()
-        if not selection:
-            messagebox.showwarning("No Selection", "Please select a group to load.")
+        group = self.get_selected_group("load")
+        if group is None:
             return
         
-        idx = len(self.groups) - 1 - selection[0]
-        group = self.groups[idx]
-        
+        # A group saved on another open image is loaded onto that image
+        entry = self.session.find(group.get("image"))
+        if entry is not None and entry.key != self.session.current:
+            self.switch_image(entry.key)
+            if entry.key != self.session.current:
+                # The image was evicted and is loading again; the group follows it
+                self.pending_group = group
+                return
+        self.load_group(group)
+    
+    def load_group(self, group):
+        """Load the points of a saved group into the group being digitized."""
         # Clear current
         self.clear_current_group()
         
         # Load coordinates
         self.group_name_var.set(group['name'] + " (copy)")
-        self.origin_coords = group['origin']
-        self.red_dot_coords = group['red']
-        self.blue_dot_coords = group['blue']
-        self.black_dot_coords = group['black']
+        self.draft.load(group)
         
         # Update display
         self.update_current_coords_display()
@@ -518,93 +1088,300 @@ class ImageXYReader:
         
         messagebox.showinfo("Loaded", f"Group '{group['name']}' loaded into current coordinates.")
     
+    @profiled
     def delete_selected_group(self):
         """Delete selected group from history."""
-        selection = self.history_listbox.curselection()
-        if not selection:
-            messagebox.showwarning("No Selection", "Please select a group to delete.")
+        if not self.check_history_loaded("delete"):
             return
         
-        idx = len(self.groups) - 1 - selection[0]
-        group = self.groups[idx]
+        group = self.get_selected_group("delete")
+        if group is None:
+            return
         
         if messagebox.askyesno("Confirm Delete", f"Delete group '{group['name']}'?"):
-            self.groups.pop(idx)
-            self.save_history()
+            try:
+                self.history.delete(group["id"])
+            except Exception as e:
+                messagebox.showerror("Delete Error", f"Failed to delete group: {str(e)}")
+                return
+            self.history_selected_id = None
             self.update_history_display()
+            self.refresh_saved_dots()
+            self.schedule_save()
+            if self.rose_renderer is not None:
+                self.rose_renderer.remove(group["id"])
+                self.schedule_rose_preview()
     
     def export_groups(self):
-        """Export all groups to a JSON file."""
-        if not self.groups:
+        """Export all groups to a JSON file, or a columnar .ngc file for analysis."""
+        if not self.check_history_loaded("export"):
+            return
+        
+        if not self.history.count():
             messagebox.showwarning("No Data", "No groups to export.")
             return
         
         file_path = filedialog.asksaveasfilename(
             title="Export Groups",
             defaultextension=".json",
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")],
+            filetypes=[("JSON files", "*.json"), ("Columnar groups", "*.ngc"), ("All files", "*.*")],
             initialfile="coordinate_groups_export.json"
         )
         
         if file_path:
             try:
-                with open(file_path, 'w') as f:
-                    json.dump(self.groups, f, indent=2)
-                messagebox.showinfo("Success", f"Exported {len(self.groups)} groups to {file_path}")
+                hashes = write_export(file_path, self.history.iter_groups())
+                # Later change exports are made against this one
+                if self.export_manifest is None:
+                    self.export_manifest = ExportManifest(self.export_manifest_file)
+                self.export_manifest.record_full(hashes)
+                messagebox.showinfo("Success", f"Exported {self.history.count()} groups to {file_path}")
             except Exception as e:
                 messagebox.showerror("Export Error", f"Failed to export: {str(e)}")
     
+    def export_changes(self):
+        """Export only the groups saved or deleted since the last export, as a delta file."""
+        if not self.check_history_loaded("export"):
+            return
+        
+        try:
+            manifest = self.get_export_manifest()
+        except Exception as e:
+            messagebox.showerror("Export Error", f"Failed to read what was last exported: {str(e)}")
+            return
+        if manifest.hashes is None:
+            messagebox.showwarning("No Export Yet", "Export all groups once first; later exports can then send only the changes.")
+            return
+        
+        added, deleted = manifest.changes(self.history.ids())
+        if not added and not deleted:
+            messagebox.showinfo("No Changes", "Nothing has changed since the last export.")
+            return
+        
+        file_path = filedialog.asksaveasfilename(
+            title="Export Changes",
+            defaultextension=".json",
+            filetypes=[("Delta files", "*.delta.json"), ("JSON files", "*.json"), ("All files", "*.*")],
+            initialfile="coordinate_groups_changes.delta.json"
+        )
+        
+        if file_path:
+            try:
+                write_delta(file_path, manifest, self.history.get_many(added), deleted)
+                messagebox.showinfo(
+                    "Success",
+                    f"Exported {len(added)} new and {len(deleted)} deleted groups to {file_path}"
+                )
+            except Exception as e:
+                messagebox.showerror("Export Error", f"Failed to export changes: {str(e)}")
+    
+    def get_export_manifest(self):
+        """Return what was last exported from this history, reading it on first use."""
+        if self.export_manifest is None:
+            manifest = ExportManifest(self.export_manifest_file)
+            manifest.load()
+            self.export_manifest = manifest
+        return self.export_manifest
+    
     def import_groups(self):
-        """Import groups from a JSON file."""
+        """Import groups from a JSON or columnar file, streaming it in batches and skipping duplicates."""
+        if self.import_job is not None or not self.check_history_loaded("import"):
+            return
+        
         file_path = filedialog.askopenfilename(
             title="Import Groups",
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+            filetypes=[("JSON files", "*.json"), ("Columnar groups", "*.ngc"), ("All files", "*.*")]
         )
         
         if file_path:
             try:
-                with open(file_path, 'r') as f:
-                    imported_groups = json.load(f)
-                
-                # Validate structure
-                if not isinstance(imported_groups, list):
-                    raise ValueError("Invalid file format")
-                
-                # Add imported groups
-                self.groups.extend(imported_groups)
-                self.save_history()
-                self.update_history_display()
-                
-                messagebox.showinfo("Success", f"Imported {len(imported_groups)} groups.")
+                if is_columnar(file_path):
+                    # Memory-mapped, so progress is counted in groups rather than bytes
+                    f = None
+                    reader = ColumnarGroups(file_path)
+                    size = max(1, len(reader))
+                else:
+                    f = open(file_path, 'rb')
+                    reader = JSONArrayReader(f)
+                    size = max(1, os.fstat(f.fileno()).st_size)
             except Exception as e:
                 messagebox.showerror("Import Error", f"Failed to import: {str(e)}")
+                return
+            
+            self.import_job = {
+                "file": f,
+                "reader": reader,
+                "groups": iter(reader),
+                "size": size,
+                "read": 0,
+                "added": 0,
+                "skipped": 0
+            }
+            self.import_btn.config(state=tk.DISABLED)
+            self.import_progress["value"] = 0
+            self.import_progress.pack(pady=2, padx=10, fill=tk.X)
+            self.import_status_label.pack(pady=2)
+            self.import_status_var.set("Importing...")
+            self.root.after(1, self.import_next_batch)
+    
+    @profiled
+    def import_next_batch(self):
+        """Read, dedupe and commit the next batch of the running import."""
+        job = self.import_job
+        try:
+            groups = list(itertools.islice(job["groups"], IMPORT_BATCH_SIZE))
+            job["read"] += len(groups)
+            added, skipped = self.history.import_batch(groups)
+            job["added"] += len(added)
+            job["skipped"] += skipped
+            if added:
+                self.update_history_display(inserted=len(added))
+                self.schedule_save()
+        except Exception as e:
+            self.finish_import()
+            messagebox.showerror(
+                "Import Error",
+                f"Failed to import after adding {job['added']} groups: {str(e)}"
+            )
+            return
+        
+        if len(groups) < IMPORT_BATCH_SIZE:
+            self.finish_import()
+            messagebox.showinfo(
+                "Success",
+                f"Imported {job['added']} groups, skipped {job['skipped']} duplicates."
+            )
+            return
+        
+        done = (job["reader"].bytes_read if job["file"] is not None else job["read"]) / job["size"]
+        self.import_progress["value"] = done
+        self.import_status_var.set(
+            f"Importing... {done:.0%} ({job['added']} added, {job['skipped']} duplicates)"
+        )
+        self.root.after(1, self.import_next_batch)
+    
+    def finish_import(self):
+        """Close the import file and hide the progress bar."""
+        job = self.import_job
+        self.import_job = None
+        job["groups"].close()  # Lets go of what the reader still holds of the file
+        if job["file"] is not None:
+            job["file"].close()
+        else:
+            job["reader"].close()  # Unmaps the .ngc export
+        self.import_btn.config(state=tk.NORMAL)
+        self.import_progress.pack_forget()
+        self.import_status_label.pack_forget()
+        self.refresh_saved_dots()
+        self.rebuild_rose_preview()
     
     def reset_history(self):
         """Reset all history."""
+        if not self.check_history_loaded("reset"):
+            return
+        
         if messagebox.askyesno("Confirm Reset", "Delete ALL saved groups? This cannot be undone!"):
-            self.groups = []
-            self.save_history()
+            try:
+                self.history.reset()
+            except Exception as e:
+                messagebox.showerror("Reset Error", f"Failed to reset history: {str(e)}")
+                return
             self.update_history_display()
+            self.refresh_saved_dots()
+            self.schedule_save()
+            self.rebuild_rose_preview()
             messagebox.showinfo("Reset", "All history has been cleared.")
     
-    def load_history(self):
-        """Load groups from history file."""
-        if os.path.exists(self.history_file):
-            try:
-                with open(self.history_file, 'r') as f:
-                    self.groups = json.load(f)
-            except Exception as e:
-                print(f"Error loading history: {e}")
-                self.groups = []
+    def schedule_save(self):
+        """Write history edits SAVE_DELAY_MS from now, together with any made meanwhile."""
+        if self.save_after_id is None:
+            self.save_after_id = self.root.after(SAVE_DELAY_MS, self.commit_history)
     
-    def save_history(self):
-        """Save groups to history file."""
+    @profiled
+    def commit_history(self):
+        """Write the history edits made since the last commit; the JSON journal writes in the background."""
+        self.save_after_id = None
         try:
-            with open(self.history_file, 'w') as f:
-                json.dump(self.groups, f, indent=2)
+            self.history.commit()
         except Exception as e:
             print(f"Error saving history: {e}")
     
+    def on_close(self):
+        """Write any unsaved history edits, then close the window."""
+        if self.save_after_id is not None:
+            self.root.after_cancel(self.save_after_id)
+            self.save_after_id = None
+        try:
+            self.history.flush()
+        except Exception as e:
+            if not messagebox.askyesno(
+                "Save Error",
+                f"Failed to save history: {str(e)}\n\nClose anyway and lose the unsaved edits?"
+            ):
+                return
+        self.root.destroy()
+    
+    def on_window_shown(self):
+        """Note when the window is first drawn, for --startup-profile, then set up what needs NumPy."""
+        self.root.update_idletasks()
+        self.profiler.mark("window_visible")
+        if self.history is None:
+            self.history = GroupHistory(self.history_file, store=JournalGroupStore(self.history_file))
+        self.load_calibrations()
+        self.report_startup()
+    
+    def poll_history_load(self):
+        """Show progress of the history load and fill the sidebar once it is ready."""
+        while True:
+            try:
+                kind, value = self.history_loader.results.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                self.history_count_var.set(f"Loading history... {value:.0%}")
+            else:
+                self.finish_history_load(*value)
+                return
+        
+        self.root.after(RENDER_POLL_MS, self.poll_history_load)
+    
+    @profiled
+    def finish_history_load(self, history, error):
+        """Switch to the loaded history and show its groups."""
+        if error is not None:
+            print(f"Error loading history: {error}")
+        if history is None:
+            self.history_count_var.set("History not loaded")
+            messagebox.showerror("History Error", f"Failed to open history: {str(error)}")
+            return
+        
+        self.history = history
+        self.history_loaded = True
+        self.profiler.mark("history_loaded")
+        if self.history_filter is not None:
+            self.apply_search()  # Typed while loading
+        self.update_history_display()
+        self.refresh_saved_dots()
+        self.rebuild_rose_preview()
+        self.report_startup()
+    
+    def check_history_loaded(self, action):
+        """Return whether the history has loaded, warning that action has to wait if not."""
+        if not self.history_loaded:
+            messagebox.showwarning("History Loading", f"The history has not loaded yet; please {action} once it has.")
+        return self.history_loaded
+    
+    def report_startup(self):
+        """Print the startup milestones for --startup-profile once the window is up and the history loaded."""
+        milestones = self.profiler.milestones
+        if not self.startup_profile or "window_visible" not in milestones or "history_loaded" not in milestones:
+            return
+        visible = milestones["window_visible"]
+        verdict = "within" if visible <= STARTUP_TARGET_MS else "OVER"
+        print(self.profiler.milestone_report())
+        print(f"Window visible in {visible:.0f} ms, {verdict} the {STARTUP_TARGET_MS} ms target "
+              f"({self.history.count()} groups in the history)")
+    
     def open_image(self):
         """Open an image file dialog and load the image."""
         file_path = filedialog.askopenfilename(
@@ -616,22 +1393,180 @@ class ImageXYReader:
         )
         
         if file_path:
+            self.load_image(file_path)
+    
+    def load_image(self, file_path):
+        """Start loading an image on the worker; it is shown once ready."""
+        # Picking another file while one is loading cancels the first
+        self.load_path = file_path
+        self.image_loader.start(file_path)
+        self.coord_var.set(f"Loading {os.path.basename(file_path)}...")
+        if self.load_after_id is None:
+            self.load_after_id = self.root.after(RENDER_POLL_MS, self.poll_image_load)
+    
+    def poll_image_load(self):
+        """Show progress of the image load and switch to the image once it is ready."""
+        self.load_after_id = None
+        
+        while True:
             try:
-                self.original_image = Image.open(file_path)
-                self.image = self.original_image.copy()
-                self.display_image()
-                self.root.title(f"Florence Nightingale's Rose Diagram - {os.path.basename(file_path)}")
-                
-                # Redraw any existing dots
-                self.redraw_all_dots()
-            except Exception as e:
-                self.coord_var.set(f"Error loading image: {str(e)}")
+                generation, kind, value = self.image_loader.results.get_nowait()
+            except queue.Empty:
+                break
+            if generation != self.image_loader.generation:
+                continue  # From a cancelled load
+            
+            name = os.path.basename(self.load_path)
+            if kind == "progress":
+                self.coord_var.set(f"Loading {name}... {value:.0%}")
+            elif kind == "error":
+                self.pending_group = None
+                self.coord_var.set(f"Error loading image: {str(value)}")
+                return
+            else:
+                self.show_loaded_image(value)
+                return
+        
+        self.load_after_id = self.root.after(RENDER_POLL_MS, self.poll_image_load)
     
-    def display_image(self):
-        """Display the image on the canvas."""
-        if self.image is None:
+    @profiled
+    def show_loaded_image(self, pyramid):
+        """Add a loaded image to the session and switch to it."""
+        self.remember_view()
+        entry = self.session.add(self.load_path, pyramid)
+        self.show_image(entry.key)
+        
+        group, self.pending_group = self.pending_group, None
+        if group is not None and group.get("image") == entry.name:
+            self.load_group(group)
+    
+    def switch_image(self, key):
+        """Switch to another open image, loading it again if it was evicted."""
+        if key == self.session.current:
+            return
+        entry = self.session.get(key)
+        if entry.pyramid is None:
+            self.load_image(entry.path)
             return
+        self.remember_view()
+        self.show_image(key)
+    
+    @profiled
+    def show_image(self, key):
+        """Show an open image with the view and the group being digitized it was left with."""
+        entry = self.session.show(key)
+        self.pyramid = entry.pyramid
+        self.image = self.pyramid.get_level(len(self.pyramid.levels) - 1)
+        self.draft = entry.draft
+        
+        # Tiles are keyed by scale and position only, so none can carry over
+        self.canvas.delete("tile")
+        self.tile_items.clear()
+        self.tile_cache.clear()
+        self.preview_keys.clear()
+        self.render_generation += 1
+        
+        self.viewport.set_image(*self.pyramid.size)
+        self.viewport.set_canvas(*self.get_canvas_size())
+        if entry.view is None:
+            self.viewport.center()
+        else:
+            self.viewport.set_state(entry.view)
+        self.display_image()
         
+        # Redraw the dots of this image
+        calibration = self.calibrations.get(entry.name)
+        if calibration is not None:
+            self.calibration_kind_var.set(calibration.kind)
+        self.redraw_all_dots()
+        self.refresh_saved_dots()
+        self.update_current_coords_display()
+        self.update_image_tabs()
+        self.rebuild_rose_preview()
+        self.root.title(f"Florence Nightingale's Rose Diagram - {entry.name}")
+        self.session.enforce_budget()
+    
+    def remember_view(self):
+        """Keep the zoom and pan of the current image for when it is shown again."""
+        if self.session.current is not None:
+            self.session.get(self.session.current).view = self.viewport.get_state()
+    
+    def close_image(self, key):
+        """Close an open image, switching to the most recently shown one left."""
+        self.session.close(key)
+        
+        # A load of the closed image, and the group waiting for it, go with it
+        if self.load_path is not None and image_key(self.load_path) == key:
+            self.image_loader.cancel()
+            if self.load_after_id is not None:
+                self.root.after_cancel(self.load_after_id)
+                self.load_after_id = None
+            self.load_path = None
+            self.pending_group = None
+            if self.pyramid is not None:
+                self.update_image_status()  # In place of the load progress
+        
+        if self.pyramid is not None and self.session.current is None:
+            # Tiles still rendering for the closed image are dropped unseen
+            if self.poll_after_id is not None:
+                self.root.after_cancel(self.poll_after_id)
+                self.poll_after_id = None
+            self.render_generation += 1
+            self.render_worker.submit(self.render_generation, [])
+            self.tile_cache.clear()
+            
+            self.pyramid = None
+            self.image = None
+            self.draft = GroupDraft()
+            self.canvas.delete("view")
+            self.tile_items.clear()
+            self.preview_keys.clear()
+            self.saved_dot_items.clear()
+            self.overlay_view = None
+            self.update_current_coords_display()
+            self.coord_var.set("Hover over image to see coordinates")
+            self.root.title("Florence Nightingale's Rose Diagram")
+            
+            for entry in reversed(self.session.images.values()):
+                if entry.pyramid is not None:
+                    self.show_image(entry.key)
+                    return
+            self.rebuild_rose_preview()
+        self.update_image_tabs()
+    
+    def update_image_tabs(self):
+        """Rebuild the row of image tabs; evicted images are greyed out."""
+        for button in self.image_tab_buttons:
+            button.destroy()
+        self.image_tab_buttons = []
+        
+        if len(self.session) < 2:
+            return  # Tabs only once there is something to switch to
+        
+        names = Counter(self.session.get(key).name for key in self.session.order)
+        for key in self.session.order:
+            current = key == self.session.current
+            entry = self.session.get(key)
+            
+            # Scans that share a name are told apart by their folder
+            text = entry.name
+            if names[entry.name] > 1:
+                text = os.path.join(os.path.basename(os.path.dirname(key)), entry.name)
+            button = tk.Button(
+                self.image_tabs_frame,
+                text=text,
+                command=lambda key=key: self.switch_image(key),
+                font=("Arial", 9, "bold" if current else "normal"),
+                relief=tk.SUNKEN if current else tk.RAISED,
+                fg="black" if entry.pyramid is not None else "#888",
+                padx=6
+            )
+            button.bind("<Button-2>", lambda event, key=key: self.close_image(key))
+            button.pack(side=tk.LEFT, padx=2)
+            self.image_tab_buttons.append(button)
+    
+    def get_canvas_size(self):
+        """Return the canvas size, falling back to a default before it is mapped."""
         canvas_width = self.canvas.winfo_width()
         canvas_height = self.canvas.winfo_height()
         
@@ -640,34 +1575,165 @@ class ImageXYReader:
         if canvas_height <= 1:
             canvas_height = 500
         
-        orig_width, orig_height = self.original_image.size
-        
-        self.image = self.original_image.copy()
-        display_width = int((canvas_width - 20) * self.zoom_factor)
-        display_height = int((canvas_height - 20) * self.zoom_factor)
-        self.image.thumbnail((display_width, display_height), Image.Resampling.LANCZOS)
-        
-        self.scale_x = orig_width / self.image.width
-        self.scale_y = orig_height / self.image.height
-        
-        self.photo_image = ImageTk.PhotoImage(self.image)
-        
-        self.canvas.delete("all")
-        
-        x = (canvas_width - self.photo_image.width()) // 2
-        y = (canvas_height - self.photo_image.height()) // 2
+        return canvas_width, canvas_height
+    
+    def get_tile(self, tile_x, tile_y):
+        """Return the cached full-quality tile, or a quick preview if it is not rendered yet."""
+        key = (self.viewport.scale, tile_x, tile_y)
+        photo = self.tile_cache.get(key)
+        if photo is not None:
+            self.tile_cache.move_to_end(key)
+            return photo, True
+        
+        from PIL import Image, ImageTk
+        box = self.viewport.tile_box(tile_x, tile_y)
+        resample = Image.Resampling[PREVIEW_RESAMPLE]
+        preview = self.pyramid.render_region(self.viewport.scale, box, resample, decode=False)
+        return ImageTk.PhotoImage(preview), False
+    
+    def schedule_render(self):
+        """Render once the pending input events are handled, using only the latest view."""
+        if self.render_after_id is None:
+            self.render_after_id = self.root.after_idle(self.flush_render)
+    
+    def flush_render(self):
+        """Draw the view requested by the most recent zoom event."""
+        self.render_after_id = None
+        self.display_image()
+        self.refresh_saved_dots()
+    
+    @profiled
+    def poll_render_results(self):
+        """Swap finished full-quality tiles in place of their previews."""
+        from PIL import ImageTk
+        self.poll_after_id = None
+        error = None
+        
+        while True:
+            try:
+                generation, key, image, render_error = self.render_worker.results.get_nowait()
+            except queue.Empty:
+                break
+            if generation != self.render_generation:
+                continue
+            if render_error is not None:
+                # The preview stays on screen; stop waiting for this tile
+                error = render_error
+                self.preview_keys.discard(key)
+                continue
+            
+            photo = ImageTk.PhotoImage(image)
+            self.tile_cache[key] = photo
+            if key in self.tile_items:
+                item = self.tile_items[key][0]
+                self.canvas.itemconfig(item, image=photo)
+                self.tile_items[key] = (item, photo)
+            self.preview_keys.discard(key)
+        
+        self.trim_tile_cache()
+        self.session.enforce_budget()
+        if error is not None:
+            print(f"Error rendering image: {error}")
+            self.coord_var.set(f"Error rendering image: {error}")
+        elif not self.mouse_inside_image:
+            self.update_image_status()
+        if self.preview_keys:
+            self.poll_after_id = self.root.after(RENDER_POLL_MS, self.poll_render_results)
+    
+    def trim_tile_cache(self):
+        """Evict least recently used tiles beyond a couple of viewports' worth."""
+        # Memory stays bounded by the viewport, not by zoom x image size
+        capacity = max(MIN_TILE_CACHE, 2 * len(self.tile_items))
+        while len(self.tile_cache) > capacity:
+            self.tile_cache.popitem(last=False)
+    
+    def update_view_scale(self):
+        """Recompute the display transform from the canvas size and zoom factor."""
+        self.viewport.set_canvas(*self.get_canvas_size())
+        if self.viewport.update():
+            self.preview_keys.clear()
+            self.render_generation += 1
+        self.sync_overlay()
+    
+    def sync_overlay(self):
+        """Move and scale the dots from the view they were drawn for to the current one."""
+        scale, offset_x, offset_y = view = self.viewport.scale, self.viewport.offset_x, self.viewport.offset_y
+        if self.overlay_view is not None and self.overlay_view != view:
+            old_scale, old_x, old_y = self.overlay_view
+            ratio = scale / old_scale
+            self.canvas.scale("overlay", old_x, old_y, ratio, ratio)
+            self.canvas.move("overlay", offset_x - old_x, offset_y - old_y)
+        self.overlay_view = view
+    
+    def on_canvas_resize(self, event):
+        """Refit the image to the new canvas size."""
+        if self.image is not None:
+            self.schedule_render()
+    
+    @profiled
+    def display_image(self):
+        """Display the tiles of the image that intersect the visible canvas area."""
+        if self.image is None:
+            return
         
-        self.canvas_image = self.canvas.create_image(
-            x, y,
-            image=self.photo_image,
-            anchor="nw"
+        self.update_view_scale()
+        scale = self.viewport.scale
+        level_index = self.pyramid.level_for_scale(scale)
+        self.pyramid.release(level_index)
+        self.image = self.pyramid.get_level(self.pyramid.decoded_level_for_scale(scale))
+        
+        visible = {(scale, tile_x, tile_y) for tile_x, tile_y in self.viewport.visible_tiles()}
+        
+        # Drop tiles that scrolled out of view or belong to an old zoom, then
+        # add the newly exposed ones
+        for key in list(self.tile_items):
+            if key not in visible:
+                self.canvas.delete(self.tile_items.pop(key)[0])
+                self.preview_keys.discard(key)
+        
+        for key in sorted(visible):
+            if key in self.tile_items:
+                continue
+            _, tile_x, tile_y = key
+            photo, final = self.get_tile(tile_x, tile_y)
+            if not final:
+                self.preview_keys.add(key)
+            item = self.canvas.create_image(
+                self.viewport.offset_x + tile_x * TILE_SIZE,
+                self.viewport.offset_y + tile_y * TILE_SIZE,
+                image=photo,
+                anchor="nw",
+                tags=("view", "tile")
+            )
+            self.tile_items[key] = (item, photo)
+        self.canvas.tag_lower("tile")
+        self.trim_tile_cache()
+        
+        # Hand every tile still showing a preview to the worker, replacing stale work
+        jobs = [
+            (key, self.pyramid, scale, self.viewport.tile_box(key[1], key[2]))
+            for key in sorted(self.preview_keys)
+        ]
+        self.render_worker.submit(self.render_generation, jobs)
+        if jobs and self.poll_after_id is None:
+            self.poll_after_id = self.root.after(RENDER_POLL_MS, self.poll_render_results)
+        
+        self.update_image_status()
+    
+    def update_image_status(self):
+        """Show the image size, zoom and memory footprint."""
+        orig_width, orig_height = self.pyramid.size
+        zoom_percent = int(self.viewport.zoom_factor * 100)
+        memory_mb = self.get_image_memory() / (1024 * 1024)
+        images = f" for {len(self.session)} images" if len(self.session) > 1 else ""
+        self.coord_var.set(
+            f"Image loaded ({orig_width}x{orig_height}) - Zoom: {zoom_percent}% - Memory: {memory_mb:.0f} MB{images}"
         )
-        
-        self.image_offset_x = x
-        self.image_offset_y = y
-        
-        zoom_percent = int(self.zoom_factor * 100)
-        self.coord_var.set(f"Image loaded ({orig_width}x{orig_height}) - Zoom: {zoom_percent}%")
+    
+    def get_image_memory(self):
+        """Approximate bytes held for images: decoded pyramid levels of every open image plus rendered tiles."""
+        tiles = len(self.tile_cache) + len(self.preview_keys)
+        return self.session.memory_bytes() + tiles * TILE_SIZE * TILE_SIZE * 4
     
     def on_mouse_leave(self, event):
         """Handle mouse leaving the canvas."""
@@ -676,25 +1742,52 @@ class ImageXYReader:
             self.coord_var.set("Outside image bounds")
     
     def on_mouse_move(self, event):
-        """Handle mouse motion to display coordinates."""
-        if self.image is None or self.original_image is None:
+        """Track the pointer; the coordinate display is updated once per frame."""
+        if self.image is None:
             return
         
+        # Kept current on every event so dot placement uses the exact position
         self.mouse_x = event.x
         self.mouse_y = event.y
+        self.mouse_inside_image = self.viewport.contains(event.x, event.y)
         
-        pixel_x = event.x - self.image_offset_x
-        pixel_y = event.y - self.image_offset_y
+        self.event_counts["motion"] += 1
+        if self.motion_after_id is None:
+            self.motion_after_id = self.root.after(MOTION_FRAME_MS, self.flush_mouse_move)
+        else:
+            self.event_counts["motion_dropped"] += 1
+    
+    @profiled
+    def flush_mouse_move(self):
+        """Show the coordinates under the latest pointer position."""
+        self.motion_after_id = None
+        if self.image is None:
+            return
         
-        if (0 <= pixel_x < self.photo_image.width() and 
-            0 <= pixel_y < self.photo_image.height()):
-            self.mouse_inside_image = True
-            orig_x = int(pixel_x * self.scale_x)
-            orig_y = int(pixel_y * self.scale_y)
+        if self.mouse_inside_image:
+            orig_x, orig_y = self.viewport.to_original(self.mouse_x, self.mouse_y)
             if not self.drag_mode:
-                self.coord_var.set(f"X: {orig_x}  Y: {orig_y}")
+                text = f"X: {orig_x}  Y: {orig_y}"
+                calibration = self.calibrations.get(self.session.current_name)
+                if calibration is not None:
+                    u, v = calibration.to_data(orig_x, orig_y)
+                    text += f"  →  u: {u:.4g}  v: {v:.4g}"
+                    origin = self.draft.points.get("origin")
+                    if origin is not None:
+                        # Polar position from the origin: radius and angle in data units
+                        origin_u, origin_v = calibration.to_data(*origin)
+                        radius = math.hypot(u - origin_u, v - origin_v)
+                        angle = math.degrees(math.atan2(v - origin_v, u - origin_u))
+                        text += f"  r: {radius:.4g}  θ: {angle:.1f}°"
+                if self.show_all_groups:
+                    nearest = self.history.spatial_index.nearest(
+                        orig_x, orig_y, HOVER_DISTANCE / self.viewport.scale, self.session.current_name
+                    )
+                    if nearest is not None:
+                        _, point_x, point_y, (name, key) = nearest
+                        text += f"  |  {name} {key} ({point_x}, {point_y})"
+                self.coord_var.set(text)
         else:
-            self.mouse_inside_image = False
             if not self.drag_mode:
                 self.coord_var.set("Outside image bounds")
     
@@ -706,68 +1799,64 @@ class ImageXYReader:
             self.drag_start_y = event.y
             return
         
-        if self.image is None or self.original_image is None:
+        if self.image is None:
             print("No image loaded")
             return
         
-        pixel_x = event.x - self.image_offset_x
-        pixel_y = event.y - self.image_offset_y
-        
-        if (0 <= pixel_x < self.photo_image.width() and 
-            0 <= pixel_y < self.photo_image.height()):
-            orig_x = int(pixel_x * self.scale_x)
-            orig_y = int(pixel_y * self.scale_y)
+        if self.viewport.contains(event.x, event.y):
+            orig_x, orig_y = self.viewport.to_original(event.x, event.y)
+            if self.calibrate_mode:
+                self.add_calibration_reference(orig_x, orig_y)
+                return
             print(f"Clicked at: X={orig_x}, Y={orig_y}")
         else:
             print("Click outside image bounds")
     
     def on_mouse_drag(self, event):
-        """Handle mouse drag to move the image."""
+        """Accumulate the drag; the image is moved once per frame."""
         if not self.drag_mode or self.image is None:
             return
         
-        # Calculate drag offset
-        dx = event.x - self.drag_start_x
-        dy = event.y - self.drag_start_y
-        
-        # Update image position
-        self.image_offset_x += dx
-        self.image_offset_y += dy
-        
-        # Redraw image at new position
-        self.canvas.coords(self.canvas_image, self.image_offset_x, self.image_offset_y)
-        
-        # Delete old dots before redrawing
-        if self.origin_dot:
-            self.canvas.delete(self.origin_dot)
-            self.origin_dot = None
-        if self.red_dot:
-            self.canvas.delete(self.red_dot)
-            self.red_dot = None
-        if self.blue_dot:
-            self.canvas.delete(self.blue_dot)
-            self.blue_dot = None
-        if self.black_dot:
-            self.canvas.delete(self.black_dot)
-            self.black_dot = None
-        
-        # Redraw dots at new positions
-        self.redraw_all_dots()
-        
-        # Update drag start position
+        self.drag_dx += event.x - self.drag_start_x
+        self.drag_dy += event.y - self.drag_start_y
         self.drag_start_x = event.x
         self.drag_start_y = event.y
         
-        self.coord_var.set("Dragging image...")
+        self.event_counts["drag"] += 1
+        if self.drag_after_id is None:
+            self.drag_after_id = self.root.after(MOTION_FRAME_MS, self.flush_drag)
+            self.coord_var.set("Dragging image...")
+        else:
+            self.event_counts["drag_dropped"] += 1
+    
+    @profiled
+    def flush_drag(self):
+        """Move the image by the drag distance gathered since the last frame."""
+        self.drag_after_id = None
+        dx, dy = self.drag_dx, self.drag_dy
+        self.drag_dx = self.drag_dy = 0
+        if (dx or dy) and self.image is not None:
+            # Update image position
+            self.viewport.pan(dx, dy)
+            
+            # Move the tiles, then fill in tiles that scrolled into view; the
+            # dots follow when the view is rendered
+            self.canvas.move("tile", dx, dy)
+            self.display_image()
     
     def on_mouse_release(self, event):
         """Handle mouse button release."""
         if self.drag_mode:
+            # Apply the last partial frame of the drag straight away
+            if self.drag_after_id is not None:
+                self.root.after_cancel(self.drag_after_id)
+            self.flush_drag()
             self.coord_var.set("Drag mode active")
+            self.refresh_saved_dots()
     
-    def place_dot(self, color):
-        """Place a colored dot at the current mouse position."""
-        if self.image is None or self.original_image is None:
+    def place_dot(self, key):
+        """Place the dot of a series at the current mouse position."""
+        if self.image is None:
             return
         
         if self.drag_mode:
@@ -777,59 +1866,18 @@ class ImageXYReader:
         if not self.mouse_inside_image:
             return  # Don't place dots outside image
         
-        pixel_x = self.mouse_x - self.image_offset_x
-        pixel_y = self.mouse_y - self.image_offset_y
-        
-        if (0 <= pixel_x < self.photo_image.width() and 
-            0 <= pixel_y < self.photo_image.height()):
-            orig_x = int(pixel_x * self.scale_x)
-            orig_y = int(pixel_y * self.scale_y)
+        if self.viewport.contains(self.mouse_x, self.mouse_y):
+            orig_x, orig_y = self.viewport.to_original(self.mouse_x, self.mouse_y)
             
-            # Remove existing dot
-            if color == "green":  # Origin
-                if self.origin_dot is not None:
-                    self.canvas.delete(self.origin_dot)
-            elif color == "red":
-                if self.red_dot is not None:
-                    self.canvas.delete(self.red_dot)
-            elif color == "blue":
-                if self.blue_dot is not None:
-                    self.canvas.delete(self.blue_dot)
-            elif color == "black":
-                if self.black_dot is not None:
-                    self.canvas.delete(self.black_dot)
+            # Replace the existing dot of this series
+            self.canvas.delete(f"active&&dot:{key}")
+            self.draw_dot(self.mouse_x, self.mouse_y, series_color(key), ("active", f"dot:{key}"))
             
-            # Draw new dot
-            dot_radius = 4
-            x1 = self.mouse_x - dot_radius
-            y1 = self.mouse_y - dot_radius
-            x2 = self.mouse_x + dot_radius
-            y2 = self.mouse_y + dot_radius
-            
-            new_dot = self.canvas.create_oval(
-                x1, y1, x2, y2,
-                fill=color,
-                outline="white",
-                width=2
-            )
-            
-            # Store the dot
-            if color == "green":  # Origin
-                self.origin_dot = new_dot
-                self.origin_coords = (orig_x, orig_y)
-                print(f"Origin ({orig_x}, {orig_y})")
-            elif color == "red":
-                self.red_dot = new_dot
-                self.red_dot_coords = (orig_x, orig_y)
-                print(f"Red dot ({orig_x}, {orig_y})")
-            elif color == "blue":
-                self.blue_dot = new_dot
-                self.blue_dot_coords = (orig_x, orig_y)
-                print(f"Blue dot ({orig_x}, {orig_y})")
-            elif color == "black":
-                self.black_dot = new_dot
-                self.black_dot_coords = (orig_x, orig_y)
-                print(f"Black dot ({orig_x}, {orig_y})")
+            # Store the coordinates
+            self.draft.set(key, orig_x, orig_y)
+            # Origin, then "Red dot", "Blue dot" and so on for the series
+            label = "Origin" if key == "origin" else f"{key.capitalize()} dot"
+            print(f"{label} ({orig_x}, {orig_y})")
             
             # Update display
             self.update_current_coords_display()
@@ -848,57 +1896,169 @@ class ImageXYReader:
     
     def on_key_4(self, event):
         """Handle key 4 - place origin (green) dot."""
-        self.place_dot("green")
+        self.place_dot("origin")
     
     def on_mouse_wheel(self, event):
         """Handle mouse wheel to zoom in/out."""
-        if self.image is None or self.original_image is None:
+        if self.image is None:
             return
         
         if event.num == 5 or event.delta < 0:
-            self.zoom_factor *= 0.9
+            steps = -1
         elif event.num == 4 or event.delta > 0:
-            self.zoom_factor *= 1.1
+            steps = 1
+        else:
+            return
         
-        self.zoom_factor = max(0.1, min(3.0, self.zoom_factor))
+        # Keep the image point under the pointer fixed while zooming; the dots
+        # follow immediately and the tiles catch up on the next render
+        self.viewport.set_canvas(*self.get_canvas_size())
+        self.viewport.zoom_at(event.x, event.y, steps)
+        self.update_view_scale()
         
-        self.display_image()
-        self.redraw_all_dots()
+        # A burst of wheel events renders once, at the final zoom
+        self.schedule_render()
+    
+    def get_dot_image(self, color, radius=DOT_RADIUS):
+        """Return the dot image shared by every dot of the given color and size."""
+        photo = self.dot_images.get((color, radius))
+        if photo is None:
+            from PIL import Image, ImageDraw, ImageTk
+            size = 2 * radius + 2
+            image = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+            ImageDraw.Draw(image).ellipse((0, 0, size - 1, size - 1), fill=color, outline="white", width=2)
+            photo = ImageTk.PhotoImage(image)
+            self.dot_images[(color, radius)] = photo
+        return photo
     
+    def draw_dot(self, x, y, color, tags=(), radius=DOT_RADIUS):
+        """Draw a dot centered on canvas position (x, y) in the overlay layer."""
+        return self.canvas.create_image(
+            x, y,
+            image=self.get_dot_image(color, radius),
+            anchor="center",
+            tags=("view", "overlay") + tuple(tags)
+        )
+    
+    @profiled
     def redraw_all_dots(self):
         """Redraw all dots after zoom or image change."""
-        def redraw_dot_at_coords(color, coords, dot_attr_name):
-            if coords is None:
-                return
-            orig_x, orig_y = coords
-            display_x = int(orig_x / self.scale_x) + self.image_offset_x
-            display_y = int(orig_y / self.scale_y) + self.image_offset_y
-            
-            dot_radius = 4
-            x1 = display_x - dot_radius
-            y1 = display_y - dot_radius
-            x2 = display_x + dot_radius
-            y2 = display_y + dot_radius
-            
-            new_dot = self.canvas.create_oval(
-                x1, y1, x2, y2,
-                fill=color,
-                outline="white",
-                width=2
-            )
-            
-            setattr(self, dot_attr_name, new_dot)
+        self.sync_overlay()
+        self.canvas.delete("active")
+        self.canvas.delete("calibration")
+        
+        for key, point in self.draft.points.items():
+            if point is not None:
+                display_x, display_y = self.viewport.to_canvas(*point)
+                self.draw_dot(display_x, display_y, series_color(key), ("active", f"dot:{key}"))
+        
+        # Reference points go where the fitted calibration maps their data
+        # coordinates, so a poor fit shows as markers off their clicked spots
+        calibration = self.calibrations.get(self.session.current_name)
+        for point, data in self.calibration_refs.get(self.session.current_name, ()):
+            if calibration is not None:
+                point = calibration.to_image(*data)
+            display_x, display_y = self.viewport.to_canvas(*point)
+            self.draw_dot(display_x, display_y, CALIBRATION_COLOR, ("calibration",))
+    
+    @profiled
+    def refresh_saved_dots(self):
+        """Draw the saved points inside the view, reusing dots that are already there."""
+        if not self.show_all_groups or self.image is None:
+            self.canvas.delete("saved")
+            self.saved_dot_items.clear()
+            return
         
-        redraw_dot_at_coords("green", self.origin_coords, "origin_dot")
-        redraw_dot_at_coords("red", self.red_dot_coords, "red_dot")
-        redraw_dot_at_coords("blue", self.blue_dot_coords, "blue_dot")
-        redraw_dot_at_coords("black", self.black_dot_coords, "black_dot")
+        np = numpy()
+        self.viewport.set_canvas(*self.get_canvas_size())
+        self.sync_overlay()
+        x0, y0, x1, y1 = self.viewport.original_rect()
+        
+        index = self.history.spatial_index
+        found = index.query(x0, y0, x1, y1, self.session.current_name)
+        display_x, display_y = self.viewport.to_canvas(index.x[found], index.y[found])
+        
+        # Keep at most one dot per series in each dot-sized screen cell
+        cell = 2 * SAVED_DOT_RADIUS + 2
+        cell_x = (display_x // cell).astype(np.int64) + 1
+        cell_y = (display_y // cell).astype(np.int64) + 1
+        rows = self.viewport.canvas_height // cell + 3
+        slots = (cell_x * rows + cell_y) * len(index.series) + index.code[found]
+        _, first = np.unique(slots, return_index=True)
+        
+        colors = [series_color(key) for key in index.series]
+        wanted = {}
+        for i, x, y in zip(found[first].tolist(), display_x[first].tolist(), display_y[first].tolist()):
+            key = index.key(i)
+            wanted[key] = (x, y, colors[index.code[i]])
+        
+        for key in list(self.saved_dot_items):
+            if key not in wanted:
+                self.canvas.delete(self.saved_dot_items.pop(key))
+        
+        for key, (display_x, display_y, color) in wanted.items():
+            if key not in self.saved_dot_items:
+                self.saved_dot_items[key] = self.draw_dot(
+                    display_x, display_y, color, ("saved",), radius=SAVED_DOT_RADIUS
+                )
+        
+        # The group being edited stays on top of the saved ones
+        self.canvas.tag_raise("active")
+
+
+def series_color(key):
+    """Return the dot color of a series."""
+    color = GROUP_COLORS.get(key)
+    if color is None:
+        color = EXTRA_COLORS[zlib.crc32(key.encode("utf-8")) % len(EXTRA_COLORS)]
+    return color
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Digitize coordinates from Florence Nightingale's rose diagram.")
+    parser.add_argument(
+        "--history",
+        default="coordinate_groups_history.json",
+        help="history file; a .db or .sqlite file uses the SQLite store"
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="write hot-path latency histograms and counters to this JSON file on exit"
+    )
+    parser.add_argument(
+        "--startup-profile",
+        action="store_true",
+        help="print how long the window took to appear and the history to load"
+    )
+    parser.add_argument(
+        "--image-memory",
+        type=int,
+        default=DEFAULT_IMAGE_BUDGET // (1024 * 1024),
+        metavar="MB",
+        help="memory for the decoded images of all open images (default: %(default)s MB)"
+    )
+    args = parser.parse_args()
+    
+    imported = time.perf_counter()
     root = tk.Tk()
-    app = ImageXYReader(root)
+    root_created = time.perf_counter()
+    app = ImageXYReader(
+        root,
+        history_file=args.history,
+        image_budget=args.image_memory * 1024 * 1024,
+        startup_profile=args.startup_profile
+    )
+    app.profiler.mark("imports", imported)
+    app.profiler.mark("tk_root", root_created)
     root.mainloop()
+    
+    if args.profile:
+        app.dump_profile(args.profile)
+    try:
+        app.history.close()
+    except Exception as e:
+        print(f"Error saving history: {e}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,309 @@
+"""
+Benchmarks for the headless core: zoom rendering, the canvas -> original
+transform, pixel -> data calibration, history save/flush/load, history refresh,
+and JSON against columnar exports.
+
+Runs without a display against a synthetic image and synthetic histories.
+Each run is appended to benchmarks/results.jsonl with the git commit, and the
+numbers are printed next to the previous run with the same settings, so
+slowdowns show up from one version to the next.
+
+    python benchmarks/bench_core.py --groups 100000
+    python benchmarks/bench_core.py --groups 1000000 --image-size 20000x15000
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from calibration import Calibration  # noqa: E402
+from group_storage import ColumnarGroups, new_group_id, write_groups_columnar, write_groups_json  # noqa: E402
+from nightingale_core import GroupHistory, ImagePyramid, Viewport  # noqa: E402
+
+
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.jsonl")
+CANVAS_SIZE = (1200, 800)
+ZOOM_LEVELS = (0, 8, 16, 24, 31)  # Zoom steps: 100% up to about 1900%
+TRANSFORM_CALLS = 200000
+CALIBRATION_POINTS = 1000000
+IMPORT_BATCH_SIZE = 2000
+SAVE_SAMPLES = 200
+REFRESH_ROWS = 40
+
+
+def best_of(fn, repeat=5):
+    """Return the fastest of repeat calls of fn, in milliseconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def synthetic_image(width, height):
+    """Return an RGB image with detail at every scale, so resampling does real work."""
+    gradient = Image.linear_gradient("L").resize((width, height))
+    rings = Image.radial_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width // 4, height // 4), 64).resize((width, height))
+    return Image.merge("RGB", (gradient, rings, noise))
+
+
+def synthetic_groups(count, seed=0):
+    rng = random.Random(seed)
+    groups = []
+    for i in range(count):
+        group = {"name": f"diagram {i // 24} month {i % 12 + 1} {'left' if i % 24 < 12 else 'right'}"}
+        for key in ("origin", "red", "blue", "black"):
+            group[key] = (rng.randrange(20000), rng.randrange(15000))
+        group["timestamp"] = f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d} 12:00:00"
+        groups.append(group)
+    return groups
+
+
+def bench_render(image_size):
+    """Time rendering every visible tile at several zoom levels, from a fresh pyramid."""
+    image = synthetic_image(*image_size)
+    start = time.perf_counter()
+    pyramid = ImagePyramid(image)
+    results = {"pyramid_build_ms": (time.perf_counter() - start) * 1000}
+
+    viewport = Viewport(pyramid.size, CANVAS_SIZE)
+    viewport.center()
+    for steps in ZOOM_LEVELS:
+        viewport.zoom_at(CANVAS_SIZE[0] / 2, CANVAS_SIZE[1] / 2, steps - viewport.zoom_steps)
+        viewport.update()
+        start = time.perf_counter()
+        for tile_x, tile_y in viewport.visible_tiles():
+            pyramid.render_region(viewport.scale, viewport.tile_box(tile_x, tile_y))
+        results[f"zoom_render_ms@{round(viewport.zoom_factor * 100)}%"] = (time.perf_counter() - start) * 1000
+    return results
+
+
+def bench_transform(image_size):
+    """Throughput of the canvas -> original and original -> canvas transforms."""
+    viewport = Viewport(image_size, CANVAS_SIZE)
+    viewport.zoom_at(300, 200, 12)
+    viewport.update()
+    points = [(i % CANVAS_SIZE[0], i % CANVAS_SIZE[1]) for i in range(TRANSFORM_CALLS)]
+
+    def to_original():
+        for x, y in points:
+            viewport.to_original(x, y)
+
+    def to_canvas():
+        for x, y in points:
+            viewport.to_canvas(x, y)
+
+    return {
+        "to_original_per_s": TRANSFORM_CALLS / best_of(to_original, 3) * 1000,
+        "to_canvas_per_s": TRANSFORM_CALLS / best_of(to_canvas, 3) * 1000,
+    }
+
+
+def bench_calibration(image_size):
+    """Fit calibrations and convert a bulk export's worth of points, and single hover positions."""
+    width, height = image_size
+    rng = np.random.default_rng(0)
+    image = rng.uniform(0, 1, (6, 2)) * image_size
+    data = np.column_stack([image[:, 0] / width * 12, (height - image[:, 1]) / height * 1000])
+    references = list(zip(image.tolist(), data.tolist()))
+    points = rng.uniform(0, 1, (CALIBRATION_POINTS, 2)) * image_size
+
+    results = {}
+    for kind in ("affine", "homography"):
+        results[f"{kind}_fit_ms"] = best_of(lambda: Calibration.fit(references, kind))
+        calibration = Calibration.fit(references, kind)
+        results[f"{kind}_apply_1m_ms"] = best_of(lambda: calibration.apply(points), 3)
+
+    def to_data():
+        for x, y in points[:TRANSFORM_CALLS].tolist():
+            calibration.to_data(x, y)
+
+    results["to_data_per_s"] = TRANSFORM_CALLS / best_of(to_data, 3) * 1000
+    return results
+
+
+def bench_history(groups, extension, directory):
+    """Time a bulk import, single saves, a reload and history refreshes for one backend."""
+    label = extension.lstrip(".")
+    path = os.path.join(directory, f"history{extension}")
+    results = {}
+
+    history = GroupHistory(path)
+    history.load()
+    start = time.perf_counter()
+    for offset in range(0, len(groups), IMPORT_BATCH_SIZE):
+        history.import_batch([dict(group) for group in groups[offset:offset + IMPORT_BATCH_SIZE]])
+    history.flush()
+    results[f"{label}_import_s"] = time.perf_counter() - start
+
+    extra = synthetic_groups(SAVE_SAMPLES, seed=1)
+    start = time.perf_counter()
+    for group in extra:
+        group["id"] = new_group_id()
+        history.add(group)
+    results[f"{label}_save_ms"] = (time.perf_counter() - start) * 1000 / SAVE_SAMPLES
+    # The app writes a burst of saves together; this is the cost of that write
+    start = time.perf_counter()
+    history.flush()
+    results[f"{label}_flush_ms"] = (time.perf_counter() - start) * 1000
+    history.close()
+
+    history = GroupHistory(path)
+    start = time.perf_counter()
+    history.load()
+    results[f"{label}_load_s"] = time.perf_counter() - start
+
+    # What a scroll or a keystroke in the search box costs once loaded
+    middle = history.count() // 2
+    results[f"{label}_page_ms"] = best_of(lambda: history.page(middle, REFRESH_ROWS))
+    results[f"{label}_search_ms"] = best_of(
+        lambda: history.get_many(history.search_index.search("month 12").page(0, REFRESH_ROWS))
+    )
+    results[f"{label}_search_broad_ms"] = best_of(lambda: len(history.search_index.search("diagram")))
+    results[f"{label}_cull_ms"] = best_of(lambda: len(history.spatial_index.query(0, 0, 20000, 15000)))
+    # A zoomed-in view, and the hover lookup run once per pointer frame
+    results[f"{label}_cull_view_ms"] = best_of(lambda: len(history.spatial_index.query(9600, 7250, 10400, 7750)))
+    results[f"{label}_hover_ms"] = best_of(lambda: history.spatial_index.nearest(10000, 7500, 12))
+    history.close()
+    return results
+
+
+def bench_export(groups, directory):
+    """Time writing and reading an export as JSON and as columnar .ngc, and compare their sizes."""
+    groups = [dict(group, id=new_group_id()) for group in groups]
+    json_path = os.path.join(directory, "export.json")
+    columnar_path = os.path.join(directory, "export.ngc")
+    results = {
+        "json_write_ms": best_of(lambda: write_groups_json(json_path, groups), 3),
+        "ngc_write_ms": best_of(lambda: write_groups_columnar(columnar_path, groups), 3),
+        "json_mb": os.path.getsize(json_path) / (1024 * 1024),
+        "ngc_mb": os.path.getsize(columnar_path) / (1024 * 1024),
+    }
+
+    def read_json():
+        with open(json_path, 'r') as f:
+            return json.load(f)
+
+    def read_points():
+        with ColumnarGroups(columnar_path) as groups:
+            return np.nanmean(groups.coords, axis=0)
+
+    def read_columnar():
+        with ColumnarGroups(columnar_path) as groups:
+            return list(groups)
+
+    results["json_read_ms"] = best_of(read_json, 3)
+    # What analysis code pays to reach every point, and the app to import group dicts
+    results["ngc_points_ms"] = best_of(read_points, 3)
+    results["ngc_read_ms"] = best_of(read_columnar, 3)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_run(path, settings):
+    """Return the results of the last recorded run with the same settings, or None."""
+    if not os.path.exists(path):
+        return None
+    previous = None
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                run = json.loads(line)
+            except ValueError:
+                continue
+            if run.get("settings") == settings:
+                previous = run
+    return previous
+
+
+def report(results, previous):
+    if previous:
+        print(f"Compared with {previous.get('commit')} ({previous.get('timestamp')})")
+    for name, value in results.items():
+        line = f"  {name:28} {value:14.3f}"
+        before = (previous or {}).get("results", {}).get(name)
+        if before:
+            # Rates are better when higher, everything else when lower
+            change = (value - before) / before * 100
+            better = change > 0 if name.endswith("_per_s") else change < 0
+            line += f"  {before:14.3f}  {change:+6.1f}% {'better' if better else 'worse'}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the headless core of the digitization app")
+    parser.add_argument("--groups", type=int, default=100000,
+                        help="number of synthetic groups in the history (default: 100000)")
+    parser.add_argument("--image-size", default="8000x6000",
+                        help="synthetic image size as WIDTHxHEIGHT (default: 8000x6000)")
+    parser.add_argument("--only", choices=("render", "transform", "calibrate", "history", "export"), action="append",
+                        help="run only these benchmarks (repeatable)")
+    parser.add_argument("--results", default=RESULTS_FILE,
+                        help="JSON lines file the run is appended to (default: benchmarks/results.jsonl)")
+    parser.add_argument("--no-record", action="store_true", help="do not append this run to the results file")
+    args = parser.parse_args()
+
+    try:
+        image_size = tuple(int(n) for n in args.image_size.lower().split("x"))
+        if len(image_size) != 2:
+            raise ValueError
+    except ValueError:
+        parser.error(f"Expected WIDTHxHEIGHT, got {args.image_size!r}")
+
+    only = set(args.only or ("render", "transform", "calibrate", "history", "export"))
+    results = {}
+    if "render" in only:
+        results.update(bench_render(image_size))
+    if "transform" in only:
+        results.update(bench_transform(image_size))
+    if "calibrate" in only:
+        results.update(bench_calibration(image_size))
+    if "history" in only:
+        groups = synthetic_groups(args.groups)
+        for extension in (".json", ".db"):
+            with tempfile.TemporaryDirectory() as directory:
+                results.update(bench_history(groups, extension, directory))
+    if "export" in only:
+        with tempfile.TemporaryDirectory() as directory:
+            results.update(bench_export(synthetic_groups(args.groups), directory))
+
+    settings = {"groups": args.groups, "image_size": list(image_size), "only": sorted(only)}
+    report(results, previous_run(args.results, settings))
+
+    if not args.no_record:
+        run = {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": sys.version.split()[0],
+            "settings": settings,
+            "results": results,
+        }
+        with open(args.results, 'a') as f:
+            f.write(json.dumps(run) + "\n")
+
+
+if __name__ == "__main__":
+    main()
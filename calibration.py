@@ -0,0 +1,182 @@
+"""
+Calibration from original-image pixels to data units.
+
+A Calibration is fitted from reference points, each an image position and the
+data coordinates it stands for. Three or more fit an affine transform (scale,
+rotation, shear and offset); four or more can fit a homography, which also
+undoes the perspective of a photographed page. Points are converted in
+batches with NumPy, or one at a time in plain Python for the hover readout.
+
+Calibrations are saved per image, keyed like the image tag of saved groups.
+"""
+
+import json
+import math
+
+from group_storage import numpy, write_json_atomic
+
+
+KINDS = ("affine", "homography")
+MIN_REFERENCES = {"affine": 3, "homography": 4}
+
+
+class Calibration:
+    """A fitted image -> data transform, as a 3x3 matrix on homogeneous coordinates, and its inverse."""
+
+    def __init__(self, matrix, kind="affine", references=()):
+        np = numpy()
+        self.matrix = np.asarray(matrix, dtype=float).reshape(3, 3)
+        self.inverse = np.linalg.inv(self.matrix)
+        self.kind = kind
+        self.references = [(tuple(image), tuple(data)) for image, data in references]
+        # Plain floats for to_data and to_image, which are called per pointer move
+        self._forward = tuple(self.matrix.ravel().tolist())
+        self._backward = tuple(self.inverse.ravel().tolist())
+
+    @classmethod
+    def fit(cls, references, kind="affine"):
+        """Fit a transform to ((x, y), (u, v)) reference pairs, least squares beyond the minimum."""
+        np = numpy()
+        if kind not in KINDS:
+            raise ValueError(f"Unknown calibration {kind!r}, expected one of {', '.join(KINDS)}")
+        if len(references) < MIN_REFERENCES[kind]:
+            raise ValueError(f"{kind.capitalize()} calibration needs at least {MIN_REFERENCES[kind]} reference points")
+        image = np.array([point for point, _ in references], dtype=float)
+        data = np.array([point for _, point in references], dtype=float)
+        if kind == "affine":
+            matrix = fit_affine(image, data)
+        else:
+            matrix = fit_homography(image, data)
+        return cls(matrix, kind, references)
+
+    def to_data(self, x, y):
+        """Return the data coordinates of one image position."""
+        a, b, c, d, e, f, g, h, i = self._forward
+        w = g * x + h * y + i
+        return (a * x + b * y + c) / w, (d * x + e * y + f) / w
+
+    def to_image(self, u, v):
+        """Return the image position of one point in data coordinates."""
+        a, b, c, d, e, f, g, h, i = self._backward
+        w = g * u + h * v + i
+        return (a * u + b * v + c) / w, (d * u + e * v + f) / w
+
+    def apply(self, points):
+        """Convert an (..., 2) array of image positions to data coordinates; NaN stays NaN."""
+        return transform(self.matrix, points)
+
+    def apply_inverse(self, points):
+        """Convert an (..., 2) array of data coordinates to image positions."""
+        return transform(self.inverse, points)
+
+    def residuals(self):
+        """Return how far each reference lands from its data coordinates, in data units."""
+        np = numpy()
+        if not self.references:
+            return np.empty(0)
+        image = np.array([point for point, _ in self.references], dtype=float)
+        data = np.array([point for _, point in self.references], dtype=float)
+        return np.hypot(*(self.apply(image) - data).T)
+
+    def rms_error(self):
+        np = numpy()
+        errors = self.residuals()
+        return math.sqrt(float(np.mean(errors ** 2))) if len(errors) else 0.0
+
+    def to_dict(self):
+        return {
+            "kind": self.kind,
+            "matrix": self.matrix.tolist(),
+            "references": [[list(image), list(data)] for image, data in self.references],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["matrix"], data.get("kind", "affine"), data.get("references", ()))
+
+
+def transform(matrix, points):
+    """Apply a 3x3 homogeneous matrix to an (..., 2) array of points."""
+    np = numpy()
+    points = np.asarray(points, dtype=float)
+    linear = matrix[:2, :2]
+    out = points @ linear.T + matrix[:2, 2]
+    if matrix[2, 0] or matrix[2, 1] or matrix[2, 2] != 1:
+        w = points @ matrix[2, :2] + matrix[2, 2]
+        out /= w[..., None]
+    return out
+
+
+def fit_affine(image, data):
+    """Return the least-squares affine matrix taking (n, 2) image points to data points."""
+    np = numpy()
+    design = np.column_stack([image, np.ones(len(image))])
+    solution, _, rank, _ = np.linalg.lstsq(design, data, rcond=None)
+    if rank < 3:
+        raise ValueError("Reference points must not all lie on one line")
+    return np.vstack([solution.T, [0.0, 0.0, 1.0]])
+
+
+def normalizing_matrix(points):
+    """Return the similarity moving points to their centroid with a mean distance of sqrt(2)."""
+    np = numpy()
+    center = points.mean(axis=0)
+    spread = np.mean(np.hypot(*(points - center).T))
+    if spread == 0:
+        raise ValueError("Reference points must be at different positions")
+    scale = math.sqrt(2) / spread
+    return np.array([[scale, 0, -scale * center[0]], [0, scale, -scale * center[1]], [0, 0, 1]])
+
+
+def fit_homography(image, data):
+    """Return the homography taking (n, 2) image points to data points (normalized DLT)."""
+    np = numpy()
+    image_norm = normalizing_matrix(image)
+    data_norm = normalizing_matrix(data)
+    src = transform(image_norm, image)
+    dst = transform(data_norm, data)
+
+    rows = np.zeros((2 * len(src), 9))
+    x, y = src[:, 0], src[:, 1]
+    u, v = dst[:, 0], dst[:, 1]
+    rows[0::2, 0:3] = np.column_stack([-x, -y, -np.ones(len(x))])
+    rows[0::2, 6:9] = np.column_stack([u * x, u * y, u])
+    rows[1::2, 3:6] = np.column_stack([-x, -y, -np.ones(len(x))])
+    rows[1::2, 6:9] = np.column_stack([v * x, v * y, v])
+    _, singular, vt = np.linalg.svd(rows)
+    if singular[min(7, len(singular) - 1)] < 1e-12 * singular[0]:
+        raise ValueError("Reference points must not have three on one line")
+
+    matrix = np.linalg.inv(data_norm) @ vt[-1].reshape(3, 3) @ image_norm
+    return matrix / matrix[2, 2]
+
+
+def apply_by_image(points, images, calibrations):
+    """Convert (n, 2) image positions with the calibration of each row's image.
+
+    With a single calibration, groups not tagged with any image use it too.
+    """
+    np = numpy()
+    single = next(iter(calibrations.values())) if len(calibrations) == 1 else None
+    points = np.asarray(points, dtype=float)
+    images = np.asarray([image or "" for image in images], dtype=object)
+    out = np.empty_like(points)
+    for image in set(images.tolist()):
+        calibration = calibrations.get(image) or (single if not image else None)
+        if calibration is None:
+            raise ValueError(f"No calibration for image {image!r}" if image else
+                             "Groups without an image need a calibration file with a single calibration")
+        rows = images == image
+        out[rows] = calibration.apply(points[rows])
+    return out
+
+
+def load_calibrations(path):
+    """Return the {image key: Calibration} saved in a calibration file."""
+    with open(path, 'r') as f:
+        data = json.load(f)
+    return {key: Calibration.from_dict(value) for key, value in data["images"].items()}
+
+
+def save_calibrations(path, calibrations):
+    write_json_atomic(path, {"images": {key: calibration.to_dict() for key, calibration in calibrations.items()}})
@@ -0,0 +1,275 @@
+"""
+Incremental exports: only the groups added, changed or deleted since the last export.
+
+Every group has a stable id and a content hash (group_hash). A full export
+records the id and hash of each group it wrote in an ExportManifest next to
+the history. A delta export compares the history's ids with the manifest,
+writes only the differences to a delta file and appends them to the
+manifest, so it costs in proportion to the changes, not to the history.
+
+A delta names the fingerprint of the export it applies to and of the result.
+The fingerprint is a sum of per-group digests, so it is updated from the
+changes alone. merge_delta applies a delta to that export, and diff_exports
+makes a delta between any two exports.
+
+    python export_delta.py merge coordinate_groups_export.json changes.delta.json -o merged.json
+    python export_delta.py diff old_export.json new_export.json -o changes.delta.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+
+from group_storage import (
+    ColumnarGroups, JSONArrayReader, group_hash, is_columnar, write_groups_columnar, write_groups_json,
+    write_json_atomic
+)
+
+
+DELTA_FORMAT = "nightingale-delta/1"
+
+# Fingerprints are sums of SHA-1 digests, modulo the digest size
+FINGERPRINT_BITS = 160
+
+
+def entry_digest(group_id, content_hash):
+    """Return the fingerprint contribution of one group."""
+    return int(hashlib.sha1(f"{group_id}:{content_hash}".encode("utf-8")).hexdigest(), 16)
+
+
+def fingerprint(hashes):
+    """Return the fingerprint of {group id: content hash}, as hex."""
+    total = sum(entry_digest(group_id, content_hash) for group_id, content_hash in hashes.items())
+    return format_fingerprint(total)
+
+
+def format_fingerprint(value):
+    return f"{value % (1 << FINGERPRINT_BITS):040x}"
+
+
+class ExportManifest:
+    """The id and content hash of every group as last exported, and their fingerprint.
+
+    Kept as JSON lines: a full export rewrites the file, and each delta export
+    appends its changes. Every line carries the fingerprint after it, so
+    loading does not hash anything. hashes is None until a full export has
+    been recorded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hashes = None  # Group id -> content hash
+        self.total = 0  # Sum of entry digests
+
+    @property
+    def fingerprint(self):
+        return format_fingerprint(self.total)
+
+    def load(self):
+        """Read the manifest, if there is one."""
+        self.hashes = None
+        self.total = 0
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # Torn last line: that delta was not recorded
+                if entry.get("full"):
+                    self.hashes = entry["groups"]
+                else:
+                    for group_id in entry["deleted"]:
+                        self.hashes.pop(group_id, None)
+                    self.hashes.update(entry["groups"])
+                self.total = int(entry["fingerprint"], 16)
+
+    def changes(self, group_ids):
+        """Return (ids not in the last export, ids exported but no longer in group_ids).
+
+        Saved groups are never edited in place, so a group whose id was
+        exported is unchanged and is not hashed again.
+        """
+        current = set(group_ids)
+        added = [group_id for group_id in group_ids if group_id not in self.hashes]
+        deleted = [group_id for group_id in self.hashes if group_id not in current]
+        return added, deleted
+
+    def record_full(self, hashes):
+        """Replace the manifest with the groups of a full export."""
+        self.hashes = {}
+        self.total = 0
+        self._apply(hashes, ())
+        write_json_lines(self.path, [{"full": True, "groups": hashes, "fingerprint": self.fingerprint}])
+
+    def record_delta(self, hashes, deleted):
+        """Append the changes of a delta export."""
+        entry = {"groups": hashes, "deleted": list(deleted), "fingerprint": self.fingerprint_after(hashes, deleted)}
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._apply(hashes, deleted)
+
+    def fingerprint_after(self, hashes, deleted):
+        """Return the fingerprint once hashes are added or changed and deleted removed."""
+        total = self.total
+        for group_id in deleted:
+            total -= entry_digest(group_id, self.hashes[group_id])
+        for group_id, content_hash in hashes.items():
+            if group_id in self.hashes:
+                total -= entry_digest(group_id, self.hashes[group_id])
+            total += entry_digest(group_id, content_hash)
+        return format_fingerprint(total)
+
+    def _apply(self, hashes, deleted):
+        for group_id in deleted:
+            content_hash = self.hashes.pop(group_id, None)
+            if content_hash is not None:
+                self.total -= entry_digest(group_id, content_hash)
+        for group_id, content_hash in hashes.items():
+            old_hash = self.hashes.get(group_id)
+            if old_hash is not None:
+                self.total -= entry_digest(group_id, old_hash)
+            self.hashes[group_id] = content_hash
+            self.total += entry_digest(group_id, content_hash)
+
+
+def write_json_lines(path, entries):
+    """Write JSON lines to a temporary file and rename it over path once it is on disk."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_export(path, groups):
+    """Write a JSON or columnar (.ngc) export; return {group id: content hash} of what was written."""
+    hashes = {}
+
+    def hashed():
+        for group in groups:
+            hashes[group["id"]] = group_hash(group)
+            yield group
+
+    if is_columnar(path):
+        write_groups_columnar(path, hashed())
+    else:
+        write_groups_json(path, hashed())
+    return hashes
+
+
+def read_export(path):
+    """Yield the groups of a JSON or columnar export."""
+    if is_columnar(path):
+        with ColumnarGroups(path) as groups:
+            yield from groups
+        return
+    with open(path, 'rb') as f:
+        yield from JSONArrayReader(f)
+
+
+def write_delta(path, manifest, groups, deleted):
+    """Write groups (added or changed) and deleted ids as a delta on the manifest, then record it there."""
+    hashes = {group["id"]: group_hash(group) for group in groups}
+    write_json_atomic(path, {
+        "format": DELTA_FORMAT,
+        "base": manifest.fingerprint,
+        "result": manifest.fingerprint_after(hashes, deleted),
+        "groups": list(groups),
+        "deleted": list(deleted),
+    })
+    manifest.record_delta(hashes, deleted)
+
+
+def load_delta(path):
+    with open(path, 'r') as f:
+        delta = json.load(f)
+    if not isinstance(delta, dict) or delta.get("format") != DELTA_FORMAT:
+        raise ValueError(f"{path} is not a delta export")
+    return delta
+
+
+def export_hashes(path):
+    """Return {group id: content hash} and the groups of an export, which must all have ids."""
+    hashes = {}
+    groups = []
+    for group in read_export(path):
+        if group.get("id") is None:
+            raise ValueError(f"{path} has groups without ids, which deltas cannot track")
+        hashes[group["id"]] = group_hash(group)
+        groups.append(group)
+    return hashes, groups
+
+
+def merge_delta(base_path, delta, output_path, check=True):
+    """Apply a delta to the export it was made against and write the result, JSON or .ngc by extension.
+
+    Changed groups keep their place; added ones go at the end. Returns
+    (changed, added, deleted) counts.
+    """
+    hashes, groups = export_hashes(base_path)
+    if check and fingerprint(hashes) != delta["base"]:
+        raise ValueError(f"The delta was not made against {base_path}; merge the deltas before it first")
+
+    updates = {group["id"]: group for group in delta["groups"]}
+    deleted = set(delta["deleted"])
+    merged = [updates.pop(group["id"], group) for group in groups if group["id"] not in deleted]
+    changed = len(delta["groups"]) - len(updates)
+    dropped = len(groups) - len(merged)  # Ids the delta deletes that the base does not have are not counted
+    merged.extend(updates.values())
+    if is_columnar(output_path):
+        write_groups_columnar(output_path, merged)
+    else:
+        write_groups_json(output_path, merged)
+    return changed, len(updates), dropped
+
+
+def diff_exports(old_path, new_path, output_path):
+    """Write the delta that turns one export into another; return (added or changed, deleted) counts."""
+    old_hashes, _ = export_hashes(old_path)
+    new_hashes, new_groups = export_hashes(new_path)
+    groups = [group for group in new_groups if old_hashes.get(group["id"]) != new_hashes[group["id"]]]
+    deleted = [group_id for group_id in old_hashes if group_id not in new_hashes]
+    write_json_atomic(output_path, {
+        "format": DELTA_FORMAT,
+        "base": fingerprint(old_hashes),
+        "result": fingerprint(new_hashes),
+        "groups": groups,
+        "deleted": deleted,
+    })
+    return len(groups), len(deleted)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge or make delta exports of coordinate groups")
+    commands = parser.add_subparsers(dest="command", required=True)
+    merge = commands.add_parser("merge", help="apply a delta to the export it was made against")
+    merge.add_argument("base", help="export the delta was made against (JSON or .ngc)")
+    merge.add_argument("delta", help="delta file exported by the app or made by diff")
+    merge.add_argument("-o", "--output", required=True, help="merged export to write (JSON or .ngc)")
+    merge.add_argument("--force", action="store_true", help="merge even if the base does not match the delta")
+    diff = commands.add_parser("diff", help="make the delta between two exports")
+    diff.add_argument("old", help="earlier export")
+    diff.add_argument("new", help="later export")
+    diff.add_argument("-o", "--output", required=True, help="delta file to write")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "merge":
+            changed, added, deleted = merge_delta(args.base, load_delta(args.delta), args.output, check=not args.force)
+            print(f"Merged into {args.output}: {added} added, {changed} changed, {deleted} deleted")
+        else:
+            groups, deleted = diff_exports(args.old, args.new, args.output)
+            print(f"Wrote {args.output}: {groups} added or changed, {deleted} deleted")
+    except (OSError, ValueError, KeyError) as e:
+        parser.exit(1, f"Error: {e}\n")
+
+
+if __name__ == "__main__":
+    main()
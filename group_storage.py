@@ -0,0 +1,1182 @@
+"""
+Storage backends for saved coordinate groups.
+
+Both stores expose the same methods, so ImageXYReader does not care which one
+it talks to:
+- JournalGroupStore keeps the groups in memory, column-wise in a GroupTable,
+  and persists every edit to an append-only JSONL journal next to a JSON snapshot.
+- SQLiteGroupStore keeps groups and points in indexed SQLite tables and only
+  ever loads the rows that are asked for.
+
+Edits are not written as they are made: commit() writes every edit since the
+last one in a single write (the journal on a background thread), flush() waits
+until they are all on disk, and close() flushes. save_status() reports what is
+still unsaved and how long the last write took.
+
+open_group_store picks the backend from the file extension. Both stores also
+keep an index of group content hashes, so imports can skip groups already saved.
+
+Exports are a JSON array (write_groups_json), or a columnar binary file
+(write_groups_columnar, .ngc) that ColumnarGroups memory-maps, so analysis
+code can use the points as a NumPy array without parsing anything.
+
+A group is a dict of id, name, timestamp, optional image, and one [x, y] point
+(or None) per named series. The rose diagram uses POINT_KEYS, but a group may
+carry any other series as well.
+"""
+
+import bisect
+import codecs
+import contextlib
+import hashlib
+import itertools
+import json
+import math
+import mmap
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+import uuid
+from collections import Counter
+
+
+# The series of the rose diagram, in display order
+POINT_KEYS = ("origin", "red", "blue", "black")
+
+# Keys of a group dict that are not point series
+GROUP_FIELDS = ("id", "name", "timestamp", "image")
+
+# Edits are appended to a journal next to the history snapshot; once this many
+# have piled up the snapshot is rewritten in the background and the journal trimmed.
+COMPACT_EVERY = 500
+
+# Deleting a group from a GroupTable only marks its row; the marked rows are
+# swept out once there are this many and they are this share of the table
+SWEEP_MIN_ROWS = 1024
+SWEEP_FRACTION = 0.25
+
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+SQLITE_MAX_PARAMETERS = 999  # Values per IN (...) query; SQLite before 3.32 allows no more
+
+# Columnar exports: the magic, a JSON header, then each column as a raw
+# little-endian array starting on a COLUMN_ALIGN boundary
+COLUMNAR_EXTENSIONS = (".ngc",)
+COLUMNAR_MAGIC = b"NGCOLS\x00\x01"  # Format name and version
+COLUMN_ALIGN = 64
+
+np = None  # The NumPy module once numpy() has imported it
+
+
+def numpy():
+    """Return the NumPy module, imported on first use so that the app's window does not wait for it."""
+    global np
+    if np is None:
+        import numpy as np
+    return np
+
+
+def new_group_id():
+    """Return a new stable identifier for a saved group."""
+    return uuid.uuid4().hex
+
+
+def group_series(group):
+    """Return the series keys of a group: POINT_KEYS, then any others it has."""
+    return POINT_KEYS + tuple(key for key in group if key not in GROUP_FIELDS and key not in POINT_KEYS)
+
+
+def checked_group(group):
+    """Return group with each point as an [x, y] list, or raise ValueError if it is not a valid group.
+
+    A valid group is a dict with a text name, text or missing id, timestamp
+    and image, and every series either None or two finite numbers.
+    """
+    if not isinstance(group, dict) or not isinstance(group.get("name"), str):
+        raise ValueError("Invalid file format: every group needs a name")
+    for field in ("id", "timestamp", "image"):
+        if not isinstance(group.get(field), (str, type(None))):
+            raise ValueError(f"Invalid group {group['name']!r}: {field} is not text")
+    for key in group_series(group):
+        point = group.get(key)
+        if point is None:
+            continue
+        if (not isinstance(point, (list, tuple)) or len(point) != 2 or not all(
+                isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+                for value in point)):
+            raise ValueError(f"Invalid group {group['name']!r}: {key} is not an [x, y] point")
+        group[key] = list(point)
+    return group
+
+
+def group_hash(group):
+    """Return a hash of a group's content: name, points and timestamp, but not its id."""
+    content = [group["name"], group.get("timestamp")]
+    for key in POINT_KEYS:
+        point = group.get(key)
+        content.append(None if point is None else [float(point[0]), float(point[1])])
+    # Other series are added by name, so groups of the rose diagram hash as they always have
+    for key in sorted(group_series(group)[len(POINT_KEYS):]):
+        point = group[key]
+        if point is not None:
+            content.append([key, float(point[0]), float(point[1])])
+    return hashlib.sha1(json.dumps(content, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def write_json_atomic(path, data):
+    """Write JSON to a temporary file and rename it over path once it is on disk."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_groups_json(path, groups):
+    """Write groups as a JSON array, one group per line, replacing path once it is on disk."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write("[")
+        separator = "\n"
+        for group in groups:
+            f.write(separator)
+            f.write(json.dumps(group))
+            separator = ",\n"
+        f.write("\n]\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def is_columnar(path):
+    """Return whether path names a columnar binary export."""
+    return os.path.splitext(path)[1].lower() in COLUMNAR_EXTENSIONS
+
+
+def write_groups_columnar(path, groups, batch_size=10000):
+    """Write groups as a columnar binary export, replacing path once it is on disk.
+
+    The points of every group are one (groups, series, 2) column, NaN where a
+    group has no point; id, name, timestamp and image are UTF-8 text columns.
+    See ColumnarGroups for reading it back.
+    """
+    np = numpy()
+    table = GroupTable()
+    groups = iter(groups)
+    while True:
+        # Exports from before groups had ids are written with a missing id
+        batch = [group if "id" in group else dict(group, id=None)
+                 for group in itertools.islice(groups, batch_size)]
+        if not batch:
+            break
+        table.extend(batch)
+
+    # Clicked points are whole pixels, which float32 holds exactly at half the size
+    coords = table.coords.astype("<f4")
+    if not np.array_equal(coords, table.coords, equal_nan=True):
+        coords = table.coords.astype("<f8")
+    columns = {"coords": coords}
+    for field, values in (("id", table.ids), ("name", table.names),
+                          ("timestamp", table.timestamps), ("image", table.images)):
+        columns.update(text_columns(field, values))
+
+    layout = {}
+    offset = 0
+    for name, array in columns.items():
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += _aligned(array.nbytes)
+    header = json.dumps({"rows": len(table), "series": table.series, "columns": layout}).encode("utf-8")
+    preamble = COLUMNAR_MAGIC + len(header).to_bytes(4, "little") + header
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(preamble + bytes(_aligned(len(preamble)) - len(preamble)))
+        for array in columns.values():
+            f.write(array.tobytes())
+            f.write(bytes(_aligned(array.nbytes) - array.nbytes))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def text_columns(field, values):
+    """Encode a text column as UTF-8 bytes and offsets into them, plus a mask if any is None.
+
+    A column that is mostly repeats, like image names, stores each distinct
+    value once and a small integer code per group.
+    """
+    np = numpy()
+    columns = {}
+    if None in values:
+        columns[f"{field}.missing"] = np.array([value is None for value in values], dtype=np.uint8)
+    distinct = dict.fromkeys(values)
+    if len(distinct) <= len(values) // 2:
+        codes = {value: code for code, value in enumerate(distinct)}
+        dtype = np.min_scalar_type(max(len(distinct) - 1, 0)).newbyteorder("<")
+        columns[f"{field}.codes"] = np.fromiter(map(codes.__getitem__, values), dtype=dtype, count=len(values))
+        values = list(distinct)
+
+    encoded = [(value or "").encode("utf-8") for value in values]
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    offsets = np.zeros(len(encoded) + 1, dtype="<i4" if lengths.sum() < 2 ** 31 else "<i8")
+    np.cumsum(lengths, out=offsets[1:])
+    columns[f"{field}.offsets"] = offsets
+    columns[f"{field}.data"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return columns
+
+
+def open_group_store(path):
+    """Open the store for a history file, SQLite for .db/.sqlite files, else JSON."""
+    if os.path.splitext(path)[1].lower() in SQLITE_EXTENSIONS:
+        return SQLiteGroupStore(path)
+    return JournalGroupStore(path)
+
+
+class JSONArrayReader:
+    """Iterate over the items of a JSON array file without loading the whole file.
+
+    The file is read in chunks and each item decoded as soon as it is complete,
+    so memory use depends on the largest item, not on the file size.
+    """
+
+    def __init__(self, f, chunk_size=1 << 20):
+        self.f = f  # Opened in binary mode
+        self.chunk_size = chunk_size
+        self.bytes_read = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        """Read another chunk into the buffer; return False at the end of the file."""
+        if self._eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        self.bytes_read += len(chunk)
+        self._eof = not chunk
+        # Drop what has been decoded already
+        self._buffer = self._buffer[self._pos:] + self._decoder.decode(chunk, final=self._eof)
+        self._pos = 0
+        return True
+
+    def _next_char(self):
+        """Skip whitespace and return the next character, or "" at the end of the file."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos].isspace():
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def __iter__(self):
+        if self._next_char() != "[":
+            raise ValueError("Invalid file format: expected a JSON array")
+        self._pos += 1
+
+        first = True
+        while True:
+            char = self._next_char()
+            if char == "]":
+                return
+            if not first:
+                if char != ",":
+                    raise ValueError(f"Invalid file format: expected ',' or ']' near byte {self.bytes_read}")
+                self._pos += 1
+                self._next_char()
+            first = False
+
+            while True:
+                try:
+                    item, end = self._json.raw_decode(self._buffer, self._pos)
+                except json.JSONDecodeError:
+                    # Item not complete yet, unless the file has ended
+                    if self._fill():
+                        continue
+                    raise
+                # A number may continue into the next chunk, even after a
+                # prefix that decodes on its own, such as "1." or "1e"
+                following = end
+                while following < len(self._buffer) and self._buffer[following].isspace():
+                    following += 1
+                if (following == len(self._buffer) or self._buffer[following] not in ",]") and self._fill():
+                    continue
+                break
+            self._pos = end
+            yield item
+
+
+class ColumnarGroups:
+    """A columnar binary export, memory-mapped.
+
+    coords is the (groups, series, 2) array of every point, NaN where a group
+    has no point, read straight from the file without copying; it is float32
+    when that holds every point exactly, else float64. Text columns are decoded
+    on first use; nothing else is read up front.
+    """
+
+    def __init__(self, path):
+        np = numpy()
+        self.path = path
+        with open(path, 'rb') as f:
+            preamble = f.read(len(COLUMNAR_MAGIC) + 4)
+            if preamble[:len(COLUMNAR_MAGIC)] != COLUMNAR_MAGIC:
+                raise ValueError("Invalid file format: not a columnar group export, or from a newer version")
+            header = f.read(int.from_bytes(preamble[-4:], "little"))
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        info = json.loads(header)
+        start = _aligned(len(preamble) + len(header))
+
+        self.rows = info["rows"]
+        self.series = info["series"]
+        self._columns = {}
+        for name, column in info["columns"].items():
+            shape = tuple(column["shape"])
+            self._columns[name] = np.frombuffer(
+                self._map, dtype=column["dtype"], count=int(np.prod(shape)), offset=start + column["offset"]
+            ).reshape(shape)
+        self._text = {}
+
+    def __len__(self):
+        return self.rows
+
+    def __iter__(self):
+        return self.iter_groups()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Unmap the file, so that it can be replaced; the columns cannot be read after this.
+
+        Arrays taken from it keep the file mapped until the last of them is freed.
+        """
+        self._columns = {}
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass  # Still in use; unmapped once those arrays are gone
+            self._map = None
+
+    @property
+    def coords(self):
+        """The read-only (groups, series, 2) array of every point, in file order."""
+        return self._columns["coords"]
+
+    def points(self, key):
+        """Return the (groups, 2) points of one series, NaN where missing."""
+        return self.coords[:, self.series.index(key)]
+
+    def text(self, field):
+        """Return the id, name, timestamp or image of every group as a list, None where missing."""
+        np = numpy()
+        values = self._text.get(field)
+        if values is None:
+            offsets = self._columns[f"{field}.offsets"].tolist()
+            data = self._columns[f"{field}.data"].tobytes()
+            text = data.decode("utf-8")
+            if len(text) == len(data):
+                # All ASCII, so byte offsets are character offsets
+                values = [text[start:end] for start, end in zip(offsets, offsets[1:])]
+            else:
+                values = [data[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+            codes = self._columns.get(f"{field}.codes")
+            if codes is not None:
+                values = list(map(values.__getitem__, codes.tolist()))
+            missing = self._columns.get(f"{field}.missing")
+            if missing is not None:
+                for row in np.flatnonzero(missing).tolist():
+                    values[row] = None
+            self._text[field] = values
+        return values
+
+    def table(self):
+        """Return the groups as a GroupTable whose points stay in the file."""
+        return GroupTable.from_columns(
+            self.series, self.coords, self.text("id"), self.text("name"), self.text("timestamp"), self.text("image")
+        )
+
+    def iter_groups(self, batch_size=1000):
+        """Yield every group as a dict, in file order."""
+        return self.table().iter_groups(batch_size)
+
+
+class HistoryJournal:
+    """Group history kept as a JSON snapshot plus an append-only JSONL journal.
+
+    Every journal line carries a sequence number and the snapshot records the
+    last one it includes, so a crash between writing the snapshot and trimming
+    the journal never replays an edit twice.
+
+    Appended lines are held in memory until commit() or flush() writes them,
+    all at once with an fsync, so a burst of edits costs one write.
+    """
+
+    def __init__(self, path, compact_every=COMPACT_EVERY):
+        self.path = path
+        self.journal_path = os.path.splitext(path)[0] + ".journal.jsonl"
+        self.compact_every = compact_every
+        self.seq = 0
+        self.pending = 0  # Journal entries not yet folded into the snapshot
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()  # Held while the journal file is written
+        self._compacting = False
+        self._unwritten = []  # Journal lines not written yet, oldest first
+        self._writing = 0  # Lines being written by the background writer
+        self._writer_running = False
+        self.last_write = None  # Seconds the last write took
+        self.writes = 0
+        self.error = None  # Message of the last failed write, until one succeeds
+
+    def load(self, read_only=False):
+        """Return the snapshot groups with the journal replayed on top.
+
+        Loading repairs the files: a torn journal line is cut off and a
+        history from before group ids is rewritten with them. read_only
+        skips both and leaves the files as they are.
+        """
+        groups = []
+        snapshot_seq = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            # Older history files are a bare list of groups
+            if isinstance(data, list):
+                groups = data
+            elif isinstance(data, dict) and isinstance(data.get("groups"), list) and "seq" in data:
+                groups = data["groups"]
+                snapshot_seq = data["seq"]
+            else:
+                raise ValueError(f"{self.path} is not a history file")
+
+        legacy = any("id" not in group for group in groups)
+        for group in groups:
+            group.setdefault("id", new_group_id())
+        by_id = {group["id"]: group for group in groups}
+
+        self.seq = snapshot_seq
+        self.pending = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r' if read_only else 'r+') as f:
+                while True:
+                    offset = f.tell()
+                    line = f.readline()
+                    if not line:
+                        break
+                    try:
+                        if not line.endswith("\n"):
+                            raise ValueError("incomplete line")
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn last line from a crash mid-append
+                        if not read_only:
+                            f.truncate(offset)
+                        break
+                    if entry["seq"] <= snapshot_seq:
+                        continue
+                    self.apply(by_id, entry)
+                    self.seq = entry["seq"]
+                    self.pending += 1
+
+        groups = list(by_id.values())
+        if legacy and not read_only:
+            # Journal entries refer to group ids, so they must be on disk first
+            self.compact(groups, background=False)
+        return groups
+
+    @staticmethod
+    def apply(by_id, entry):
+        """Apply one journal entry to a dict of groups keyed by id."""
+        op = entry["op"]
+        if op == "add":
+            by_id[entry["group"]["id"]] = entry["group"]
+        elif op == "import":
+            for group in entry["groups"]:
+                by_id[group["id"]] = group
+        elif op == "delete":
+            by_id.pop(entry["id"], None)
+        elif op == "reset":
+            by_id.clear()
+
+    def append(self, op, **fields):
+        """Add one edit to the journal, to be written by the next commit or flush."""
+        with self._lock:
+            self.seq += 1
+            self._unwritten.append(json.dumps({"seq": self.seq, "op": op, **fields}) + "\n")
+            self.pending += 1
+
+    def commit(self):
+        """Start writing the unwritten lines on a background thread, unless one is already at it."""
+        with self._lock:
+            if self._writer_running or not self._unwritten:
+                return
+            self._writer_running = True
+        threading.Thread(target=self._write_unwritten, daemon=True).start()
+
+    def flush(self):
+        """Write every unwritten line now, after any write in progress."""
+        with self._file_lock:
+            with self._lock:
+                lines = self._unwritten
+                self._unwritten = []
+            if lines:
+                self._write(lines)
+
+    def status(self):
+        with self._lock:
+            return {
+                "unsaved": len(self._unwritten) + self._writing,
+                "saving": self._writer_running,
+                "last_save_ms": None if self.last_write is None else self.last_write * 1000,
+                "saves": self.writes,
+                "error": self.error,
+            }
+
+    def _write_unwritten(self):
+        # Lines are taken under the file lock so they reach the file in order
+        while True:
+            with self._file_lock:
+                with self._lock:
+                    lines = self._unwritten
+                    self._unwritten = []
+                    self._writing = len(lines)
+                    if not lines:
+                        self._writer_running = False
+                        return
+                try:
+                    self._write(lines)
+                except OSError as e:
+                    print(f"Error saving history: {e}")
+                    with self._lock:
+                        self._writing = 0
+                        self._writer_running = False
+                    return
+
+    def _write(self, lines):
+        """Append lines to the journal and fsync it; on failure they stay unwritten."""
+        start = time.perf_counter()
+        try:
+            with open(self.journal_path, 'a') as f:
+                f.write("".join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            with self._lock:
+                self._unwritten[:0] = lines
+                self.error = str(e)
+            raise
+        with self._lock:
+            self._writing = 0
+            self.last_write = time.perf_counter() - start
+            self.writes += 1
+            self.error = None
+
+    def needs_compaction(self):
+        return self.pending >= self.compact_every and not self._compacting
+
+    def compact(self, groups, background=True):
+        """Write groups as the new snapshot and drop the journal entries it covers.
+
+        groups is a list, or a GroupTable snapshot; the snapshot file is built
+        from it on the compacting thread.
+        """
+        if self._compacting:
+            return
+        self._compacting = True
+        with self._lock:
+            seq = self.seq
+
+        if background:
+            threading.Thread(target=self._compact, args=(groups, seq), daemon=True).start()
+        else:
+            self._compact(groups, seq)
+
+    def _compact(self, groups, seq):
+        try:
+            write_json_atomic(self.path, {"seq": seq, "groups": list(groups)})
+
+            # Keep only entries written while the snapshot was being written
+            with self._file_lock:
+                kept = []
+                if os.path.exists(self.journal_path):
+                    with open(self.journal_path, 'r') as f:
+                        for line in f:
+                            try:
+                                if json.loads(line)["seq"] > seq:
+                                    kept.append(line)
+                            except json.JSONDecodeError:
+                                break
+                tmp_path = f"{self.journal_path}.tmp"
+                with open(tmp_path, 'w') as f:
+                    f.writelines(kept)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.journal_path)
+            with self._lock:
+                self.pending = self.seq - seq
+        except Exception as e:
+            print(f"Error compacting history: {e}")
+        finally:
+            self._compacting = False
+
+
+class GroupTable:
+    """Groups held column-wise, so a large history stays small in memory.
+
+    Points are an (rows, series, 2) float64 array with NaN where a group has
+    no point, 16 bytes a point; ids, names and timestamps are plain lists.
+    Rows are in insertion order, oldest first. Groups go in and come out as dicts.
+
+    Deleting a group only marks its row, so a delete costs the same wherever
+    the group is; marked rows are swept out in bulk once there are many.
+    """
+
+    def __init__(self):
+        np = numpy()
+        self.series = list(POINT_KEYS)
+        self._series_index = {key: index for index, key in enumerate(self.series)}
+        self.ids = []
+        self.names = []
+        self.timestamps = []
+        self.images = []
+        self._coords = np.full((0, len(self.series), 2), np.nan)  # Spare rows at the end
+        self._size = 0  # Rows in use, deleted ones included
+        self._deleted = []  # Sorted rows of deleted groups
+        self._rows = None  # id -> row, built on first use
+
+    @classmethod
+    def from_columns(cls, series, coords, ids, names, timestamps, images):
+        """Return a table over existing columns without copying them; coords may be read-only."""
+        table = cls.__new__(cls)
+        table.series = list(series)
+        table._series_index = {key: index for index, key in enumerate(table.series)}
+        table.ids = ids
+        table.names = names
+        table.timestamps = timestamps
+        table.images = images
+        table._coords = coords
+        table._size = len(ids)
+        table._deleted = []
+        table._rows = None
+        return table
+
+    def __len__(self):
+        return self._size - len(self._deleted)
+
+    def __iter__(self):
+        return self.iter_groups()
+
+    @property
+    def coords(self):
+        """The (groups, series, 2) array of every point, oldest group first."""
+        np = numpy()
+        if self._deleted:
+            return np.delete(self._coords[:self._size], self._deleted, axis=0)
+        return self._coords[:self._size]
+
+    def row(self, group_id):
+        """Return the row of a group, or None."""
+        if self._rows is None:
+            rows = dict(zip(itertools.islice(self.ids, self._size), range(self._size)))
+            for row in self._deleted:
+                if rows.get(self.ids[row]) == row:  # Not an id added again since
+                    del rows[self.ids[row]]
+            self._rows = rows
+        return self._rows.get(group_id)
+
+    def live_rows(self, start=0, end=None):
+        """Return the rows from start up to end that hold a group, skipping deleted ones."""
+        end = self._size if end is None else end
+        first = bisect.bisect_left(self._deleted, start)
+        last = bisect.bisect_left(self._deleted, end)
+        if first == last:
+            return list(range(start, end))
+        deleted = set(self._deleted[first:last])
+        return [row for row in range(start, end) if row not in deleted]
+
+    def groups(self, rows):
+        """Return the groups at a list of rows as dicts."""
+        np = numpy()
+        block = self._coords[rows].reshape(len(rows), 2 * len(self.series))  # x0, y0, x1, y1, ... per row
+        present = (block[:, ::2] == block[:, ::2]).tolist()  # NaN marks a missing point
+        if np.array_equal(block, np.floor(block), equal_nan=True):
+            # Clicked points are whole pixels: convert the whole block to ints at once
+            values = np.nan_to_num(block).astype(np.int64).tolist()
+        else:
+            values = [[int(v) if v.is_integer() else v for v in points] for points in block.tolist()]
+
+        groups = []
+        for row, has_point, points in zip(rows, present, values):
+            group = {"id": self.ids[row], "name": self.names[row]}
+            for index, key in enumerate(self.series):
+                if has_point[index]:
+                    group[key] = points[2 * index:2 * index + 2]
+                elif key in POINT_KEYS:
+                    group[key] = None
+            group["timestamp"] = self.timestamps[row]
+            if self.images[row] is not None:
+                group["image"] = self.images[row]
+            groups.append(group)
+        return groups
+
+    def page(self, offset, limit):
+        """Return up to limit groups, newest first, skipping the newest offset."""
+        end = len(self) - offset
+        if end <= 0:
+            return []
+        start = max(0, end - limit)
+        rows = self.live_rows(self._row_at(start), self._row_at(end - 1) + 1)
+        return self.groups(rows[::-1])
+
+    def iter_groups(self, batch_size=1000):
+        """Yield every group, oldest first, converting a batch of rows at a time."""
+        for start in range(0, self._size, batch_size):
+            rows = self.live_rows(start, min(start + batch_size, self._size))
+            if rows:
+                yield from self.groups(rows)
+
+    def extend(self, groups):
+        """Append groups, adding columns for any series not seen before."""
+        np = numpy()
+        for group in groups:
+            for key in group_series(group):
+                if key not in self._series_index:
+                    self._add_series(key)
+
+        start = self._size
+        self._reserve(start + len(groups))
+        block = self._coords[start:start + len(groups)]
+        missing = (np.nan, np.nan)
+        for index, key in enumerate(self.series):
+            points = itertools.chain.from_iterable([group.get(key) or missing for group in groups])
+            block[:, index] = np.fromiter(points, dtype=float, count=2 * len(groups)).reshape(-1, 2)
+
+        for row, group in enumerate(groups, start):
+            self.ids.append(group["id"])
+            self.names.append(group["name"])
+            self.timestamps.append(group.get("timestamp"))
+            self.images.append(group.get("image"))
+            if self._rows is not None:
+                self._rows[group["id"]] = row
+        self._size += len(groups)
+
+    def delete(self, group_id):
+        """Remove a group and return it as a dict, or None if it is not there."""
+        row = self.row(group_id)
+        if row is None:
+            return None
+        group = self.groups([row])[0]
+        del self._rows[group_id]
+        bisect.insort(self._deleted, row)
+        if len(self._deleted) >= max(SWEEP_MIN_ROWS, SWEEP_FRACTION * self._size):
+            self._sweep()
+        return group
+
+    def clear(self):
+        self.__init__()
+
+    def snapshot(self):
+        """Return a table of the groups as they are now, cheap enough to take on the UI thread.
+
+        It shares its columns with this table, which only ever appends past the
+        snapshot's rows, marks deleted rows in a list of its own, and replaces
+        columns rather than changing them when it sweeps or adds a series.
+        """
+        table = GroupTable.from_columns(self.series, self._coords, self.ids, self.names, self.timestamps, self.images)
+        table._size = self._size
+        table._deleted = list(self._deleted)
+        return table
+
+    def _row_at(self, position):
+        """Return the row of the group at position, counting only groups not deleted."""
+        # Rows up to and including row hold row + 1 - (deleted rows up to it) groups
+        low, high = position, position + len(self._deleted)
+        while low < high:
+            middle = (low + high) // 2
+            if middle + 1 - bisect.bisect_right(self._deleted, middle) > position:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def _sweep(self):
+        """Drop the rows of deleted groups, into new columns so that snapshots keep theirs."""
+        keep = [True] * self._size
+        for row in self._deleted:
+            keep[row] = False
+        self._coords = self.coords
+        self.ids = list(itertools.compress(self.ids, keep))
+        self.names = list(itertools.compress(self.names, keep))
+        self.timestamps = list(itertools.compress(self.timestamps, keep))
+        self.images = list(itertools.compress(self.images, keep))
+        self._size = len(self.ids)
+        self._deleted = []
+        self._rows = None
+
+    def _reserve(self, rows):
+        """Grow the point array, doubling it, so appends stay cheap."""
+        np = numpy()
+        if rows > len(self._coords):
+            coords = np.full((max(rows, 2 * len(self._coords), 64), len(self.series), 2), np.nan)
+            coords[:self._size] = self._coords[:self._size]
+            self._coords = coords
+
+    def _add_series(self, key):
+        np = numpy()
+        self._series_index[key] = len(self.series)
+        self.series.append(key)
+        column = np.full((len(self._coords), 1, 2), np.nan)
+        self._coords = np.concatenate([self._coords, column], axis=1)
+
+
+class JournalGroupStore:
+    """Groups held in memory in a GroupTable, persisted through a HistoryJournal."""
+
+    def __init__(self, path):
+        self.path = path
+        self.journal = HistoryJournal(path)
+        self.table = GroupTable()
+        self._hashes = None  # Counter of content hashes, built on first use
+
+    def load(self):
+        groups = self.journal.load()
+        self.table = GroupTable()
+        self.table.extend(groups)
+        self._hashes = None
+
+    def close(self):
+        self.flush()
+
+    def commit(self):
+        """Write the edits made since the last commit, in the background."""
+        self.journal.commit()
+
+    def flush(self):
+        """Write every edit made so far, waiting until it is on disk."""
+        self.journal.flush()
+
+    def save_status(self):
+        """Return unsaved edit count, whether a write is running, last write time and any error."""
+        return self.journal.status()
+
+    def count(self):
+        return len(self.table)
+
+    def ids(self):
+        """Return the id of every group, oldest first."""
+        ids = self.table.ids
+        return [ids[row] for row in self.table.live_rows()]
+
+    def page(self, offset, limit):
+        """Return up to limit groups, newest first, skipping the newest offset."""
+        return self.table.page(offset, limit)
+
+    def get(self, group_id):
+        row = self.table.row(group_id)
+        return None if row is None else self.table.groups([row])[0]
+
+    def get_many(self, group_ids):
+        """Return the groups with these ids, in the same order, skipping unknown ids."""
+        rows = [self.table.row(group_id) for group_id in group_ids]
+        return self.table.groups([row for row in rows if row is not None])
+
+    def find_by_name(self, name):
+        names = self.table.names
+        return self.table.groups([row for row in self.table.live_rows() if names[row] == name])
+
+    def find_by_image(self, image):
+        images = self.table.images
+        return self.table.groups([row for row in self.table.live_rows() if images[row] == image])
+
+    def has_hash(self, content_hash):
+        """Return True if a group with this content hash is saved."""
+        if self._hashes is None:
+            self._hashes = Counter(group_hash(group) for group in self.iter_groups())
+        return content_hash in self._hashes
+
+    def iter_groups(self):
+        """Yield every group, oldest first."""
+        return self.table.iter_groups()
+
+    def add(self, group):
+        self._insert([group])
+        self._record("add", group=group)
+
+    def add_many(self, groups):
+        self._insert(groups)
+        self._record("import", groups=groups)
+
+    def delete(self, group_id):
+        group = self.table.delete(group_id)
+        if group is not None:
+            if self._hashes is not None:
+                content_hash = group_hash(group)
+                self._hashes[content_hash] -= 1
+                if self._hashes[content_hash] <= 0:
+                    del self._hashes[content_hash]
+            self._record("delete", id=group_id)
+
+    def reset(self):
+        self.table.clear()
+        self._hashes = Counter()
+        self._record("reset")
+
+    def _insert(self, groups):
+        self.table.extend(groups)
+        if self._hashes is not None:
+            self._hashes.update(group_hash(group) for group in groups)
+
+    def _record(self, op, **fields):
+        self.journal.append(op, **fields)
+        if self.journal.needs_compaction():
+            self.journal.compact(self.table.snapshot())
+
+
+class SQLiteGroupStore:
+    """Groups and their points in SQLite, indexed by id, name, timestamp and source image."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS groups (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT NOT NULL UNIQUE,
+            name TEXT NOT NULL,
+            timestamp TEXT,
+            image TEXT,
+            hash TEXT
+        );
+        CREATE TABLE IF NOT EXISTS points (
+            group_seq INTEGER NOT NULL REFERENCES groups(seq) ON DELETE CASCADE,
+            series TEXT NOT NULL,
+            x REAL NOT NULL,
+            y REAL NOT NULL,
+            PRIMARY KEY (group_seq, series)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS groups_name ON groups(name);
+        CREATE INDEX IF NOT EXISTS groups_timestamp ON groups(timestamp);
+        CREATE INDEX IF NOT EXISTS groups_image ON groups(image);
+    """
+
+    # Content hash index; applied after older databases get the hash column
+    HASH_INDEX = "CREATE INDEX IF NOT EXISTS groups_hash ON groups(hash)"
+
+    def __init__(self, path, read_only=False):
+        """Open or create the database; read_only opens an existing one without changing it."""
+        self.path = path
+        if read_only:
+            uri = "file:" + urllib.parse.quote(os.path.abspath(path)) + "?mode=ro"
+            self.conn = sqlite3.connect(uri, uri=True)
+        else:
+            # The app opens the store on its history loading thread, then uses
+            # it only from the UI thread
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute("PRAGMA foreign_keys = ON")
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.execute("PRAGMA synchronous = NORMAL")
+            self.conn.executescript(self.SCHEMA)
+            self._add_hash_column()
+        self._count = None
+        self._unsaved = 0  # Edits in the open transaction
+        self.last_commit = None  # Seconds the last commit took
+        self.commits = 0
+        self.error = None
+
+    def load(self):
+        pass  # Nothing is held in memory
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def commit(self):
+        """Commit the edits made since the last commit, in one transaction."""
+        if not self.conn.in_transaction:
+            return
+        start = time.perf_counter()
+        try:
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.error = str(e)
+            raise
+        self.last_commit = time.perf_counter() - start
+        self.commits += 1
+        self.error = None
+        self._unsaved = 0
+
+    def flush(self):
+        """Commit now; a commit is already synchronous."""
+        self.commit()
+
+    def save_status(self):
+        """Return unsaved edit count, whether a write is running, last write time and any error."""
+        return {
+            "unsaved": self._unsaved,
+            "saving": False,
+            "last_save_ms": None if self.last_commit is None else self.last_commit * 1000,
+            "saves": self.commits,
+            "error": self.error,
+        }
+
+    def count(self):
+        # Counted once, then kept up to date by the methods that change it
+        if self._count is None:
+            self._count = self.conn.execute("SELECT COUNT(*) FROM groups").fetchone()[0]
+        return self._count
+
+    def page(self, offset, limit):
+        """Return up to limit groups, newest first, skipping the newest offset."""
+        rows = self.conn.execute(
+            "SELECT seq, id, name, timestamp, image FROM groups ORDER BY seq DESC LIMIT ? OFFSET ?",
+            (limit, offset)
+        ).fetchall()
+        return self._with_points(rows)
+
+    def get(self, group_id):
+        rows = self.conn.execute(
+            "SELECT seq, id, name, timestamp, image FROM groups WHERE id = ?", (group_id,)
+        ).fetchall()
+        groups = self._with_points(rows)
+        return groups[0] if groups else None
+
+    def ids(self):
+        """Return the id of every group, oldest first."""
+        return [row[0] for row in self.conn.execute("SELECT id FROM groups ORDER BY seq")]
+
+    def get_many(self, group_ids):
+        """Return the groups with these ids, in the same order, skipping unknown ids."""
+        group_ids = list(group_ids)
+        by_id = {}
+        for start in range(0, len(group_ids), SQLITE_MAX_PARAMETERS):
+            chunk = group_ids[start:start + SQLITE_MAX_PARAMETERS]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT seq, id, name, timestamp, image FROM groups WHERE id IN ({placeholders})", chunk
+            ).fetchall()
+            by_id.update((group["id"], group) for group in self._with_points(rows))
+        return [by_id[group_id] for group_id in group_ids if group_id in by_id]
+
+    def find_by_name(self, name):
+        rows = self.conn.execute(
+            "SELECT seq, id, name, timestamp, image FROM groups WHERE name = ? ORDER BY seq", (name,)
+        ).fetchall()
+        return self._with_points(rows)
+
+    def has_hash(self, content_hash):
+        """Return True if a group with this content hash is saved."""
+        row = self.conn.execute("SELECT 1 FROM groups WHERE hash = ? LIMIT 1", (content_hash,)).fetchone()
+        return row is not None
+
+    def find_by_image(self, image):
+        rows = self.conn.execute(
+            "SELECT seq, id, name, timestamp, image FROM groups WHERE image = ? ORDER BY seq", (image,)
+        ).fetchall()
+        return self._with_points(rows)
+
+    def iter_groups(self, batch_size=SQLITE_MAX_PARAMETERS):
+        """Yield every group, oldest first, a batch of rows at a time."""
+        last_seq = 0
+        while True:
+            rows = self.conn.execute(
+                "SELECT seq, id, name, timestamp, image FROM groups WHERE seq > ? ORDER BY seq LIMIT ?",
+                (last_seq, batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            yield from self._with_points(rows)
+            last_seq = rows[-1][0]
+
+    def add(self, group):
+        self.add_many([group])
+
+    def add_many(self, groups):
+        with self._edit():
+            for group in groups:
+                cursor = self.conn.execute(
+                    "INSERT INTO groups (id, name, timestamp, image, hash) VALUES (?, ?, ?, ?, ?)",
+                    (group["id"], group["name"], group.get("timestamp"), group.get("image"), group_hash(group))
+                )
+                self.conn.executemany(
+                    "INSERT INTO points (group_seq, series, x, y) VALUES (?, ?, ?, ?)",
+                    [
+                        (cursor.lastrowid, key, group[key][0], group[key][1])
+                        for key in group_series(group) if group.get(key) is not None
+                    ]
+                )
+        if self._count is not None:
+            self._count += len(groups)
+
+    def delete(self, group_id):
+        with self._edit():
+            cursor = self.conn.execute("DELETE FROM groups WHERE id = ?", (group_id,))
+        if self._count is not None:
+            self._count -= cursor.rowcount
+
+    def reset(self):
+        with self._edit():
+            self.conn.execute("DELETE FROM points")
+            self.conn.execute("DELETE FROM groups")
+        self._count = 0
+
+    @contextlib.contextmanager
+    def _edit(self):
+        """Run one edit in the open transaction, left for commit(); a failed edit is undone alone."""
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN")
+        self.conn.execute("SAVEPOINT edit")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK TO edit")
+            self.conn.execute("RELEASE edit")
+            raise
+        self.conn.execute("RELEASE edit")
+        self._unsaved += 1
+
+    def _add_hash_column(self):
+        """Add and fill the content hash column in databases created before it existed."""
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(groups)")]
+        if "hash" not in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE groups ADD COLUMN hash TEXT")
+                for group in self.iter_groups():
+                    self.conn.execute("UPDATE groups SET hash = ? WHERE id = ?", (group_hash(group), group["id"]))
+        self.conn.execute(self.HASH_INDEX)
+
+    def _with_points(self, rows):
+        """Build group dicts for rows of (seq, id, name, timestamp, image)."""
+        groups = {}
+        for seq, group_id, name, timestamp, image in rows:
+            group = {"id": group_id, "name": name}
+            for key in POINT_KEYS:
+                group[key] = None
+            group["timestamp"] = timestamp
+            if image is not None:
+                group["image"] = image
+            groups[seq] = group
+
+        seqs = list(groups)
+        for start in range(0, len(seqs), SQLITE_MAX_PARAMETERS):
+            chunk = seqs[start:start + SQLITE_MAX_PARAMETERS]
+            placeholders = ",".join("?" * len(chunk))
+            for seq, series, x, y in self.conn.execute(
+                f"SELECT group_seq, series, x, y FROM points WHERE group_seq IN ({placeholders})", chunk
+            ):
+                groups[seq][series] = [_as_int(x), _as_int(y)]
+        return list(groups.values())
+
+
+def _aligned(size):
+    """Round size up to a multiple of COLUMN_ALIGN."""
+    return -(-size // COLUMN_ALIGN) * COLUMN_ALIGN
+
+
+def _as_int(value):
+    """Return whole-number coordinates as ints, as the JSON history stores them."""
+    return int(value) if float(value).is_integer() else value
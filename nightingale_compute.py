@@ -0,0 +1,410 @@
+"""
+Compute wedge radii, areas and death counts from digitized coordinate groups.
+
+Reads an export (coordinate_groups_export.json, or a columnar .ngc export) or
+a history file and works on all groups at once with NumPy, so it runs headless
+and scales to millions of groups. Missing points (null in the JSON) come out
+as empty cells.
+
+Given a directory, every export and history in it is processed in a pool of
+worker processes and the results are merged into one table, with a source
+column naming the file each row came from.
+
+    python nightingale_compute.py coordinate_groups_export.json -o data/nightingale_computed.csv
+    python nightingale_compute.py exports/ -o data/all_computed.parquet --jobs 8
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from calibration import apply_by_image, load_calibrations
+from group_storage import (
+    COLUMNAR_EXTENSIONS, POINT_KEYS, SQLITE_EXTENSIONS, ColumnarGroups, HistoryJournal, SQLiteGroupStore, group_series,
+    is_columnar
+)
+
+# Optional: much faster CSV writing, and needed for Parquet
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Optional: parses large exports several times faster than json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Each diagram has twelve monthly wedges
+WEDGE_ANGLE = 2 * math.pi / 12
+
+# Files picked up from a directory in batch mode
+BATCH_EXTENSIONS = (".json",) + SQLITE_EXTENSIONS + COLUMNAR_EXTENSIONS
+
+# Files the app writes next to a history that hold no groups; a batch skips them
+SIDECAR_SUFFIXES = (".calibration.json", ".delta.json")
+
+# Text columns; everything else is a float array
+TEXT_COLUMNS = ("source", "name", "timestamp", "image")
+
+
+def load_groups(path):
+    """Return the groups in an export, a history snapshot or a SQLite history.
+
+    A columnar export comes back as a memory-mapped ColumnarGroups, which
+    iterates as group dicts and which compute reads column-wise. Histories
+    are opened read-only, so they are left exactly as the app wrote them.
+    Any other JSON raises ValueError.
+    """
+    if is_columnar(path):
+        return ColumnarGroups(path)
+    if os.path.splitext(path)[1].lower() in SQLITE_EXTENSIONS:
+        try:
+            store = SQLiteGroupStore(path, read_only=True)
+            try:
+                return list(store.iter_groups())
+            finally:
+                store.close()
+        except sqlite3.Error as e:
+            raise ValueError(f"{path} is not a history database: {e}")
+
+    with open(path, 'r') as f:
+        is_list = f.read(64).lstrip().startswith("[")
+        if is_list:
+            # Export file, or a history from before the journal
+            f.seek(0)
+            groups = orjson.loads(f.read()) if orjson is not None else json.load(f)
+            if not all(isinstance(group, dict) for group in groups):
+                raise ValueError(f"{path} is not a list of coordinate groups")
+            return groups
+
+    # History snapshot: replay its journal too
+    return HistoryJournal(path).load(read_only=True)
+
+
+def points_array(groups, key):
+    """Return an (n, 2) float array of one point per group, NaN where it is missing."""
+    missing = (math.nan, math.nan)
+    points = itertools.chain.from_iterable([group.get(key) or missing for group in groups])
+    return np.fromiter(points, dtype=float, count=2 * len(groups)).reshape(-1, 2)
+
+
+def boundary_series(groups):
+    """Return the boundary series in groups, one per cause of death: red, blue, black, then any others."""
+    seen = dict.fromkeys(POINT_KEYS)
+    # Groups of one export nearly all share a key order, so look at each order once
+    for keys in dict.fromkeys(tuple(group) for group in groups):
+        seen.update(dict.fromkeys(group_series(keys)))
+    return [key for key in seen if key != "origin"]
+
+
+def compute(groups, scale=1.0, calibrations=None):
+    """Return a dict of columns: names, timestamps, images, origins and per-series radius, area and deaths.
+
+    Area is the area of a 30-degree wedge of that radius in square pixels;
+    deaths are area times scale. Given {image: Calibration}, every point is
+    first converted to data units, and so are the origins, radii and areas.
+    """
+    if isinstance(groups, ColumnarGroups):
+        # Straight from the mapped columns, without a dict per group
+        names = groups.text("name")
+        timestamps = groups.text("timestamp")
+        images = groups.text("image")
+        series = [key for key in groups.series if key != "origin"]
+
+        def raw_points(key):
+            return np.array(groups.points(key), dtype=float)
+    else:
+        names = [group["name"] for group in groups]
+        timestamps = [group.get("timestamp") for group in groups]
+        images = [group.get("image") for group in groups]
+        series = boundary_series(groups)
+
+        def raw_points(key):
+            return points_array(groups, key)
+
+    def points(key):
+        array = raw_points(key)
+        return array if calibrations is None else apply_by_image(array, images, calibrations)
+
+    origin = points("origin")
+    columns = {
+        "name": names,
+        "timestamp": [timestamp or "" for timestamp in timestamps],
+    }
+    # Which scan each group was digitized on, for multi-image sessions
+    if any(images):
+        columns["image"] = [image or "" for image in images]
+    columns["origin_x"] = origin[:, 0]
+    columns["origin_y"] = origin[:, 1]
+    for key in series:
+        offset = points(key) - origin
+        radius = np.hypot(offset[:, 0], offset[:, 1])
+        area = 0.5 * WEDGE_ANGLE * radius ** 2
+        columns[f"{key}_radius"] = radius
+        columns[f"{key}_area"] = area
+        columns[f"{key}_deaths"] = area * scale
+    return columns
+
+
+def calibrate(columns, reference):
+    """Return the deaths-per-area scale from a "NAME:COLOR=DEATHS" reference wedge."""
+    try:
+        label, deaths = reference.rsplit("=", 1)
+        name, key = label.rsplit(":", 1)
+        deaths = float(deaths)
+    except ValueError:
+        raise ValueError(f"Expected NAME:COLOR=DEATHS, got {reference!r}")
+    series = [name[:-len("_area")] for name in columns if name.endswith("_area")]
+    if key not in series:
+        raise ValueError(f"Unknown color {key!r}, expected one of {', '.join(series)}")
+
+    matches = [i for i, group_name in enumerate(columns["name"]) if group_name == name]
+    if not matches:
+        raise ValueError(f"No group named {name!r}")
+    area = columns[f"{key}_area"][matches[-1]]
+    if not area > 0:
+        raise ValueError(f"Group {name!r} has no {key} point")
+    return deaths / area
+
+
+def rescale(columns, scale):
+    """Recompute the death columns with a new deaths-per-area scale."""
+    for name in list(columns):
+        if name.endswith("_area"):
+            columns[name[:-len("_area")] + "_deaths"] = columns[name] * scale
+
+
+def process_file(path, scale=1.0, reference=None, calibrations=None):
+    """Load and compute one file; return (columns, load seconds, compute seconds).
+
+    Runs in a batch worker, so a reference wedge calibrates each file on its own.
+    """
+    start = time.perf_counter()
+    groups = load_groups(path)
+    try:
+        loaded = time.perf_counter()
+        columns = compute(groups, scale, calibrations)
+        if reference:
+            rescale(columns, calibrate(columns, reference))
+    finally:
+        close_groups(groups)
+    return columns, loaded - start, time.perf_counter() - loaded
+
+
+def close_groups(groups):
+    """Unmap a columnar export once it has been read; other sources are already closed."""
+    if isinstance(groups, ColumnarGroups):
+        groups.close()
+
+
+def batch_files(directory):
+    """Return (exports and histories, calibration and delta files) in a directory, each sorted by name."""
+    paths = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if os.path.splitext(name)[1].lower() in BATCH_EXTENSIONS
+        and os.path.isfile(os.path.join(directory, name))
+    )
+    sidecars = [path for path in paths if path.lower().endswith(SIDECAR_SUFFIXES)]
+    return [path for path in paths if path not in sidecars], sidecars
+
+
+def run_batch(paths, scale=1.0, reference=None, jobs=None, calibrations=None):
+    """Process files in a pool of jobs processes (default: one per core), yielding results as they finish.
+
+    Yields (path, columns, load seconds, compute seconds, error); columns is
+    None for a file that failed. Whatever a file fails with, the rest of the
+    batch carries on.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(paths) == 1:
+        for path in paths:
+            try:
+                yield (path,) + process_file(path, scale, reference, calibrations) + (None,)
+            except Exception as e:
+                yield path, None, 0.0, 0.0, e
+        return
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(paths))) as executor:
+        futures = {executor.submit(process_file, path, scale, reference, calibrations): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                yield (path,) + future.result() + (None,)
+            except Exception as e:
+                yield path, None, 0.0, 0.0, e
+
+
+def merge_columns(results):
+    """Concatenate the columns of several files into one table, with a source column first.
+
+    results is a list of (source, columns). A column missing from a file,
+    such as a series only some digitizers marked, is empty for its rows.
+    """
+    names = ["source"]
+    for _, columns in results:
+        names.extend(name for name in columns if name not in names)
+    # Keep the per-file column order even when the first file lacks the image column
+    if "image" in names:
+        names.remove("image")
+        names.insert(names.index("timestamp") + 1, "image")
+
+    merged = {}
+    for name in names:
+        parts = []
+        for source, columns in results:
+            count = len(columns["name"])
+            if name == "source":
+                parts.append([source] * count)
+            elif name in columns:
+                parts.append(columns[name])
+            elif name in TEXT_COLUMNS:
+                parts.append([""] * count)
+            else:
+                parts.append(np.full(count, math.nan))
+        if name in TEXT_COLUMNS:
+            merged[name] = list(itertools.chain.from_iterable(parts))
+        else:
+            merged[name] = np.concatenate(parts)
+    return merged
+
+
+def to_table(columns):
+    """Return the columns as an Arrow table; NaN becomes null, an empty CSV cell."""
+    return pa.table({
+        name: values if isinstance(values, list) else pa.array(values, from_pandas=True)
+        for name, values in columns.items()
+    })
+
+
+def write_csv(columns, path):
+    if pa is not None:
+        options = pa_csv.WriteOptions(quoting_style="needed")
+        pa_csv.write_csv(to_table(columns), path, write_options=options)
+        return
+
+    cells = []
+    for values in columns.values():
+        if not isinstance(values, list):
+            # csv writes None as an empty cell
+            values = values.astype(object)
+            values[np.isnan(values.astype(float))] = None
+        cells.append(values)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(list(columns))
+        writer.writerows(zip(*cells))
+
+
+def write_parquet(columns, path):
+    if pa is None:
+        raise RuntimeError("Writing Parquet needs pyarrow (pip install pyarrow)")
+    pq.write_table(to_table(columns), path)
+
+
+def write_columns(columns, path):
+    """Write the columns to a .csv or .parquet file, creating its directory."""
+    output_dir = os.path.dirname(path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    if path.lower().endswith(".parquet"):
+        write_parquet(columns, path)
+    else:
+        write_csv(columns, path)
+
+
+def main_batch(parser, args, calibrations):
+    """Process every file in the input directory and write one merged table."""
+    paths, sidecars = batch_files(args.input)
+    if not paths:
+        parser.exit(1, f"Error: no {', '.join(BATCH_EXTENSIONS)} exports or histories in {args.input}\n")
+
+    start = time.perf_counter()
+    results = {}
+    failed = 0
+    print(f"{'file':40} {'groups':>8} {'load':>9} {'compute':>9}")
+    for path in sidecars:
+        print(f"{os.path.basename(path)[:40]:40} skipped: calibration or delta file")
+    batch = run_batch(paths, args.scale, args.calibrate, args.jobs, calibrations)
+    for path, columns, load_s, compute_s, error in batch:
+        name = os.path.basename(path)
+        if error is not None:
+            failed += 1
+            print(f"{name[:40]:40} failed: {error}")
+            continue
+        results[path] = columns
+        print(f"{name[:40]:40} {len(columns['name']):8d} {load_s * 1000:7.1f}ms {compute_s * 1000:7.1f}ms")
+    if not results:
+        parser.exit(1, "Error: every file failed\n")
+
+    # Rows in file name order, whichever worker finished first
+    merged = merge_columns([(os.path.basename(path), results[path]) for path in paths if path in results])
+    try:
+        write_columns(merged, args.output)
+    except (OSError, ValueError, RuntimeError) as e:
+        parser.exit(1, f"Error: {e}\n")
+
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {len(merged['name'])} groups from {len(results)} files to {args.output} in {elapsed:.2f}s")
+    if failed:
+        parser.exit(1, f"{failed} files failed\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute rose diagram radii, areas and deaths from coordinate groups")
+    parser.add_argument("input", nargs="?", default="coordinate_groups_export.json",
+                        help="export (JSON or .ngc), history JSON or SQLite history, or a directory of them "
+                             "(default: coordinate_groups_export.json)")
+    parser.add_argument("-o", "--output", default="data/nightingale_computed.csv",
+                        help="output .csv or .parquet file (default: data/nightingale_computed.csv)")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="deaths per square pixel of wedge area (default: 1)")
+    parser.add_argument("--calibrate", metavar="NAME:COLOR=DEATHS",
+                        help='set the scale from one known wedge, e.g. "january 1855:blue=2761"; '
+                             'with a directory, each file is calibrated from its own wedge')
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="worker processes for a directory (default: one per core)")
+    parser.add_argument("--calibration", metavar="PATH",
+                        help="calibration file saved by the app; points are converted to its data units first")
+    args = parser.parse_args()
+
+    calibrations = None
+    if args.calibration:
+        try:
+            calibrations = load_calibrations(args.calibration)
+        except (OSError, ValueError, KeyError) as e:
+            parser.exit(1, f"Error: cannot read calibration {args.calibration}: {e}\n")
+
+    if os.path.isdir(args.input):
+        main_batch(parser, args, calibrations)
+        return
+
+    try:
+        groups = load_groups(args.input)
+        try:
+            columns = compute(groups, args.scale, calibrations)
+        finally:
+            close_groups(groups)
+        if args.calibrate:
+            rescale(columns, calibrate(columns, args.calibrate))
+        write_columns(columns, args.output)
+    except (OSError, ValueError, RuntimeError) as e:
+        parser.exit(1, f"Error: {e}\n")
+
+    print(f"Wrote {len(groups)} groups to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1115 @@
+"""
+Headless core of the digitization app.
+
+Everything here works without a display: the image pyramid and the tile
+rendering worker, the session of open images under a memory budget, the
+Viewport that maps canvas pixels to original-image pixels, the saved-group
+history with its search and spatial indexes, and the group being digitized.
+Florence_Nightingale_Rose_Diagram.py is the Tk UI that drives it; scripts
+and the benchmarks in benchmarks/ can drive it directly.
+"""
+
+import bisect
+import itertools
+import math
+import os
+import queue
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from group_storage import (
+    POINT_KEYS, checked_group, group_hash, group_series, new_group_id, numpy, open_group_store
+)
+
+
+# Zoom moves in fixed multiplicative steps so that zooming back out lands on
+# exactly the same display scale, which is what lets rendered tiles be reused.
+ZOOM_STEP = 1.1
+MIN_ZOOM = 0.1
+MAX_ZOOM = 20.0
+
+# Only the tiles that intersect the canvas are rendered
+TILE_SIZE = 256
+
+# Saved groups are indexed in chunks of this many while the history loads,
+# reporting progress after each
+HISTORY_INDEX_CHUNK = 50_000
+
+# Saved points are sorted into square grid cells this many original pixels
+# wide; points added since the last sort are scanned directly until there are
+# this many of them
+POINT_CELL = 64
+POINT_INDEX_TAIL = 4096
+CELL_LIMIT = (1 << 31) - 1  # Cell rows and columns are clamped to 31 bits
+
+# Decoded pyramids of all open images are kept within this many bytes
+DEFAULT_IMAGE_BUDGET = 1024 * 1024 * 1024
+
+
+def pillow():
+    """Return PIL.Image, imported on first use so that startup does not wait for it."""
+    from PIL import Image
+    
+    # Archival scans run to hundreds of megapixels, past Pillow's decompression
+    # bomb guard; the user picks the file, and it is only decoded at full size
+    # when the view zooms in that far.
+    Image.MAX_IMAGE_PIXELS = 1_000_000_000
+    return Image
+
+
+class ImagePyramid:
+    """Power-of-two reductions of an image, decoded as they are needed.
+    
+    JPEGs decode each level straight from the file at 1/2, 1/4 or 1/8 scale
+    (draft mode), so a huge scan never needs its full-resolution pixels until
+    the view zooms in that far; that level is dropped again on zooming out.
+    Other formats are decoded once at full size and reduced from there.
+    """
+    
+    def __init__(self, image, min_size=256, progress=None):
+        """Set up the levels of image, decoding enough to show all of it.
+        
+        progress, if given, is called with the fraction done between steps.
+        """
+        self.path = getattr(image, "filename", None) or None
+        self.mode = image.mode if image.mode in ("RGB", "RGBA", "L") else (
+            "RGBA" if "transparency" in image.info else "RGB"
+        )
+        self.draft = image.format == "JPEG" and self.path is not None
+        self._lock = threading.RLock()  # decode_level may decode a larger level first
+        
+        width, height = image.size
+        self.sizes = [(width, height)]
+        while min(self.sizes[-1]) // 2 >= min_size:
+            level_width, level_height = self.sizes[-1]
+            self.sizes.append(((level_width + 1) // 2, (level_height + 1) // 2))
+        self.levels = [None] * len(self.sizes)
+        
+        if progress is None:
+            progress = lambda done: None
+        
+        if self.draft:
+            # Only the smallest level is needed to show the whole image
+            progress(0.0)
+            self.get_level(len(self.levels) - 1)
+        else:
+            progress(0.0)
+            image.load()
+            progress(0.5)
+            self.levels[0] = self.convert(image)
+            for index in range(1, len(self.levels)):
+                progress(0.5 + 0.5 * index / len(self.levels))
+                self.levels[index] = self.levels[index - 1].reduce(2)
+        progress(1.0)
+    
+    @property
+    def size(self):
+        return self.sizes[0]
+    
+    def convert(self, image):
+        return image if image.mode == self.mode else image.convert(self.mode)
+    
+    def get_level(self, index):
+        """Return level index, decoding it first if it is not in memory."""
+        level = self.levels[index]
+        if level is not None:
+            return level
+        
+        with self._lock:
+            if self.levels[index] is None:
+                self.levels[index] = self.decode_level(index)
+            return self.levels[index]
+    
+    def decode_level(self, index):
+        # JPEG decoders can scale by at most 1/8; smaller levels reduce that
+        if index > 3:
+            return self.get_level(3).reduce(2 ** (index - 3))
+        
+        Image = pillow()
+        with Image.open(self.path) as image:
+            if index > 0:
+                width, height = self.size
+                image.draft(image.mode, (max(1, width >> index), max(1, height >> index)))
+            level = self.convert(image)
+            level.load()
+        if level.size != self.sizes[index]:
+            level = level.resize(self.sizes[index], Image.Resampling.BILINEAR)
+        return level
+    
+    def release(self, needed_index):
+        """Drop the full-resolution level once the view is well below it."""
+        if self.draft and needed_index >= 2:
+            self.levels[0] = None
+    
+    def trim(self):
+        """Drop every level but the smallest; they are decoded from the file again when needed."""
+        if self.path is None:
+            return  # Nothing to decode them from
+        with self._lock:
+            for index in range(len(self.levels) - 1):
+                self.levels[index] = None
+    
+    def memory_bytes(self):
+        """Bytes held by the decoded levels."""
+        return sum(
+            level.width * level.height * len(level.getbands())
+            for level in self.levels if level is not None
+        )
+    
+    def level_for_scale(self, scale):
+        """Return the index of the smallest level with at least `scale` pixels per original pixel."""
+        orig_width = self.size[0]
+        for index in range(len(self.sizes) - 1, -1, -1):
+            if self.sizes[index][0] / orig_width >= scale:
+                return index
+        return 0
+    
+    def decoded_level_for_scale(self, scale):
+        """Like level_for_scale, but falls back to the nearest level already in memory."""
+        wanted = self.level_for_scale(scale)
+        for index in list(range(wanted, -1, -1)) + list(range(wanted + 1, len(self.levels))):
+            if self.levels[index] is not None:
+                return index
+        return len(self.levels) - 1
+    
+    def render_region(self, scale, box, resample=None, decode=True):
+        """Render the display-space box (x0, y0, x1, y1) of the image shown at `scale`.
+        
+        resample defaults to LANCZOS. With decode=False only levels already in
+        memory are used, which keeps previews on the UI thread fast.
+        """
+        if resample is None:
+            resample = pillow().Resampling.LANCZOS
+        if decode:
+            level = self.get_level(self.level_for_scale(scale))
+        else:
+            level = self.get_level(self.decoded_level_for_scale(scale))
+        orig_width, orig_height = self.size
+        level_x = level.width / orig_width / scale
+        level_y = level.height / orig_height / scale
+        x0, y0, x1, y1 = box
+        source = (
+            x0 * level_x,
+            y0 * level_y,
+            min(x1 * level_x, level.width),
+            min(y1 * level_y, level.height)
+        )
+        return level.resize((x1 - x0, y1 - y0), resample, box=source)
+
+
+class LoadCancelled(Exception):
+    """Raised inside an image load that a newer one replaced."""
+
+
+class ImageLoader:
+    """Opens an image and builds its pyramid on a worker thread.
+    
+    Progress and the result go to a queue the UI polls; starting a new load
+    cancels the previous one at its next progress step.
+    """
+    
+    def __init__(self):
+        self.results = queue.Queue()  # (generation, kind, value), kind is "progress", "done" or "error"
+        self.generation = 0
+        self._cancel = None
+    
+    def start(self, file_path):
+        """Start loading file_path, cancelling any load still running."""
+        self.cancel()
+        self.generation += 1
+        self._cancel = threading.Event()
+        threading.Thread(
+            target=self._run,
+            args=(file_path, self.generation, self._cancel),
+            daemon=True
+        ).start()
+        return self.generation
+    
+    def cancel(self):
+        """Stop the load running, if any; results it already queued are then ignored."""
+        if self._cancel is not None:
+            self._cancel.set()
+            self._cancel = None
+            self.generation += 1
+    
+    def _run(self, file_path, generation, cancel):
+        def progress(done):
+            if cancel.is_set():
+                raise LoadCancelled()
+            self.results.put((generation, "progress", done))
+        
+        try:
+            image = pillow().open(file_path)
+        except Exception as e:
+            self.results.put((generation, "error", e))
+            return
+        try:
+            pyramid = ImagePyramid(image, progress=progress)
+        except LoadCancelled:
+            image.close()
+            return
+        except Exception as e:
+            image.close()
+            self.results.put((generation, "error", e))
+            return
+        
+        # The pyramid decodes what it needs from the file; the opened image is
+        # only kept if it became the full-size level
+        if pyramid.levels[0] is not image:
+            image.close()
+        self.results.put((generation, "done", pyramid))
+
+
+class TileRenderWorker:
+    """Background thread that renders full-quality tiles for the latest view only."""
+    
+    def __init__(self):
+        self.results = queue.Queue()  # (generation, key, image, error)
+        self._condition = threading.Condition()
+        self._jobs = []
+        self._generation = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def submit(self, generation, jobs):
+        """Replace all pending work with jobs, a list of (key, pyramid, scale, box).
+        
+        Work queued for an older generation is dropped, and anything still
+        rendering for it is discarded when it finishes.
+        """
+        with self._condition:
+            self._generation = generation
+            self._jobs = list(reversed(jobs))
+            self._condition.notify()
+    
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._jobs:
+                    self._condition.wait()
+                generation = self._generation
+                key, pyramid, scale, box = self._jobs.pop()
+            
+            # A failed tile is reported and keeps its preview; the worker carries on
+            try:
+                image, error = pyramid.render_region(scale, box), None
+            except Exception as e:
+                image, error = None, e
+            
+            with self._condition:
+                if generation != self._generation:
+                    continue
+            self.results.put((generation, key, image, error))
+
+
+class PointIndex:
+    """Every saved point in flat NumPy arrays, for culling and hit tests in original-image pixels.
+    
+    The points are also sorted by grid cell (POINT_CELL pixels square), so a
+    query only reads the cells its rectangle covers, plus the few points added
+    since the cells were last merged. Each group's points are contiguous, so
+    removing one touches only those. A point costs 34 bytes: x, y, group slot,
+    series and image codes, its cell key and its place in cell order.
+    """
+    
+    def __init__(self):
+        np = numpy()
+        self.series = []  # Series code -> name
+        self._codes = {}  # Series name -> code
+        self._image_codes = {None: 0}  # Image of the group -> code, 0 for untagged groups
+        self.groups = []  # Group slot -> (id, name), None once removed
+        self._slots = {}  # Group id -> slot
+        self._starts = np.empty(0, dtype=np.int64)  # Group slot -> index of its first point
+        self._size = 0
+        self._removed = 0
+        self._x = np.empty(0)
+        self._y = np.empty(0)
+        self._slot = np.empty(0, dtype=np.int32)
+        self._code = np.empty(0, dtype=np.int16)
+        self._image = np.empty(0, dtype=np.int16)
+        self._cell_keys = np.empty(0, dtype=np.int64)  # Sorted cell keys of the points merged so far
+        self._cell_order = np.empty(0, dtype=np.int32)  # Point index of each sorted cell key
+        self._merged = 0  # Points before this index are in the cell order
+        self._columns = (0, -1)  # First and last cell column in the cell order
+    
+    def __len__(self):
+        return self._size - self._removed
+    
+    @property
+    def x(self):
+        return self._x[:self._size]
+    
+    @property
+    def y(self):
+        return self._y[:self._size]
+    
+    @property
+    def code(self):
+        return self._code[:self._size]
+    
+    def add_many(self, groups):
+        """Add the points of saved groups, replacing any already indexed under the same id."""
+        groups = {group["id"]: group for group in groups}  # The last of a repeated id wins
+        for group_id in groups:
+            self.remove(group_id)
+        first_slot = len(self.groups)
+        self._reserve_groups(first_slot + len(groups))
+        
+        xs, ys, slots, codes, images, starts = [], [], [], [], [], []
+        for slot, group in enumerate(groups.values(), first_slot):
+            self.groups.append((group["id"], group["name"]))
+            self._slots[group["id"]] = slot
+            starts.append(self._size + len(xs))
+            image = self._image_codes.get(group.get("image"))
+            if image is None:
+                image = self._image_codes[group["image"]] = len(self._image_codes)
+            for key in group_series(group):
+                point = group.get(key)
+                if point is not None:
+                    code = self._codes.get(key)
+                    if code is None:
+                        code = self._codes[key] = len(self.series)
+                        self.series.append(key)
+                    xs.append(point[0])
+                    ys.append(point[1])
+                    slots.append(slot)
+                    codes.append(code)
+                    images.append(image)
+        
+        self._starts[first_slot:len(self.groups)] = starts
+        start = self._size
+        self._reserve(start + len(xs))
+        end = self._size = start + len(xs)
+        self._x[start:end] = xs
+        self._y[start:end] = ys
+        self._slot[start:end] = slots
+        self._code[start:end] = codes
+        self._image[start:end] = images
+    
+    def remove(self, group_id):
+        """Drop the points of a group; they are left as NaN until enough pile up."""
+        np = numpy()
+        slot = self._slots.pop(group_id, None)
+        if slot is None:
+            return
+        self.groups[slot] = None
+        start = self._starts[slot]
+        end = self._starts[slot + 1] if slot + 1 < len(self.groups) else self._size
+        self._x[start:end] = np.nan
+        self._y[start:end] = np.nan
+        self._slot[start:end] = -1
+        self._removed += int(end - start)
+        if self._removed > self._size // 2:
+            self._compact()
+    
+    def clear(self):
+        self.__init__()
+    
+    def query(self, x0, y0, x1, y1, image=None):
+        """Return the indices of the points inside the rectangle, oldest first.
+        
+        Given an image, only points of groups saved on it, or not tagged with
+        any image, are returned.
+        """
+        np = numpy()
+        if self._size - self._merged >= POINT_INDEX_TAIL:
+            self.merge()
+        
+        # The sorted keys of one column of cells are contiguous, from row y0 to row y1
+        row0, row1 = _cell(y0), _cell(y1)
+        column0, column1 = self._columns
+        columns = np.arange(max(_cell(x0), column0), min(_cell(x1), column1) + 1, dtype=np.int64) << 32
+        firsts = np.searchsorted(self._cell_keys, columns + row0, side="left")
+        lasts = np.searchsorted(self._cell_keys, columns + row1, side="right")
+        
+        # Most of the history in view is cheaper to find in one pass over every point
+        scan = np.sum(lasts - firsts) > self._size // 4
+        if scan:
+            x, y, tags = self.x, self.y, self._image[:self._size]
+        else:
+            ranges = [self._cell_order[first:last] for first, last in zip(firsts.tolist(), lasts.tolist()) if last > first]
+            ranges.append(np.arange(self._merged, self._size, dtype=np.int32))
+            candidates = np.sort(np.concatenate(ranges)).astype(np.intp)
+            x, y, tags = self._x[candidates], self._y[candidates], self._image[candidates]
+        
+        inside = (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+        if image is not None:
+            on_image = tags == 0
+            if image in self._image_codes:
+                on_image |= tags == self._image_codes[image]
+            inside &= on_image
+        return np.flatnonzero(inside) if scan else candidates[inside]
+    
+    def key(self, index):
+        """Return the (group id, series) of a point."""
+        return self.groups[self._slot[index]][0], self.series[self._code[index]]
+    
+    def value(self, index):
+        """Return the (group name, series) of a point."""
+        return self.groups[self._slot[index]][1], self.series[self._code[index]]
+    
+    def nearest(self, x, y, max_distance, image=None):
+        """Return (key, x, y, value) of the closest point within max_distance, or None."""
+        np = numpy()
+        found = self.query(x - max_distance, y - max_distance, x + max_distance, y + max_distance, image)
+        if not len(found):
+            return None
+        distances = (self._x[found] - x) ** 2 + (self._y[found] - y) ** 2
+        best = int(np.argmin(distances))
+        if distances[best] > max_distance * max_distance:
+            return None
+        index = found[best]
+        point_x = self._x[index].item()
+        point_y = self._y[index].item()
+        if point_x.is_integer() and point_y.is_integer():
+            point_x, point_y = int(point_x), int(point_y)
+        return self.key(index), point_x, point_y, self.value(index)
+    
+    def _reserve(self, size):
+        """Grow the arrays, doubling them, so adding points stays cheap."""
+        np = numpy()
+        if size > len(self._x):
+            capacity = max(size, 2 * len(self._x), 1024)
+            for name in ("_x", "_y", "_slot", "_code", "_image"):
+                array = getattr(self, name)
+                grown = np.empty(capacity, dtype=array.dtype)
+                grown[:self._size] = array[:self._size]
+                setattr(self, name, grown)
+    
+    def _reserve_groups(self, count):
+        """Grow the group start array, doubling it, so adding groups stays cheap."""
+        np = numpy()
+        if count > len(self._starts):
+            grown = np.empty(max(count, 2 * len(self._starts), 1024), dtype=np.int64)
+            grown[:len(self.groups)] = self._starts[:len(self.groups)]
+            self._starts = grown
+    
+    def merge(self):
+        """Sort the points added since the last merge into the cell order.
+        
+        Queries merge once enough points have been added; call it after adding
+        many so that the first query does not have to.
+        """
+        np = numpy()
+        added = np.arange(self._merged, self._size, dtype=np.int32)
+        keys = _cell_keys(self._x[added], self._y[added])
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        if self._merged:
+            at = np.searchsorted(self._cell_keys, keys, side="right")
+            self._cell_keys = np.insert(self._cell_keys, at, keys)
+            self._cell_order = np.insert(self._cell_order, at, added[order])
+        else:
+            self._cell_keys = keys
+            self._cell_order = added[order]
+        self._merged = self._size
+        
+        # Removed points have the largest key and sort last
+        placed = np.searchsorted(self._cell_keys, np.iinfo(np.int64).max, side="left")
+        if placed:
+            self._columns = (int(self._cell_keys[0] >> 32), int(self._cell_keys[placed - 1] >> 32))
+    
+    def _compact(self):
+        """Drop removed points, renumber the group slots and sort the cells again."""
+        np = numpy()
+        keep = self._slot[:self._size] >= 0
+        alive = np.array([group is not None for group in self.groups], dtype=bool)
+        renumber = (np.cumsum(alive) - 1).astype(np.int32)
+        counts = np.diff(np.append(self._starts[:len(self.groups)], self._size))[alive]
+        self._starts = np.cumsum(counts) - counts
+        self._x = self._x[:self._size][keep]
+        self._y = self._y[:self._size][keep]
+        self._slot = renumber[self._slot[:self._size][keep]]
+        self._code = self._code[:self._size][keep]
+        self._image = self._image[:self._size][keep]
+        self._size = len(self._x)
+        self._removed = 0
+        self.groups = [group for group in self.groups if group is not None]
+        self._slots = {group[0]: slot for slot, group in enumerate(self.groups)}
+        self._cell_keys = np.empty(0, dtype=np.int64)
+        self._cell_order = np.empty(0, dtype=np.int32)
+        self._merged = 0
+        self._columns = (0, -1)
+        self.merge()
+
+
+def _cell(value):
+    """Return the grid cell row or column of a coordinate, clamped to 31 bits."""
+    return max(-CELL_LIMIT, min(CELL_LIMIT, math.floor(value / POINT_CELL)))
+
+
+def _cell_keys(x, y):
+    """Return the cell key of each point: column in the high 32 bits, row below, NaN last."""
+    np = numpy()
+    with np.errstate(invalid="ignore"):
+        columns = np.clip(np.floor(x / POINT_CELL), -CELL_LIMIT, CELL_LIMIT)
+        rows = np.clip(np.floor(y / POINT_CELL), -CELL_LIMIT, CELL_LIMIT)
+    keys = (np.nan_to_num(columns).astype(np.int64) << 32) + np.nan_to_num(rows).astype(np.int64)
+    keys[np.isnan(columns) | np.isnan(rows)] = np.iinfo(np.int64).max
+    return keys
+
+
+class SearchResults:
+    """Group ids matching a search, newest first, put in order only as far as they are read."""
+    
+    def __init__(self, index, ids, start, end):
+        self.keys = index.by_time
+        self.ids = ids  # None when only the timestamp range applies
+        self.start = start
+        self.end = end
+        self.ordered = []
+        self.next = end  # by_time position the ordered ids have been read down to
+        
+        # Few matches are cheaper to sort than to pick out of the whole range
+        if ids is not None and len(ids) * 16 < end - start:
+            keys = sorted((index.entries[group_id][0] for group_id in ids), reverse=True)
+            self.ordered = [key[2] for key in keys]
+            self.next = start
+    
+    def __len__(self):
+        if self.ids is None:
+            return max(0, self.end - self.start)
+        return len(self.ids)
+    
+    def page(self, offset, limit):
+        """Return up to limit matching ids, skipping the newest offset."""
+        if self.ids is None:
+            end = self.end - offset
+            return [key[2] for key in reversed(self.keys[max(self.start, end - limit):end])]
+        
+        wanted = offset + limit
+        while len(self.ordered) < wanted and self.next > self.start:
+            self.next -= 1
+            group_id = self.keys[self.next][2]
+            if group_id in self.ids:
+                self.ordered.append(group_id)
+        return self.ordered[offset:wanted]
+
+
+class GroupSearchIndex:
+    """Prefix index over the words of group names plus a timestamp-sorted index.
+    
+    Query words are matched as prefixes of name words; words containing "-" or
+    ":" are matched as prefixes of the timestamp instead ("2026-02-13").
+    """
+    
+    def __init__(self):
+        self.words = []  # Sorted distinct name words
+        self.postings = {}  # word -> set of group ids
+        self.by_time = []  # Sorted (timestamp, order, group id)
+        self.entries = {}  # group id -> ((timestamp, order, group id), words)
+        self.order = 0
+        self.version = 0  # Bumped on every change, so stale results can be spotted
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    @staticmethod
+    def split_words(text):
+        return re.findall(r"[0-9a-z]+", text.lower())
+    
+    def add(self, group):
+        self.add_many([group])
+    
+    def add_many(self, groups):
+        """Index several groups, merging them into the sorted lists in one pass."""
+        new_keys = []
+        new_words = []
+        for group in groups:
+            self.remove(group["id"])
+            self.order += 1
+            key = (group.get("timestamp") or "", self.order, group["id"])
+            words = set(self.split_words(group["name"]))
+            self.entries[group["id"]] = (key, words)
+            new_keys.append(key)
+            for word in words:
+                ids = self.postings.get(word)
+                if ids is None:
+                    ids = self.postings[word] = set()
+                    new_words.append(word)
+                ids.add(group["id"])
+        
+        if len(new_keys) == 1:
+            bisect.insort(self.by_time, new_keys[0])
+        elif new_keys:
+            self.by_time.extend(new_keys)
+            self.by_time.sort()
+        if new_words:
+            self.words.extend(new_words)
+            self.words.sort()
+        self.version += 1
+    
+    def remove(self, group_id):
+        entry = self.entries.pop(group_id, None)
+        if entry is None:
+            return
+        key, words = entry
+        del self.by_time[bisect.bisect_left(self.by_time, key)]
+        for word in words:
+            ids = self.postings[word]
+            ids.discard(group_id)
+            if not ids:
+                del self.postings[word]
+                del self.words[bisect.bisect_left(self.words, word)]
+        self.version += 1
+    
+    def clear(self):
+        self.words.clear()
+        self.postings.clear()
+        self.by_time.clear()
+        self.entries.clear()
+        self.version += 1
+    
+    def search(self, query):
+        """Return SearchResults for groups matching every query word.
+        
+        Returns None for a blank query, meaning no filter.
+        """
+        terms = query.lower().split()
+        if not terms:
+            return None
+        
+        ids = None
+        low, high = ("",), ("￿",)
+        for term in terms:
+            if "-" in term or ":" in term:
+                # Timestamp prefixes are nested or disjoint, so ranges just narrow
+                low = max(low, (term,))
+                high = min(high, (term + "￿",))
+            else:
+                for word in self.split_words(term):
+                    word_ids = self.match_word(word)
+                    ids = word_ids if ids is None else ids & word_ids
+        
+        start = bisect.bisect_left(self.by_time, low)
+        end = max(start, bisect.bisect_left(self.by_time, high))
+        if ids is not None and (start > 0 or end < len(self.by_time)):
+            ids = {group_id for group_id in ids if low <= self.entries[group_id][0] < high}
+        return SearchResults(self, ids, start, end)
+    
+    def match_word(self, prefix):
+        """Return the ids of groups with a name word starting with prefix."""
+        index = bisect.bisect_left(self.words, prefix)
+        end = bisect.bisect_left(self.words, prefix + "￿")
+        if end - index == 1:
+            return self.postings[self.words[index]]
+        ids = set()
+        for word in self.words[index:end]:
+            ids |= self.postings[word]
+        return ids
+
+
+class Viewport:
+    """Zoom and pan of the image on the canvas, and the transform between the two.
+    
+    Canvas positions are in screen pixels; original positions are pixels of the
+    full-resolution image.
+    """
+    
+    def __init__(self, image_size=(1, 1), canvas_size=(800, 500)):
+        self.image_width, self.image_height = image_size
+        self.canvas_width, self.canvas_height = canvas_size
+        self.zoom_steps = 0
+        self.zoom_factor = 1.0
+        self.offset_x = 0  # Canvas position of the image's top-left corner
+        self.offset_y = 0
+        self.scale = None  # Display pixels per original pixel
+        self.display_width = 0
+        self.display_height = 0
+        self.update()
+    
+    def set_image(self, width, height):
+        self.image_width = width
+        self.image_height = height
+    
+    def set_canvas(self, width, height):
+        self.canvas_width = width
+        self.canvas_height = height
+    
+    def get_state(self):
+        """Return the zoom and pan, to restore later with set_state."""
+        return self.zoom_steps, self.offset_x, self.offset_y
+    
+    def set_state(self, state):
+        self.zoom_steps, self.offset_x, self.offset_y = state
+        self.zoom_factor = ZOOM_STEP ** self.zoom_steps
+    
+    def get_view_scale(self):
+        """Display pixels per original pixel for the current zoom factor."""
+        # At 100% the image fits the canvas, never enlarged past its original size
+        fit = min(
+            (self.canvas_width - 20) / self.image_width,
+            (self.canvas_height - 20) / self.image_height,
+            1.0
+        )
+        return fit * self.zoom_factor
+    
+    def update(self):
+        """Recompute the display transform; return True if the scale changed."""
+        scale = self.get_view_scale()
+        changed = scale != self.scale
+        self.scale = scale
+        self.display_width = max(1, round(self.image_width * scale))
+        self.display_height = max(1, round(self.image_height * scale))
+        return changed
+    
+    def center(self):
+        """Position the image in the middle of the canvas at the current zoom."""
+        scale = self.get_view_scale()
+        self.offset_x = (self.canvas_width - round(self.image_width * scale)) // 2
+        self.offset_y = (self.canvas_height - round(self.image_height * scale)) // 2
+    
+    def pan(self, dx, dy):
+        self.offset_x += dx
+        self.offset_y += dy
+    
+    def zoom_at(self, x, y, steps):
+        """Zoom by whole steps keeping canvas point (x, y) fixed; return the scale ratio."""
+        old_scale = self.get_view_scale()
+        
+        # Clamp to the 10%..2000% range, counted in whole steps
+        min_steps = math.ceil(math.log(MIN_ZOOM) / math.log(ZOOM_STEP))
+        max_steps = math.floor(math.log(MAX_ZOOM) / math.log(ZOOM_STEP))
+        self.zoom_steps = max(min_steps, min(max_steps, self.zoom_steps + steps))
+        self.zoom_factor = ZOOM_STEP ** self.zoom_steps
+        
+        ratio = self.get_view_scale() / old_scale
+        self.offset_x = x - (x - self.offset_x) * ratio
+        self.offset_y = y - (y - self.offset_y) * ratio
+        return ratio
+    
+    def contains(self, x, y):
+        """Return True if canvas point (x, y) is over the image."""
+        return (0 <= x - self.offset_x < self.display_width and
+                0 <= y - self.offset_y < self.display_height)
+    
+    def to_original(self, x, y):
+        """Return the original pixel under canvas point (x, y)."""
+        return int((x - self.offset_x) / self.scale), int((y - self.offset_y) / self.scale)
+    
+    def to_canvas(self, x, y):
+        """Return the canvas position of original pixel (x, y)."""
+        return x * self.scale + self.offset_x, y * self.scale + self.offset_y
+    
+    def original_rect(self):
+        """Return the (x0, y0, x1, y1) original-pixel rectangle the canvas shows."""
+        return (
+            -self.offset_x / self.scale,
+            -self.offset_y / self.scale,
+            (self.canvas_width - self.offset_x) / self.scale,
+            (self.canvas_height - self.offset_y) / self.scale
+        )
+    
+    def visible_tiles(self):
+        """Return the (tile_x, tile_y) of every tile that intersects the canvas."""
+        left = max(0, -self.offset_x)
+        top = max(0, -self.offset_y)
+        right = min(self.display_width, self.canvas_width - self.offset_x)
+        bottom = min(self.display_height, self.canvas_height - self.offset_y)
+        if right <= left or bottom <= top:
+            return []
+        
+        return [
+            (tile_x, tile_y)
+            for tile_y in range(int(top // TILE_SIZE), int((bottom - 1) // TILE_SIZE) + 1)
+            for tile_x in range(int(left // TILE_SIZE), int((right - 1) // TILE_SIZE) + 1)
+        ]
+    
+    def tile_box(self, tile_x, tile_y):
+        """Return the display-space box covered by a tile, clipped to the image."""
+        x0 = tile_x * TILE_SIZE
+        y0 = tile_y * TILE_SIZE
+        return (x0, y0, min(x0 + TILE_SIZE, self.display_width), min(y0 + TILE_SIZE, self.display_height))
+
+
+class GroupDraft:
+    """The points of the group being digitized, in original-image pixels, one per series."""
+    
+    def __init__(self, series=POINT_KEYS, image=None):
+        self.series = tuple(series)
+        self.image = image  # Key of the image the points are on, saved with the group
+        self.points = dict.fromkeys(self.series)
+    
+    def set(self, key, x, y):
+        self.points[key] = (x, y)
+    
+    def clear(self):
+        self.points = dict.fromkeys(self.series)
+    
+    def is_empty(self):
+        return all(point is None for point in self.points.values())
+    
+    def load(self, group):
+        """Copy the points of a saved group, including any series beyond the draft's own."""
+        self.points = dict.fromkeys(self.series)
+        self.points.update((key, group.get(key)) for key in group_series(group))
+    
+    def to_group(self, name):
+        """Return a new saved-group dict of the current points."""
+        group = {"id": new_group_id(), "name": name}
+        group.update(self.points)
+        group["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if self.image is not None:
+            group["image"] = self.image
+        return group
+
+
+def image_key(path):
+    """Return the key an image is open under in a session: its absolute path.
+    
+    Scans from different folders may share a file name.
+    """
+    return os.path.abspath(path)
+
+
+def image_name(path):
+    """Return the name saved groups and calibrations know an image by: its file name."""
+    return os.path.basename(path)
+
+
+class SessionImage:
+    """One open image: its pyramid, how it was last viewed and the group being digitized on it.
+    
+    The decoded pixels are only held by the pyramid, so trimming or dropping
+    it frees them; the file is decoded again from path when needed.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.key = image_key(path)
+        self.name = image_name(path)
+        self.size = None  # Full-resolution (width, height)
+        self.pyramid = None  # None once evicted; the image must then be loaded again
+        self.view = None  # Viewport state when it was last shown
+        self.draft = GroupDraft(image=self.name)
+
+
+class ImageSession:
+    """The images open at once, with their decoded pyramids kept within a memory budget.
+    
+    Going over budget trims the least recently shown images to their smallest
+    pyramid level, which still shows at once and is refined as levels are
+    decoded again, and then drops them altogether. The current image is never
+    evicted.
+    """
+    
+    def __init__(self, budget=DEFAULT_IMAGE_BUDGET):
+        self.budget = budget  # Bytes
+        self.images = OrderedDict()  # key -> SessionImage, least recently shown first
+        self.order = []  # Keys in the order the images were opened, for the tabs
+        self.current = None  # Key of the image shown
+    
+    def __len__(self):
+        return len(self.images)
+    
+    @property
+    def current_name(self):
+        """Name of the image shown, as saved groups and calibrations know it, or None."""
+        return None if self.current is None else self.images[self.current].name
+    
+    def add(self, path, pyramid):
+        """Add a loaded image, or replace the pyramid of one already open; return its entry."""
+        key = image_key(path)
+        entry = self.images.get(key)
+        if entry is None:
+            entry = self.images[key] = SessionImage(path)
+            if key not in self.order:
+                self.order.append(key)
+        entry.size = pyramid.size
+        entry.pyramid = pyramid
+        return entry
+    
+    def get(self, key):
+        return self.images.get(key)
+    
+    def find(self, name):
+        """Return the open image with this name, the current one if several share it, or None."""
+        entries = [entry for entry in self.images.values() if entry.name == name]
+        for entry in entries:
+            if entry.key == self.current:
+                return entry
+        return entries[0] if entries else None
+    
+    def show(self, key):
+        """Make an image current and most recently used; return its entry."""
+        entry = self.images[key]
+        self.images.move_to_end(key)
+        self.current = key
+        return entry
+    
+    def close(self, key):
+        entry = self.images.pop(key, None)
+        if key in self.order:
+            self.order.remove(key)
+        if key == self.current:
+            self.current = None
+        return entry
+    
+    def memory_bytes(self):
+        """Bytes held by the decoded pyramid levels of every open image."""
+        return sum(entry.pyramid.memory_bytes() for entry in self.images.values() if entry.pyramid is not None)
+    
+    def enforce_budget(self):
+        """Trim, then drop, the least recently shown pyramids until memory is within budget."""
+        used = self.memory_bytes()
+        for trim in (True, False):
+            for entry in list(self.images.values()):
+                if used <= self.budget:
+                    return
+                if entry.key == self.current or entry.pyramid is None:
+                    continue
+                before = entry.pyramid.memory_bytes()
+                if trim:
+                    entry.pyramid.trim()
+                    used -= before - entry.pyramid.memory_bytes()
+                else:
+                    entry.pyramid = None
+                    used -= before
+
+
+class GroupHistory:
+    """Saved groups in a group store, with the search and spatial indexes kept in step."""
+    
+    def __init__(self, path, store=None):
+        self.store = store if store is not None else open_group_store(path)  # JSON journal or SQLite
+        self.search_index = GroupSearchIndex()
+        self.spatial_index = PointIndex()
+    
+    def load(self, progress=None):
+        """Load the store and rebuild the indexes from it.
+        
+        progress, if given, is called with the fraction indexed after each chunk.
+        """
+        try:
+            self.store.load()
+        finally:
+            self.search_index.clear()
+            self.spatial_index.clear()
+            # Only a chunk of groups is held as dicts at a time
+            total = self.store.count()
+            groups = self.store.iter_groups()
+            indexed = 0
+            while True:
+                chunk = list(itertools.islice(groups, HISTORY_INDEX_CHUNK))
+                if not chunk:
+                    break
+                self.index(chunk)
+                indexed += len(chunk)
+                if progress is not None:
+                    progress(min(1.0, indexed / total))
+            self.spatial_index.merge()
+    
+    def close(self):
+        self.store.close()
+    
+    def commit(self):
+        """Write the edits made since the last commit; the JSON journal writes in the background."""
+        self.store.commit()
+    
+    def flush(self):
+        """Write every edit made so far and wait until it is on disk."""
+        self.store.flush()
+    
+    def save_status(self):
+        return self.store.save_status()
+    
+    def count(self):
+        return self.store.count()
+    
+    def get(self, group_id):
+        return self.store.get(group_id)
+    
+    def get_many(self, group_ids):
+        return self.store.get_many(group_ids)
+    
+    def ids(self):
+        return self.store.ids()
+    
+    def page(self, offset, limit):
+        return self.store.page(offset, limit)
+    
+    def iter_groups(self):
+        return self.store.iter_groups()
+    
+    def add(self, group):
+        self.store.add(group)
+        self.index([group])
+    
+    def delete(self, group_id):
+        group = self.store.get(group_id)
+        if group is not None:
+            self.store.delete(group_id)
+            self.unindex(group)
+    
+    def reset(self):
+        self.store.reset()
+        self.search_index.clear()
+        self.spatial_index.clear()
+    
+    def import_batch(self, groups):
+        """Add the groups not already saved; return (added groups, skipped count).
+        
+        Duplicates are found by content hash; imported ids that clash with the
+        history or with each other are replaced. Every group is checked before
+        any is saved, so a malformed one raises ValueError with the store and
+        the indexes still in step.
+        """
+        batch = []
+        hashes = set()
+        ids = set()
+        skipped = 0
+        for group in groups:
+            group = checked_group(group)
+            
+            # Skip groups already saved, or repeated in this batch
+            content_hash = group_hash(group)
+            if content_hash in hashes or self.store.has_hash(content_hash):
+                skipped += 1
+                continue
+            hashes.add(content_hash)
+            
+            group_id = group.get("id")
+            if group_id is None or group_id in ids or self.store.get(group_id) is not None:
+                group["id"] = new_group_id()
+            ids.add(group["id"])
+            batch.append(group)
+        
+        if batch:
+            self.store.add_many(batch)
+            self.index(batch)
+        return batch, skipped
+    
+    def index(self, groups):
+        """Add saved groups to the spatial and search indexes."""
+        self.spatial_index.add_many(groups)
+        self.search_index.add_many(groups)
+    
+    def unindex(self, group):
+        """Remove a saved group from the spatial and search indexes."""
+        self.spatial_index.remove(group["id"])
+        self.search_index.remove(group["id"])
+
+
+class HistoryLoader:
+    """Opens and loads a GroupHistory on a worker thread, so the window can show first.
+    
+    The history is only handed over once loaded and indexed; until then the
+    worker is its only user. Progress and the result go to a queue the UI polls.
+    """
+    
+    def __init__(self):
+        self.results = queue.Queue()  # (kind, value), kind is "progress" or "done"
+    
+    def start(self, path):
+        threading.Thread(target=self._run, args=(path,), daemon=True).start()
+    
+    def _run(self, path):
+        history = error = None
+        try:
+            history = GroupHistory(path)
+            history.load(progress=lambda done: self.results.put(("progress", done)))
+        except Exception as e:
+            error = e  # What did load is still used, as when loading on the UI thread
+        self.results.put(("done", (history, error)))
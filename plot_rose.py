@@ -0,0 +1,348 @@
+"""
+Draw Nightingale rose diagrams from digitized coordinate groups.
+
+Each group is one monthly wedge: the distance from its origin to each boundary
+point is the radius of that cause's wedge. Groups are placed by the month and
+year in their name ("january 1855"), twelve months to a diagram starting with
+April 1854 at nine o'clock and going clockwise, later diagrams to the left as
+in the original.
+
+RoseRenderer keeps each wedge's geometry and its drawn layer, so adding or
+removing a group only redraws that month; the app uses it for its live
+preview. Run as a script to render an export to an image:
+
+    python plot_rose.py coordinate_groups_export.json -o data/nightingale_rose.png
+"""
+
+import argparse
+import math
+import os
+import zlib
+
+from PIL import Image, ImageDraw, ImageFont
+
+from group_storage import group_series
+
+
+MONTHS = ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+MONTH_LABELS = ("APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC", "JAN", "FEB", "MAR")
+
+# The first diagram opens with April 1854; wedge k spans 180 - 30k down to
+# 150 - 30k degrees, counter-clockwise from three o'clock.
+FIRST_MONTH = 1854 * 12 + 3
+WEDGE_DEGREES = 30
+
+# Wedge fill for each cause; other series get a color picked by name
+SERIES_COLORS = {"blue": (132, 168, 196), "red": (214, 117, 108), "black": (70, 70, 70)}
+EXTRA_COLORS = ((230, 159, 0), (128, 100, 162), (150, 105, 70), (204, 121, 167), (86, 180, 180), (200, 180, 60))
+
+BACKGROUND = (255, 255, 255, 255)
+LABEL_COLOR = (90, 90, 90, 255)
+MONTH_COLOR = (170, 170, 170, 255)
+GUIDE_COLOR = (225, 225, 225, 255)
+
+
+def series_fill(key):
+    """Return the RGBA fill of a series' wedges."""
+    color = SERIES_COLORS.get(key)
+    if color is None:
+        color = EXTRA_COLORS[zlib.crc32(key.encode("utf-8")) % len(EXTRA_COLORS)]
+    return color + (255,)
+
+
+def parse_month(name):
+    """Return the (year or None, month 0-11) in a group name, or None without a month."""
+    month = year = None
+    for word in name.lower().replace(",", " ").split():
+        if month is None and word[:3] in MONTHS and word.isalpha():
+            month = MONTHS.index(word[:3])
+        elif year is None and len(word) == 4 and word.isdigit():
+            year = int(word)
+    if month is None:
+        return None
+    return year, month
+
+
+def wedge_slot(group):
+    """Return the (diagram, wedge) a group is drawn at, or None if it cannot be placed.
+
+    The diagram counts years from April 1854 and is None for a month without
+    a year. Without a month in the name, the wedge is the sector the group's
+    boundary points lie in.
+    """
+    parsed = parse_month(group.get("name") or "")
+    if parsed is not None:
+        year, month = parsed
+        if year is None:
+            return None, (month - 3) % 12
+        return divmod(year * 12 + month - FIRST_MONTH, 12)
+
+    origin = group.get("origin")
+    points = [group[key] for key in group_series(group) if key != "origin" and group.get(key)]
+    if not origin or not points:
+        return None
+    dx = sum(x for x, _ in points) / len(points) - origin[0]
+    dy = sum(y for _, y in points) / len(points) - origin[1]
+    if not dx and not dy:
+        return None
+    angle = math.degrees(math.atan2(-dy, dx))  # Image y grows downwards
+    return None, int((180 - angle) % 360 // WEDGE_DEGREES) % 12
+
+
+def wedge_radii(group):
+    """Return {series: radius in image pixels} of a group's wedges; empty without an origin."""
+    origin = group.get("origin")
+    if not origin:
+        return {}
+    radii = {}
+    for key in group_series(group):
+        point = group.get(key)
+        if key != "origin" and point:
+            radius = math.hypot(point[0] - origin[0], point[1] - origin[1])
+            if radius > 0:
+                radii[key] = radius
+    return radii
+
+
+def diagram_title(diagram):
+    if diagram is None:
+        return "UNDATED"
+    year = (FIRST_MONTH + diagram * 12) // 12
+    return f"APRIL {year} TO MARCH {year + 1}"
+
+
+def load_font(size):
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:
+        return ImageFont.load_default()  # Pillow before 10.1 has one bitmap size
+
+
+class RoseRenderer:
+    """Rose diagrams of a set of groups, redrawn one month at a time as groups change.
+
+    Every wedge (diagram, month) has its own layer. When several groups fall on
+    the same wedge the most recently added one is drawn. Layers are only
+    redrawn when their groups change, or all of them when the layout or the
+    scale does: a new diagram, or a new longest radius.
+    """
+
+    def __init__(self, size=(1200, 600), supersample=2):
+        self.size = size
+        self.supersample = supersample  # Drawn this many times larger, then downsampled
+        self.slot_groups = {}  # (diagram, wedge) -> {group id: radii}, oldest first
+        self.group_slots = {}  # group id -> (diagram, wedge)
+        self.layers = {}  # (diagram, wedge) -> (x, y, RGBA image)
+        self.dirty = set()  # Slots whose layer is out of date
+        self.layout = None
+        self.background = None
+        self.image = None
+        self.redrawn = 0  # Layers drawn by the last render
+
+    def __len__(self):
+        return len(self.group_slots)
+
+    def clear(self):
+        self.slot_groups.clear()
+        self.group_slots.clear()
+        self.layers.clear()
+        self.dirty.clear()
+        self.layout = None
+        self.image = None
+
+    def set_groups(self, groups):
+        """Replace every group; the next render draws everything."""
+        self.clear()
+        for group in groups:
+            self.add(group)
+
+    def add(self, group):
+        """Add a group, or update it if one with its id was added before."""
+        group_id = group.get("id") or object()  # Groups from old exports have no id
+        self.remove(group_id)
+        slot = wedge_slot(group)
+        radii = wedge_radii(group)
+        if slot is None or not radii:
+            return
+        self.slot_groups.setdefault(slot, {})[group_id] = radii
+        self.group_slots[group_id] = slot
+        self.dirty.add(slot)
+
+    def remove(self, group_id):
+        """Remove a group; unknown ids are ignored."""
+        slot = self.group_slots.pop(group_id, None)
+        if slot is None:
+            return
+        groups = self.slot_groups[slot]
+        del groups[group_id]
+        if not groups:
+            del self.slot_groups[slot]
+        self.dirty.add(slot)
+
+    def wedges(self, slot):
+        """Return the {series: radius} drawn at a slot."""
+        groups = self.slot_groups.get(slot)
+        if not groups:
+            return {}
+        return next(reversed(groups.values()))
+
+    def get_layout(self):
+        """Return the diagrams shown, in drawing order, and the pixels per image pixel of radius."""
+        diagrams = sorted({diagram for diagram, _ in self.slot_groups if diagram is not None}, reverse=True)
+        if any(diagram is None for diagram, _ in self.slot_groups):
+            diagrams.append(None)
+        longest = max((max(self.wedges(slot).values()) for slot in self.slot_groups), default=1.0)
+        max_radius = self.diagram_radius(len(diagrams)) - 4 * self.supersample
+        return tuple(diagrams), max(1.0, max_radius) / longest
+
+    def canvas_size(self):
+        return self.size[0] * self.supersample, self.size[1] * self.supersample
+
+    def cell_size(self, count):
+        """Side by side, or stacked when the image is taller than wide."""
+        width, height = self.canvas_size()
+        if height > width:
+            return width, height / count
+        return width / count, height
+
+    def diagram_radius(self, count):
+        """Return the radius a diagram has room for, in canvas pixels."""
+        cell_width, cell_height = self.cell_size(max(1, count))
+        return min(cell_width, cell_height - self.title_height()) / 2
+
+    def title_height(self):
+        return 14 * self.supersample
+
+    def center(self, diagram):
+        """Return the canvas position of a diagram's center."""
+        diagrams, _ = self.layout
+        cell_width, cell_height = self.cell_size(len(diagrams))
+        index = diagrams.index(diagram)
+        width, height = self.canvas_size()
+        if height > width:
+            return cell_width / 2, index * cell_height + (cell_height - self.title_height()) / 2
+        return index * cell_width + cell_width / 2, (cell_height - self.title_height()) / 2
+
+    def draw_background(self):
+        """Draw the month guides and diagram titles, which only change with the layout."""
+        diagrams, _ = self.layout
+        self.background = Image.new("RGBA", self.canvas_size(), BACKGROUND)
+        draw = ImageDraw.Draw(self.background)
+        font = load_font(10 * self.supersample)
+        max_radius = self.diagram_radius(len(diagrams))
+        for diagram in diagrams:
+            cx, cy = self.center(diagram)
+            for wedge in range(12):
+                angle = math.radians(180 - wedge * WEDGE_DEGREES)
+                draw.line(
+                    (cx, cy, cx + max_radius * math.cos(angle), cy - max_radius * math.sin(angle)),
+                    fill=GUIDE_COLOR, width=self.supersample
+                )
+                middle = angle - math.radians(WEDGE_DEGREES / 2)
+                label_radius = max_radius - 8 * self.supersample
+                draw.text(
+                    (cx + label_radius * math.cos(middle), cy - label_radius * math.sin(middle)),
+                    MONTH_LABELS[wedge], fill=MONTH_COLOR, font=font, anchor="mm"
+                )
+            draw.text(
+                (cx, cy + max_radius + self.title_height() / 2), diagram_title(diagram),
+                fill=LABEL_COLOR, font=font, anchor="mm"
+            )
+
+    def draw_layer(self, slot):
+        """Draw the wedges of one slot into its own layer, longest first so all stay visible."""
+        diagram, wedge = slot
+        _, scale = self.layout
+        wedges = sorted(self.wedges(slot).items(), key=lambda item: -item[1])
+        cx, cy = self.center(diagram)
+        # PIL angles go clockwise from three o'clock
+        start = wedge * WEDGE_DEGREES - 180
+        end = start + WEDGE_DEGREES
+
+        # The layer only covers the sector, so compositing it stays cheap
+        longest = wedges[0][1] * scale
+        angles = [start, end] + [angle for angle in range(-180, 360, 90) if start < angle < end]
+        xs = [0] + [longest * math.cos(math.radians(angle)) for angle in angles]
+        ys = [0] + [longest * math.sin(math.radians(angle)) for angle in angles]
+        x0 = math.floor(cx + min(xs)) - 1
+        y0 = math.floor(cy + min(ys)) - 1
+        layer = Image.new("RGBA", (math.ceil(cx + max(xs)) + 2 - x0, math.ceil(cy + max(ys)) + 2 - y0), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(layer)
+        for key, radius in wedges:
+            r = radius * scale
+            box = (cx - x0 - r, cy - y0 - r, cx - x0 + r, cy - y0 + r)
+            draw.pieslice(box, start, end, fill=series_fill(key), outline=BACKGROUND,
+                          width=max(1, self.supersample // 2))
+        self.layers[slot] = (x0, y0, layer)
+
+    def render(self):
+        """Return the diagrams as an RGB image of self.size, redrawing only what changed."""
+        layout = self.get_layout()
+        if layout != self.layout:
+            self.layout = layout
+            self.draw_background()
+            self.layers.clear()
+            self.dirty = set(self.slot_groups)
+        elif not self.dirty and self.image is not None:
+            self.redrawn = 0
+            return self.image
+
+        for slot in self.dirty:
+            if slot in self.slot_groups:
+                self.draw_layer(slot)
+            else:
+                self.layers.pop(slot, None)
+        self.redrawn = len(self.dirty)
+        self.dirty = set()
+
+        image = self.background.copy()
+        for x, y, layer in self.layers.values():
+            image.alpha_composite(layer, (x, y))
+        image = image.convert("RGB")
+        if self.supersample > 1:
+            image = image.reduce(self.supersample)
+        self.image = image
+        return image
+
+
+def main():
+    from nightingale_compute import close_groups, load_groups
+
+    parser = argparse.ArgumentParser(description="Draw Nightingale rose diagrams from coordinate groups")
+    parser.add_argument("input", nargs="?", default="coordinate_groups_export.json",
+                        help="export, history JSON or SQLite history (default: coordinate_groups_export.json)")
+    parser.add_argument("-o", "--output", default="data/nightingale_rose.png",
+                        help="output image file (default: data/nightingale_rose.png)")
+    parser.add_argument("--size", default="1600x800", help="image size as WIDTHxHEIGHT (default: 1600x800)")
+    parser.add_argument("--image", help="only draw the groups digitized on this image")
+    args = parser.parse_args()
+
+    try:
+        size = tuple(int(n) for n in args.size.lower().split("x"))
+        if len(size) != 2 or min(size) <= 0:
+            raise ValueError
+    except ValueError:
+        parser.error(f"Expected WIDTHxHEIGHT, got {args.size!r}")
+
+    try:
+        loaded = groups = load_groups(args.input)
+        try:
+            if args.image:
+                groups = [group for group in groups if group.get("image") == args.image]
+            renderer = RoseRenderer(size, supersample=3)
+            renderer.set_groups(groups)
+        finally:
+            close_groups(loaded)
+
+        output_dir = os.path.dirname(args.output)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        renderer.render().save(args.output)
+    except (OSError, ValueError) as e:
+        parser.exit(1, f"Error: {e}\n")
+
+    print(f"Drew {len(renderer)} of {len(groups)} groups to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
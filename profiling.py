@@ -0,0 +1,124 @@
+"""
+Lightweight latency instrumentation for the digitization app.
+
+Methods decorated with @profiled record how long each call takes into a
+per-name LatencyHistogram on the instance's Profiler. Recording costs about a
+microsecond, so it is always on; the debug panel and --profile read from it.
+One-off milestones, such as when the window first appeared, are recorded as
+the time since the Profiler's start.
+"""
+
+import functools
+import json
+import time
+
+
+# Histogram bucket upper bounds in milliseconds; anything slower lands in the last bucket
+BUCKET_BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 33, 66, 125, 250, 500, 1000, 2000, 5000)
+
+
+class LatencyHistogram:
+    """Call count, total, maximum and bucketed distribution of durations."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0  # Seconds
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        ms = seconds * 1000
+        for index, bound in enumerate(BUCKET_BOUNDS_MS):
+            if ms <= bound:
+                self.buckets[index] += 1
+                return
+        self.buckets[-1] += 1
+
+    def percentile(self, fraction):
+        """Return the upper bound in ms of the bucket holding that fraction of calls."""
+        if not self.count:
+            return 0.0
+        wanted = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets[:-1]):
+            seen += count
+            if seen >= wanted:
+                return min(BUCKET_BOUNDS_MS[index], self.max * 1000)
+        return self.max * 1000
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "max_ms": self.max * 1000,
+            "buckets": dict(zip([f"<={bound}ms" for bound in BUCKET_BOUNDS_MS] + ["slower"], self.buckets)),
+        }
+
+
+class Profiler:
+    """Named latency histograms, and milestones since a start time."""
+
+    def __init__(self, start=None):
+        self.histograms = {}
+        self.milestones = {}  # Name -> ms from start
+        self.started = time.time()
+        self.start = time.perf_counter() if start is None else start  # perf_counter() value
+
+    def mark(self, name, at=None):
+        """Record a milestone reached at the perf_counter() value at, or now."""
+        self.milestones[name] = ((time.perf_counter() if at is None else at) - self.start) * 1000
+
+    def record(self, name, seconds):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def snapshot(self):
+        """Return every histogram summary, keyed by name."""
+        return {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+
+    def report(self):
+        """Return a fixed-width text table of the histograms for the debug panel."""
+        lines = [f"{'':24} {'calls':>7} {'mean':>8} {'p95':>8} {'max':>8}"]
+        for name, histogram in sorted(self.histograms.items()):
+            summary = histogram.summary()
+            lines.append(
+                f"{name[:24]:24} {summary['count']:7d} {summary['mean_ms']:7.2f}ms "
+                f"{summary['p95_ms']:7.2f}ms {summary['max_ms']:7.1f}ms"
+            )
+        return "\n".join(lines)
+
+    def milestone_report(self):
+        """Return the milestones in the order they were reached, as a text table."""
+        lines = [f"{'milestone':24} {'ms':>8}"]
+        for name, ms in sorted(self.milestones.items(), key=lambda item: item[1]):
+            lines.append(f"{name[:24]:24} {ms:8.1f}")
+        return "\n".join(lines)
+
+    def dump(self, path, extra=None):
+        """Write the histograms, plus any extra fields, to a JSON file."""
+        data = {"started": self.started, "duration_s": time.time() - self.started}
+        data.update(extra or {})
+        data["milestones_ms"] = dict(self.milestones)
+        data["latency"] = self.snapshot()
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+
+
+def profiled(method):
+    """Record the duration of each call of a method in self.profiler."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.profiler.record(method.__name__, time.perf_counter() - start)
+    return wrapper
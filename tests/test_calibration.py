@@ -0,0 +1,78 @@
+"""
+Tests for calibration: affine and homography fits recover known transforms.
+
+    python -m pytest tests
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from calibration import Calibration  # noqa: E402
+
+
+AFFINE = np.array([[0.02, -0.005, -3.0], [0.004, -0.03, 120.0], [0.0, 0.0, 1.0]])
+HOMOGRAPHY = np.array([[0.9, 0.08, 12.0], [-0.05, 1.1, 30.0], [0.0002, -0.0001, 1.0]])
+
+
+def project(matrix, points):
+    points = np.asarray(points, dtype=float)
+    homogeneous = np.column_stack([points, np.ones(len(points))]) @ matrix.T
+    return homogeneous[:, :2] / homogeneous[:, 2:]
+
+
+def references(matrix, points):
+    return [(tuple(image), tuple(data)) for image, data in zip(points, project(matrix, points).tolist())]
+
+
+IMAGE_POINTS = [(40, 60), (1800, 90), (1750, 1300), (70, 1250), (900, 700), (400, 1000)]
+
+
+@pytest.mark.parametrize("kind, matrix", [("affine", AFFINE), ("homography", HOMOGRAPHY)])
+@pytest.mark.parametrize("count", [None, 6])
+def test_fit_recovers_a_known_transform(kind, matrix, count):
+    points = IMAGE_POINTS[:count or {"affine": 3, "homography": 4}[kind]]
+    calibration = Calibration.fit(references(matrix, points), kind)
+    np.testing.assert_allclose(calibration.matrix, matrix, rtol=1e-7, atol=1e-9)
+    assert calibration.rms_error() < 1e-9
+
+    # Batch and single-point conversions agree, both ways, on points not used to fit
+    grid = np.array([(x, y) for x in range(0, 2000, 250) for y in range(0, 1500, 250)], dtype=float)
+    data = calibration.apply(grid)
+    np.testing.assert_allclose(data, project(matrix, grid), rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(calibration.apply_inverse(data), grid, atol=1e-6)
+    for (x, y), (u, v) in zip(grid.tolist(), data.tolist()):
+        assert calibration.to_data(x, y) == pytest.approx((u, v), abs=1e-9)
+        assert calibration.to_image(u, v) == pytest.approx((x, y), abs=1e-6)
+
+
+def test_least_squares_fit_averages_out_noise():
+    rng = np.random.default_rng(0)
+    points = rng.uniform(0, 2000, size=(40, 2))
+    data = project(AFFINE, points) + rng.normal(0, 0.01, size=(40, 2))
+    calibration = Calibration.fit(list(zip(points.tolist(), data.tolist())), "affine")
+    np.testing.assert_allclose(calibration.apply(points), project(AFFINE, points), atol=0.01)
+    assert 0.005 < calibration.rms_error() < 0.02
+
+
+def test_saved_calibration_loads_the_same():
+    calibration = Calibration.fit(references(HOMOGRAPHY, IMAGE_POINTS), "homography")
+    loaded = Calibration.from_dict(calibration.to_dict())
+    assert loaded.kind == "homography"
+    assert loaded.references == calibration.references
+    np.testing.assert_array_equal(loaded.matrix, calibration.matrix)
+
+
+@pytest.mark.parametrize("kind, points", [
+    ("affine", [(0, 0), (10, 10), (20, 20), (30, 30)]),
+    ("homography", [(0, 0), (10, 10), (20, 20), (0, 50)]),
+    ("affine", [(0, 0), (10, 0)]),
+    ("homography", [(0, 0), (10, 0), (0, 10)]),
+])
+def test_degenerate_references_raise(kind, points):
+    with pytest.raises(ValueError):
+        Calibration.fit(references(AFFINE, points), kind)
@@ -0,0 +1,100 @@
+"""
+Tests for export_delta: diffing two exports and merging the delta back.
+
+    python -m pytest tests
+"""
+
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from export_delta import diff_exports, load_delta, merge_delta, read_export  # noqa: E402
+from group_storage import write_groups_columnar, write_groups_json  # noqa: E402
+
+
+def make_group(i, rng):
+    return {
+        "id": f"g{i}",
+        "name": f"group {i}",
+        "origin": [rng.randrange(100), rng.randrange(100)],
+        "red": [rng.randrange(100), rng.randrange(100)] if rng.random() < 0.8 else None,
+        "blue": None,
+        "black": [rng.randrange(100), rng.randrange(100)],
+        "timestamp": f"2024-01-{i % 28 + 1:02d} 12:00:00",
+    }
+
+
+def write(path, groups):
+    if path.endswith(".ngc"):
+        write_groups_columnar(path, groups)
+    else:
+        write_groups_json(path, groups)
+    return path
+
+
+def edited(groups, rng):
+    """Return groups with some deleted, some changed in place and some added at the end."""
+    result = []
+    for group in groups:
+        roll = rng.random()
+        if roll < 0.2:
+            continue
+        if roll < 0.35:
+            group = dict(group, name=group["name"] + " (moved)", red=[rng.randrange(100), 7])
+        result.append(group)
+    return result + [make_group(1000 + i, rng) for i in range(15)]
+
+
+@pytest.mark.parametrize("extension", [".json", ".ngc"])
+def test_merging_a_diff_gives_the_new_export(tmp_path, extension):
+    rng = random.Random(0)
+    old_groups = [make_group(i, rng) for i in range(60)]
+    new_groups = edited(old_groups, rng)
+    old = write(str(tmp_path / f"old{extension}"), old_groups)
+    new = write(str(tmp_path / f"new{extension}"), new_groups)
+
+    delta_path = str(tmp_path / "changes.delta.json")
+    changed_or_added, deleted = diff_exports(old, new, delta_path)
+    delta = load_delta(delta_path)
+    merged = str(tmp_path / f"merged{extension}")
+    changed, added, dropped = merge_delta(old, delta, merged)
+
+    assert list(read_export(merged)) == new_groups
+    assert (changed + added, dropped) == (changed_or_added, deleted)
+    assert added == 15
+    assert dropped == len(old_groups) - (len(new_groups) - added)
+
+    # Merged again onto its own result, the delta is refused
+    with pytest.raises(ValueError):
+        merge_delta(merged, delta, str(tmp_path / f"twice{extension}"))
+
+
+def test_delta_onto_another_export_is_refused(tmp_path):
+    rng = random.Random(1)
+    base = [make_group(i, rng) for i in range(20)]
+    old = write(str(tmp_path / "old.json"), base)
+    new = write(str(tmp_path / "new.json"), edited(base, rng))
+    other = write(str(tmp_path / "other.json"), base[:-1])
+    diff_exports(old, new, str(tmp_path / "changes.delta.json"))
+    delta = load_delta(str(tmp_path / "changes.delta.json"))
+
+    output = str(tmp_path / "merged.json")
+    with pytest.raises(ValueError):
+        merge_delta(other, delta, output)
+    assert not os.path.exists(output)
+
+    # Forced, it applies anyway, and only the deletes the base had are counted
+    delta["deleted"].append("not-in-any-export")
+    _, _, dropped = merge_delta(other, delta, output, check=False)
+    assert dropped == sum(1 for group_id in delta["deleted"] if group_id in {group["id"] for group in base[:-1]})
+
+
+def test_diff_needs_group_ids(tmp_path):
+    old = write(str(tmp_path / "old.json"), [{"name": "no id", "red": [1, 2], "timestamp": None}])
+    new = write(str(tmp_path / "new.json"), [])
+    with pytest.raises(ValueError):
+        diff_exports(old, new, str(tmp_path / "changes.delta.json"))
@@ -0,0 +1,205 @@
+"""
+Tests for nightingale_core: the image session's memory budget, history
+imports, and the spatial and search indexes.
+
+    python -m pytest tests
+"""
+
+import gc
+import itertools
+import os
+import random
+import sys
+import weakref
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nightingale_core  # noqa: E402
+from nightingale_core import GroupHistory, GroupSearchIndex, ImageLoader, ImageSession, PointIndex  # noqa: E402
+
+
+def load_pyramid(path):
+    loader = ImageLoader()
+    loader.start(path)
+    while True:
+        _, kind, value = loader.results.get(timeout=30)
+        if kind == "done":
+            return value
+        assert kind != "error", value
+
+
+def save_png(tmp_path, name, size):
+    from PIL import Image
+    path = str(tmp_path / name)
+    Image.linear_gradient("L").resize(size).convert("RGB").save(path)
+    return path
+
+
+def test_trimmed_image_is_freed(tmp_path):
+    first = save_png(tmp_path, "first.png", (2000, 1500))
+    second = save_png(tmp_path, "second.png", (600, 400))
+    session = ImageSession(budget=2 * 1024 * 1024)
+
+    pyramid = load_pyramid(first)
+    full_size = weakref.ref(pyramid.levels[0])
+    entry = session.add(first, pyramid)
+    session.show(entry.key)
+    del pyramid
+
+    session.show(session.add(second, load_pyramid(second)).key)
+    session.enforce_budget()
+    gc.collect()
+
+    # Trimming alone brought it within budget; the full-size pixels it counted
+    # as freed must not still be held anywhere
+    assert entry.pyramid is not None
+    assert session.memory_bytes() <= session.budget
+    assert full_size() is None
+    assert entry.size == (2000, 1500)
+
+
+
+@pytest.mark.parametrize("bad", [
+    {"name": "bad", "red": [1]},
+    {"name": "bad", "red": [1, float("nan")]},
+    {"name": "bad", "red": ["1", 2]},
+    {"name": ["not", "text"]},
+    {"name": "bad", "image": {"file": "scan.png"}},
+    ["name", "bad"],
+])
+def test_malformed_import_saves_nothing(tmp_path, bad):
+    history = GroupHistory(str(tmp_path / "history.json"))
+    history.load()
+    history.add({"id": "kept", "name": "kept", "red": [5, 5], "timestamp": "2024-01-01 00:00:00"})
+    good = {"name": "good", "red": (1, 2), "timestamp": "2024-01-02 00:00:00"}
+    with pytest.raises(ValueError):
+        history.import_batch([good, bad])
+
+    # Neither group reached the store, so it and the indexes still agree
+    assert history.ids() == ["kept"]
+    assert len(history.spatial_index) == 1
+    assert list(history.search_index.entries) == ["kept"]
+
+    added, skipped = history.import_batch([good])
+    assert (len(added), skipped) == (1, 0)
+    assert history.get(added[0]["id"])["red"] == [1, 2]
+    history.close()
+
+
+NAME_WORDS = ["january", "june", "july", "scutari", "left", "right", "diagram", "1854", "1855"]
+
+
+def random_group(group_id, rng):
+    group = {"id": group_id, "name": " ".join(rng.sample(NAME_WORDS, 3))}
+    for key in ("origin", "red", "blue", "black"):
+        # Clustered points, some far out and some negative, as on a large scan
+        group[key] = [rng.randrange(-300, 3000), rng.randrange(-300, 2000)] if rng.random() < 0.8 else None
+    if rng.random() < 0.2:
+        group["extra"] = [rng.uniform(0, 100), rng.uniform(0, 100)]
+    group["timestamp"] = f"2024-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d} 12:00:00"
+    image = rng.choice([None, "a.png", "b.png"])
+    if image is not None:
+        group["image"] = image
+    return group
+
+
+def random_history(rng, steps, add, remove, groups, ids):
+    """Add and remove random groups through add and remove, keeping groups (id -> group) to match."""
+    for _ in range(steps):
+        if rng.random() < 0.7 or not groups:
+            batch = [random_group(f"g{next(ids)}", rng) for _ in range(rng.randrange(1, 40))]
+            if groups and rng.random() < 0.1:
+                batch.append(random_group(rng.choice(list(groups)), rng))  # Replaces an indexed group
+            add(batch)
+            for group in batch:
+                groups.pop(group["id"], None)
+                groups[group["id"]] = group
+        else:
+            for group_id in rng.sample(list(groups), min(len(groups), rng.randrange(1, 20))):
+                remove(group_id)
+                del groups[group_id]
+
+
+def test_point_index_matches_brute_force(monkeypatch):
+    monkeypatch.setattr(nightingale_core, "POINT_INDEX_TAIL", 64)
+    rng = random.Random(7)
+    index = PointIndex()
+    groups = {}
+    ids = itertools.count()
+    for _ in range(8):
+        random_history(rng, 30, index.add_many, index.remove, groups, ids)
+        assert len(index) == sum(
+            1 for group in groups.values() for key, point in group.items()
+            if key not in ("id", "name", "timestamp", "image") and point is not None
+        )
+        for _ in range(20):
+            x0, y0 = rng.randrange(-400, 3000), rng.randrange(-400, 2000)
+            x1, y1 = x0 + rng.choice([5, 100, 1000, 5000]), y0 + rng.choice([5, 100, 1000, 5000])
+            image = rng.choice([None, "a.png", "b.png", "unknown.png"])
+            found = {index.key(i) for i in index.query(x0, y0, x1, y1, image).tolist()}
+            expected = {
+                (group["id"], key) for group in groups.values() for key, point in group.items()
+                if key not in ("id", "name", "timestamp", "image") and point is not None
+                and x0 <= point[0] <= x1 and y0 <= point[1] <= y1
+                and (image is None or group.get("image") in (None, image))
+            }
+            assert found == expected
+
+            # The nearest point is at the smallest distance of any in range; ties may pick either
+            x, y, reach = rng.randrange(-400, 3000), rng.randrange(-400, 2000), rng.choice([10, 50, 200])
+            distances = {
+                (group["id"], key): (point[0] - x) ** 2 + (point[1] - y) ** 2
+                for group in groups.values() for key, point in group.items()
+                if key not in ("id", "name", "timestamp", "image") and point is not None
+                and (image is None or group.get("image") in (None, image))
+            }
+            closest = min(distances.values(), default=None)
+            nearest = index.nearest(x, y, reach, image)
+            if closest is None or closest > reach * reach:
+                assert nearest is None
+            else:
+                assert distances[nearest[0]] == closest
+
+
+def test_search_index_matches_brute_force():
+    rng = random.Random(8)
+    index = GroupSearchIndex()
+    order = []  # Ids in the order they were last indexed
+
+    def add(groups):
+        index.add_many(groups)
+        for group in groups:
+            if group["id"] in order:
+                order.remove(group["id"])
+            order.append(group["id"])
+
+    def remove(group_id):
+        index.remove(group_id)
+        order.remove(group_id)
+
+    groups = {}
+    random_history(rng, 40, add, remove, groups, itertools.count())
+    queries = ["", "ju", "january 1855", "l", "scutari right", "2024-03", "1854 2024-1", "2024-02-1 jul", "nothing"]
+    for query in queries:
+        results = index.search(query)
+        if not query:
+            assert results is None
+            continue
+
+        def matches(group):
+            for term in query.split():
+                if "-" in term or ":" in term:
+                    if not group["timestamp"].startswith(term):
+                        return False
+                elif not all(any(word.startswith(prefix) for word in index.split_words(group["name"]))
+                             for prefix in index.split_words(term)):
+                    return False
+            return True
+
+        newest_first = sorted(order, key=lambda group_id: (groups[group_id]["timestamp"], order.index(group_id)))[::-1]
+        expected = [group_id for group_id in newest_first if matches(groups[group_id])]
+        assert len(results) == len(expected)
+        assert results.page(0, 7) + results.page(7, 1000) == expected
+        assert results.page(3, 5) == expected[3:8]